@@ -0,0 +1,680 @@
+# Lớp thu thập dữ liệu không dùng Tkinter / matplotlib / pandas. Module cần NumPy (bộ đệm mẫu, bộ lọc, các hàm
+# xử lý; import mất cỡ 0.1 s); scipy chỉ cần khi chọn bộ lọc Butterworth.
+# main1.py gọi vào đây; script trên server cũng có thể import trực tiếp:
+#
+#   import serial, acquisition
+#   ser = serial.Serial("COM5", 115200, timeout=1)
+#   ser.write(acquisition.dpv_command(-200, 600, 5, 50, 50).encode())
+#   lines = acquisition.read_pulse(ser, acquisition.dpv_num_samples(-200, 600, 5))
+#   V, I, I_filtered = acquisition.dpv_data_process(lines)
+import binascii
+import math
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+import buffers
+import filters
+
+END_MARKER = "END"
+
+# Không nhận được dòng nào trong khoảng này (giây) thì coi như thiết bị đã dừng gửi
+READ_IDLE_TIMEOUT = 5.0
+# Số byte tối đa lấy từ bộ đệm serial mỗi lần đọc
+READ_CHUNK_SIZE = 65536
+
+# Giá trị thay thế khi thiết bị trả về "inf"
+EIS_3E_INF_VALUE = 600_000_000
+EIS_2E_INF_MAGNITUDE = 60000000.0
+CA_CURRENT_LIMIT = 5234
+# CA: số điểm dự kiến vượt ngưỡng này thì tự chuyển sang chế độ đo dài (ghi ra file)
+CA_LONG_RUN_POINTS = 200_000
+CV_CURRENT_SCALE = -25000
+
+
+# ==== KHUNG NHỊ PHÂN ====
+# Khung: magic(2) | kỹ thuật(1) | kiểu dữ liệu(1) | số trường/mẫu(1) | seq(2) | số mẫu(2) | payload | crc16(2)
+# Mã kỹ thuật trùng mã lệnh: 1 CV, 2 EIS 2E, 3 EIS 3E, 4 SWV, 5 CA, 7 DPV.
+# Payload là float32 ('f') hoặc int32 ('i') little-endian, mỗi mẫu tương ứng một dòng "a;b;c".
+# Giải mã khung chỉ dùng struct, nhưng module vẫn import NumPy cho phần còn lại.
+# Không cần bắt tay: FrameDecoder nhận ra khung theo FRAME_MAGIC, phần còn lại đọc như văn bản.
+FRAME_MAGIC = b"\xAA\x55"
+FRAME_HEADER = struct.Struct("<2sBBBHH")
+FRAME_CRC = struct.Struct("<H")
+FRAME_DTYPES = {0: "f", 1: "i"}
+FRAME_MAX_PAYLOAD = 16384
+
+
+# ==== LỆNH GỬI XUỐNG THIẾT BỊ: N#start?end/step|x$y! ====
+def format_command(code, start, end, step, x, y):
+    return f"{code}#{start}?{end}/{step}|{x}${y}!"
+
+
+def cv_num_step(s_vol, e_vol, step):
+    return ((e_vol - s_vol) // step + 1) * 2
+
+
+def cv_command(s_vol, e_vol, step, repeat_times):
+    num_step = cv_num_step(s_vol, e_vol, step)
+    return format_command(1, -e_vol, -s_vol, num_step, repeat_times, 0)
+
+
+def eis_command(start_freq, stop_freq, points, repeats, electrodes=3, log=False):
+    # EIS 3 điện cực dùng mã 3, 2 điện cực dùng mã 2 (cờ log ở trường cuối)
+    if electrodes == 2:
+        return format_command(2, start_freq, stop_freq, points, repeats, '1' if log else '0')
+    return format_command(3, start_freq, stop_freq, points, repeats, 0)
+
+
+def swv_device_range(s_vol, e_vol):
+    # Thiết bị nhận điện thế đầu bị đảo dấu, giữ nguyên khoảng quét
+    dev_s_vol = -s_vol
+    dev_e_vol = (e_vol - s_vol) + dev_s_vol
+    return dev_s_vol, dev_e_vol
+
+
+def swv_num_samples(s_vol, e_vol, step):
+    return ((e_vol - s_vol) // step) * 2
+
+
+def swv_command(s_vol, e_vol, step, amp, freq):
+    dev_s_vol, dev_e_vol = swv_device_range(s_vol, e_vol)
+    return format_command(4, dev_s_vol, dev_e_vol, step, amp * 2, freq)
+
+
+def ca_max_points(t_run, t_int):
+    return int(t_run * 1000 / t_int)
+
+
+def ca_command(e_vol, t_run, t_int):
+    return format_command(5, t_run, e_vol, t_int, t_int, 0)
+
+
+def dpv_num_samples(s_vol, e_vol, step):
+    return ((e_vol - s_vol) // step) + 1
+
+
+def dpv_command(s_vol, e_vol, step, amp, width):
+    return format_command(7, s_vol, e_vol, step, amp, width)
+
+
+# ==== BẢN GHI: DÒNG VĂN BẢN HOẶC MẪU NHỊ PHÂN ====
+def record_fields(record):
+    # "a;b;c" -> ["a", "b", "c"]; mẫu nhị phân (a, b, c) giữ nguyên
+    if isinstance(record, str):
+        return record.strip().split(";")
+    return record
+
+
+def is_data_record(record):
+    return not isinstance(record, str) or ";" in record
+
+
+def is_inf(token):
+    if isinstance(token, str):
+        return token.lower() == "inf"
+    return math.isinf(token)
+
+
+# ==== PARSE HÀNG LOẠT ====
+# Cả lô bản ghi -> mảng (n, fields) float64 + mặt nạ valid, không có try/except cho từng dòng.
+# "inf" được giữ là np.inf (dùng np.isfinite để lọc); token hỏng thành NaN, dòng sai số trường
+# toàn NaN; cả hai trường hợp đều có valid = False.
+def as_records(data):
+    # Khối byte thô -> list dòng (như LineFramer); list dòng / mẫu nhị phân giữ nguyên
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return LineFramer().feed(bytes(data) + b"\n")
+    return data if isinstance(data, list) else list(data)
+
+
+def _to_float(tokens):
+    try:
+        return np.fromiter(map(float, tokens), np.float64, len(tokens))
+    except ValueError:
+        pass
+    # Có token hỏng: chỉ lúc này mới đổi từng token, token hỏng -> NaN
+    values = np.empty(len(tokens))
+    for i, token in enumerate(tokens):
+        try:
+            values[i] = float(token)
+        except ValueError:
+            values[i] = np.nan
+    return values
+
+
+def parse_lines(lines, fields):
+    n = len(lines)
+    values = np.full((n, fields), np.nan)
+    if n == 0:
+        return values, np.zeros(0, dtype=bool)
+    text = "\n".join(lines)
+    # Số dấu ";" của từng dòng, tính trên mảng byte thay vì split từng dòng
+    raw = np.frombuffer(text.encode(), dtype=np.uint8)
+    line_ends = np.append(np.flatnonzero(raw == 10), len(raw))
+    separators = np.diff(np.searchsorted(np.flatnonzero(raw == 59), line_ends), prepend=0)
+    tokens = _to_float(text.replace("\n", ";").split(";"))
+    shaped = separators == fields - 1
+    if shaped.all():
+        values = tokens.reshape(n, fields)
+    else:
+        values[shaped] = tokens[np.repeat(shaped, separators + 1)].reshape(-1, fields)
+    return values, shaped & ~np.isnan(values).any(axis=1)
+
+
+def parse_records(records, fields):
+    # records: list dòng "a;b;...", list mẫu nhị phân (tuple) hoặc khối byte thô
+    records = as_records(records)
+    text = [isinstance(record, str) for record in records]
+    if all(text):
+        return parse_lines(records, fields)
+    values = np.full((len(records), fields), np.nan)
+    text = np.array(text)
+    if text.any():
+        index = np.flatnonzero(text)
+        values[index] = parse_lines([records[i] for i in index], fields)[0]
+    for i in np.flatnonzero(~text):
+        if len(records[i]) == fields:
+            values[i] = records[i]
+    return values, ~np.isnan(values).any(axis=1)
+
+
+# ==== XỬ LÝ DỮ LIỆU ====
+class DPVStream:
+    # Xử lý DPV tăng dần: mỗi lần feed chỉ parse và lọc (causal) các dòng mới.
+    # bufferV / bufferI / bufferIfilter là view NumPy của bộ đệm cột.
+    def __init__(self):
+        self.samples = buffers.SampleBuffer(("voltage", "current"))
+        self.filter = filters.technique_filter("dpv")
+        self.smoother = self.filter.stream()
+
+    @property
+    def bufferV(self):
+        return self.samples["voltage"]
+
+    @property
+    def bufferI(self):
+        return self.samples["current"]
+
+    @property
+    def bufferIfilter(self):
+        return self.smoother.output
+
+    def __len__(self):
+        return len(self.samples)
+
+    def feed(self, lines):
+        # Bỏ dòng hỏng và dòng "inf" (inf làm hỏng giới hạn trục và lan sang các điểm đã làm mượt)
+        values, valid = parse_records(lines, 2)
+        values = values[valid & np.isfinite(values).all(axis=1)]
+        self.samples.extend(values[:, 0], values[:, 1])
+        self.smoother.extend(values[:, 1])
+
+    def finish(self):
+        # Hết phép đo: bộ lọc zero_phase được tính lại trên cả khối thay cho kết quả causal
+        if self.filter.zero_phase:
+            self.smoother.buffer.clear()
+            self.smoother.buffer.extend(self.filter.apply(self.bufferI))
+
+    def load(self, voltages, currents, filtered=None):
+        # Thay toàn bộ dữ liệu (nhập từ file); thiếu cột lọc (hoặc có ô trống) thì tự lọc
+        self.clear()
+        self.samples.extend(voltages, currents)
+        if filtered is not None and len(filtered) == len(currents) and not np.isnan(filtered).any():
+            self.smoother.buffer.extend(filtered)
+        else:
+            self.smoother.buffer.extend(self.filter.apply(currents))
+
+    def clear(self):
+        self.samples.clear()
+        self.smoother.reset()
+
+
+class SWVStream:
+    # Xử lý SWV tăng dần; mỗi điểm điện thế gồm 2 dòng: dòng thuận (If) và dòng nghịch (Ib)
+    # bufferVSW / bufferCnet / bufferCf / bufferCb / bufffil là view NumPy của bộ đệm cột.
+    def __init__(self, s_vol=0, step=0):
+        self.s_vol = s_vol
+        self.step = step
+        self.pairs = 0
+        self.pending = None
+        self.samples = buffers.SampleBuffer(("voltage", "net", "forward", "backward"))
+        self.filter = filters.technique_filter("swv")
+        self.smoother = self.filter.stream()
+
+    @property
+    def bufferVSW(self):
+        return self.samples["voltage"]
+
+    @property
+    def bufferCnet(self):
+        return self.samples["net"]
+
+    @property
+    def bufferCf(self):
+        return self.samples["forward"]
+
+    @property
+    def bufferCb(self):
+        return self.samples["backward"]
+
+    @property
+    def bufffil(self):
+        return self.smoother.output
+
+    def __len__(self):
+        return len(self.samples)
+
+    def feed(self, lines):
+        lines = as_records(lines)
+        if self.pending is not None:
+            lines = [self.pending] + lines
+            self.pending = None
+        if len(lines) % 2:
+            self.pending = lines[-1]
+            lines = lines[:-1]
+        if not lines:
+            return
+        values, valid = parse_records(lines, 2)
+        currents = values[:, 1]
+        ok = valid & np.isfinite(currents)
+        # Điện thế tính theo số thứ tự cặp nên cặp bị bỏ không làm lệch các điểm sau
+        keep = ok[0::2] & ok[1::2]
+        index = self.pairs + np.flatnonzero(keep)
+        self.pairs += len(keep)
+        forward = currents[0::2][keep]
+        backward = currents[1::2][keep]
+        net = forward - backward
+        self.samples.extend(self.s_vol + index * self.step, net, forward, backward)
+        self.smoother.extend(net)
+
+    def finish(self):
+        if self.filter.zero_phase:
+            self.smoother.buffer.clear()
+            self.smoother.buffer.extend(self.filter.apply(self.bufferCnet))
+
+    def load(self, voltages, net, forward, backward, filtered):
+        # Thay toàn bộ dữ liệu (nhập từ file)
+        self.clear()
+        self.samples.extend(voltages, net, forward, backward)
+        self.smoother.buffer.extend(filtered)
+
+    def clear(self):
+        self.pairs = 0
+        self.pending = None
+        self.samples.clear()
+        self.smoother.reset()
+
+
+def dpv_data_process(serial_lines):
+    stream = DPVStream()
+    stream.feed(serial_lines)
+    stream.finish()
+    return stream.bufferV, stream.bufferI, stream.bufferIfilter
+
+
+def sw_data_process(serial_lines, s_vol, step):
+    stream = SWVStream(s_vol, step)
+    stream.feed(serial_lines)
+    stream.finish()
+    return stream.bufferVSW, stream.bufferCnet, stream.bufferCf, stream.bufferCb, stream.bufffil
+
+
+def cv_voltages(count, s_vol, step, num_step):
+    # Bậc thang điện thế theo vị trí mẫu: nửa đầu mỗi chu kỳ tăng từ s_vol, nửa sau lặp lại đỉnh rồi giảm dần
+    position = np.arange(count) % num_step
+    return s_vol + step * np.where(position < num_step // 2, position, num_step - 1 - position)
+
+
+def process_cv_data(buffer_serial, s_vol, e_vol, step, repeat_times):
+    # Trả về (voltage, current_raw, current_filtered), hoặc None nếu chưa đủ dữ liệu
+    num_step = cv_num_step(s_vol, e_vol, step)
+    count = len(buffer_serial)
+    if count < num_step * repeat_times:
+        return None
+    values, valid = parse_records(buffer_serial, 2)
+    current = values[:, 1]
+    keep = valid & np.isfinite(current)
+    if count >= 5:
+        current[:4] = current[4]
+        keep[:4] = keep[4]
+    # Thiết bị gửi mỗi nửa chu kỳ theo thứ tự ngược: đảo lại cả khối (2 * repeat_times, num_step // 2)
+    half = num_step // 2
+    order = np.arange(count)
+    if half:
+        segments = order[:num_step * repeat_times].reshape(-1, half)
+        order[:segments.size] = segments[:, ::-1].ravel()
+    current = current[order]
+    keep = keep[order]
+    # Điện thế tính theo vị trí gốc nên bỏ dòng "inf" / dòng hỏng không làm lệch các điểm sau
+    voltage = cv_voltages(count, s_vol, step, num_step)[keep]
+    current = current[keep] * CV_CURRENT_SCALE
+    return voltage, current, filters.technique_filter("cv").apply(current)
+
+
+def parse_eis_line(line):
+    # EIS 3E: "freq;re;im" -> (freq, re, im, |Z|, phase)
+    parts = record_fields(line)
+    if len(parts) != 3:
+        return None
+    try:
+        freq = float(parts[0])
+        if is_inf(parts[1]) or is_inf(parts[2]):
+            return freq, EIS_3E_INF_VALUE, 0, EIS_3E_INF_VALUE, 0
+        rz_real = float(parts[1])
+        rz_imag = float(parts[2])
+    except ValueError:
+        return None
+    magnitude = math.sqrt(rz_real**2 + rz_imag**2)
+    phase = math.degrees(math.atan2(-rz_imag, rz_real))
+    return freq, rz_real, rz_imag, magnitude, phase
+
+
+def handle_serial_data(line):
+    # EIS 2E: "freq;|Z|;phase" -> (freq, |Z|, phase, re, im), làm tròn 3 chữ số
+    parts = record_fields(line)
+    if len(parts) < 2:
+        return None
+    try:
+        freq = float(parts[0])
+        if is_inf(parts[1]):
+            mag = EIS_2E_INF_MAGNITUDE
+            phase = 0.0
+        else:
+            mag = float(parts[1])
+            phase = float(parts[2]) if len(parts) > 2 else 0.0
+    except ValueError:
+        return None
+    phase_rad = math.radians(phase)
+    real = mag * math.cos(phase_rad)
+    imag = -mag * math.sin(phase_rad)
+    return round(freq, 3), round(mag, 3), round(phase, 3), round(real, 3), round(imag, 3)
+
+
+def parse_ca_line(line):
+    # CA: "t;i" -> (t, i), "inf" được coi là 0, dòng bị giới hạn ở CA_CURRENT_LIMIT
+    try:
+        t_str, i_str = record_fields(line)
+        t = float(t_str)
+        i = 0 if is_inf(i_str) else float(i_str)
+    except ValueError:
+        return None
+    return t, min(i, CA_CURRENT_LIMIT)
+
+
+def is_cv_line(line):
+    if not isinstance(line, str):
+        return True
+    return bool(line) and line[0].isdigit()
+
+
+# ==== ĐỌC SERIAL THEO KHỐI ====
+class LineFramer:
+    # Ghép các khối byte nhận được thành dòng hoàn chỉnh, phần dòng dở dang giữ lại cho lần sau
+    def __init__(self, max_pending=READ_CHUNK_SIZE):
+        self._pending = bytearray()
+        self.max_pending = max_pending
+
+    def feed(self, data):
+        self._pending += data
+        cut = self._pending.rfind(b"\n")
+        if cut < 0:
+            # Không thấy xuống dòng trong quá nhiều byte: rác, bỏ đi
+            if len(self._pending) > self.max_pending:
+                self._pending.clear()
+            return []
+        block = self._pending[:cut].decode(errors='ignore')
+        del self._pending[:cut + 1]
+        return [line.strip() for line in block.split("\n") if line.strip()]
+
+    def reset(self):
+        self._pending.clear()
+
+
+def encode_frame(technique, samples, seq=0, dtype="f"):
+    # Đóng gói danh sách mẫu (mỗi mẫu cùng số trường) thành một khung; dùng cho firmware giả lập
+    fields = len(samples[0]) if samples else 0
+    dtype_code = {v: k for k, v in FRAME_DTYPES.items()}[dtype]
+    values = [v for sample in samples for v in sample]
+    header = FRAME_HEADER.pack(FRAME_MAGIC, technique, dtype_code, fields, seq & 0xFFFF, len(samples))
+    body = header + struct.pack(f"<{len(values)}{dtype}", *values)
+    return body + FRAME_CRC.pack(binascii.crc_hqx(body, 0xFFFF))
+
+
+class FrameDecoder:
+    # Tách luồng byte hỗn hợp: khung nhị phân được giải mã hàng loạt thành tuple,
+    # phần còn lại (văn bản, ví dụ "END") đi qua LineFramer như cũ.
+    # Văn bản ASCII không bao giờ chứa FRAME_MAGIC nên firmware chỉ gửi văn bản vẫn chạy bình thường.
+    def __init__(self):
+        self.framer = LineFramer()
+        self._pending = bytearray()
+        self.technique = None
+        self.last_seq = None
+        self.frames = 0
+        self.lost_frames = 0
+        self.bad_frames = 0
+
+    def feed(self, data):
+        if not self._pending and FRAME_MAGIC not in data and not data.endswith(FRAME_MAGIC[:1]):
+            return self.framer.feed(data)
+        self._pending += data
+        records = []
+        while self._pending:
+            start = self._pending.find(FRAME_MAGIC)
+            if start < 0:
+                # Giữ lại 1 byte cuối phòng khi magic bị cắt giữa hai khối
+                keep = 1 if self._pending[-1:] == FRAME_MAGIC[:1] else 0
+                records.extend(self.framer.feed(bytes(self._pending[:len(self._pending) - keep])))
+                del self._pending[:len(self._pending) - keep]
+                break
+            if start:
+                records.extend(self.framer.feed(bytes(self._pending[:start])))
+                del self._pending[:start]
+            if len(self._pending) < FRAME_HEADER.size:
+                break
+            _, technique, dtype_code, fields, seq, count = FRAME_HEADER.unpack_from(self._pending)
+            dtype = FRAME_DTYPES.get(dtype_code)
+            payload_size = count * fields * 4
+            if dtype is None or fields == 0 or payload_size > FRAME_MAX_PAYLOAD:
+                self._resync()
+                continue
+            frame_size = FRAME_HEADER.size + payload_size + FRAME_CRC.size
+            if len(self._pending) < frame_size:
+                break
+            body = bytes(self._pending[:frame_size - FRAME_CRC.size])
+            (crc,) = FRAME_CRC.unpack_from(self._pending, frame_size - FRAME_CRC.size)
+            if binascii.crc_hqx(body, 0xFFFF) != crc:
+                self._resync()
+                continue
+            values = struct.unpack_from(f"<{count * fields}{dtype}", body, FRAME_HEADER.size)
+            records.extend(zip(*[iter(values)] * fields))
+            del self._pending[:frame_size]
+            self._count_frame(technique, seq)
+        return records
+
+    def _resync(self):
+        # Khung hỏng: bỏ tới magic kế tiếp (hoặc hết dòng hiện tại), không đưa byte rác cho LineFramer
+        self.bad_frames += 1
+        nxt = self._pending.find(FRAME_MAGIC, 1)
+        if nxt < 0:
+            nxt = self._pending.find(b"\n", 1) + 1 or len(self._pending)
+        del self._pending[:nxt]
+
+    def _count_frame(self, technique, seq):
+        if self.last_seq is not None:
+            self.lost_frames += (seq - self.last_seq - 1) & 0xFFFF
+        self.technique = technique
+        self.last_seq = seq
+        self.frames += 1
+
+
+class ChunkedLineReader:
+    # Đọc hết những gì đang có trong in_waiting một lần thay vì readline() cho từng mẫu.
+    # read_lines() chặn tối đa ser.timeout khi chưa có dữ liệu; trả về dòng văn bản
+    # hoặc tuple nếu thiết bị gửi khung nhị phân.
+    def __init__(self, ser, chunk_size=READ_CHUNK_SIZE):
+        self.ser = ser
+        self.chunk_size = chunk_size
+        self.framer = FrameDecoder()
+
+    def read_lines(self):
+        data = self.ser.read(max(1, min(self.ser.in_waiting, self.chunk_size)))
+        if not data:
+            return []
+        waiting = self.ser.in_waiting
+        if waiting:
+            data += self.ser.read(min(waiting, self.chunk_size))
+        return self.framer.feed(data)
+
+
+# ==== ĐỌC SERIAL THEO TỪNG KỸ THUẬT ====
+# stop: hàm không tham số, trả về True để dừng vòng đọc sớm
+def read_line(ser):
+    return ser.readline().decode(errors='ignore').strip()
+
+
+def _never():
+    return False
+
+
+def iter_lines(ser, stop=_never):
+    # Sinh từng dòng; sinh "" mỗi lần hết timeout mà không có dữ liệu
+    reader = ChunkedLineReader(ser)
+    while not stop():
+        lines = reader.read_lines()
+        if not lines:
+            yield ""
+            continue
+        yield from lines
+
+
+def read_pulse(ser, num_samples, stop=_never):
+    # Đọc một lần quét DPV hoặc SWV (cùng định dạng bản ghi)
+    serial_lines = []
+    for line in iter_lines(ser, stop):
+        if line == END_MARKER:
+            break
+        if is_data_record(line):
+            serial_lines.append(line)
+        # ESP có thể không gửi END, đủ số mẫu thì dừng
+        if len(serial_lines) >= num_samples:
+            break
+    return serial_lines
+
+
+def read_cv(ser, expected_samples, stop=_never):
+    buffer_serial = []
+    for line in iter_lines(ser, stop):
+        if is_cv_line(line):
+            buffer_serial.append(line)
+        if len(buffer_serial) >= expected_samples:
+            break
+    return buffer_serial
+
+
+def read_eis(ser, expected_points, on_sample, electrodes=3, stop=_never):
+    parse = handle_serial_data if electrodes == 2 else parse_eis_line
+    count = 0
+    if expected_points <= 0:
+        return count
+    for line in iter_lines(ser, stop):
+        if not is_data_record(line):
+            continue
+        sample = parse(line)
+        if sample is not None:
+            on_sample(sample)
+            count += 1
+            if count >= expected_points:
+                break
+    return count
+
+
+def read_ca(ser, max_points, on_sample, stop=_never):
+    count = 0
+    if max_points <= 0:
+        return count
+    for line in iter_lines(ser, stop):
+        if not is_data_record(line):
+            continue
+        sample = parse_ca_line(line)
+        if sample is not None:
+            on_sample(sample)
+            count += 1
+            if count >= max_points:
+                break
+    return count
+
+
+# ==== LUỒNG ĐỌC NỀN ====
+class SerialReader(threading.Thread):
+    # Đọc serial trên luồng riêng, đẩy các dòng hợp lệ vào out_queue theo từng lô (list).
+    # Khi kết thúc (END, đủ max_lines, stop(), quá idle_timeout hoặc lỗi) đẩy None vào hàng đợi.
+    def __init__(self, ser, out_queue, accept=None, max_lines=None,
+                 idle_timeout=READ_IDLE_TIMEOUT, end_marker=END_MARKER):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.out_queue = out_queue
+        self.accept = accept or is_data_record
+        self.max_lines = max_lines
+        self.idle_timeout = idle_timeout
+        self.end_marker = end_marker
+        self.count = 0
+        self.timed_out = False
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        reader = ChunkedLineReader(self.ser)
+        last_data = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                lines = reader.read_lines()
+                if not lines:
+                    if self.idle_timeout is not None and time.monotonic() - last_data > self.idle_timeout:
+                        self.timed_out = True
+                        break
+                    continue
+                last_data = time.monotonic()
+                if self._put_batch(lines):
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            self.out_queue.put(None)
+
+    def _put_batch(self, lines):
+        # Trả về True nếu lô này kết thúc phép đo
+        batch = []
+        done = False
+        for line in lines:
+            if line == self.end_marker:
+                done = True
+                break
+            if not self.accept(line):
+                continue
+            batch.append(line)
+            if self.max_lines is not None and self.count + len(batch) >= self.max_lines:
+                done = True
+                break
+        if batch:
+            self.count += len(batch)
+            self.out_queue.put(batch)
+        return done
+
+
+def drain_queue(q):
+    # Lấy hết các lô đang có trong hàng đợi mà không chặn: (items, finished)
+    items = []
+    while True:
+        try:
+            batch = q.get_nowait()
+        except queue.Empty:
+            return items, False
+        if batch is None:
+            return items, True
+        items.extend(batch)
@@ -0,0 +1,507 @@
+# Đo hiệu năng từng khâu xử lý: tách khung serial, parser, làm mượt và vẽ đồ thị.
+# Dữ liệu lấy từ thiết bị giả lập (simulator.py), kết quả ghi ra JSON để so sánh giữa các lần sửa code.
+#
+#   python benchmark.py                                 # 1k, 10k, 100k, 1M mẫu -> benchmark_results.json
+#   python benchmark.py --sizes 1000 10000 --stages dpv_data_process smooth3
+#   python benchmark.py --baseline old.json --tolerance 0.2   # exit 1 nếu khâu nào chậm đi quá 20%
+import argparse
+import csv
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import acquisition
+import buffers
+import circuits
+import cycles
+import filters
+import importer
+import kk
+import peaks
+import render
+import session
+import simulator
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+FRAMING_CHUNK = 4096
+BINARY_FRAME_SAMPLES = 64
+# Số mẫu mỗi lần cập nhật khi đo các bộ lọc luồng
+STREAM_CHUNK = 64
+# Số điểm mỗi quét khi đo khâu tìm đỉnh hàng loạt
+PEAK_SCAN = 160
+# Số điểm mỗi phổ trong khâu khớp hàng loạt
+FIT_SWEEP = 100
+
+
+# ==== DỮ LIỆU MẪU ====
+def make_device(inf_rate):
+    return simulator.SimulatedPotentiostat(sample_rate=0, inf_rate=inf_rate, seed=0)
+
+
+def dpv_lines(device, n):
+    return simulator.format_lines(device.generate(acquisition.dpv_command(0, n - 1, 1, 50, 50)))
+
+
+def swv_params(n):
+    # (s_vol, e_vol, step) sao cho thiết bị gửi ~n dòng
+    return 0, max(n // 2, 1), 1
+
+
+def swv_lines(device, n):
+    s_vol, e_vol, step = swv_params(n)
+    return simulator.format_lines(device.generate(acquisition.swv_command(s_vol, e_vol, step, 25, 10)))
+
+
+def cv_params(n):
+    # (s_vol, e_vol, step, repeat_times): tối đa 2000 điểm mỗi chu kỳ, lặp cho đủ n mẫu
+    half = max(min(n // 2, 1000), 2)
+    return 0, half - 1, 1, max(n // (half * 2), 1)
+
+
+def cv_lines(device, n):
+    s_vol, e_vol, step, repeat_times = cv_params(n)
+    return simulator.format_lines(device.generate(acquisition.cv_command(s_vol, e_vol, step, repeat_times)))
+
+
+def eis_lines(device, n, electrodes):
+    command = acquisition.eis_command(1, 100000, n, 1, electrodes=electrodes, log=electrodes == 2)
+    return simulator.format_lines(device.generate(command))
+
+
+def ca_lines(device, n):
+    return simulator.format_lines(device.generate(acquisition.ca_command(200, n, 1000)))
+
+
+def filter_signal(n):
+    # Sóng sin + nhiễu giả ngẫu nhiên (xác định) + vài gai để so sánh các bộ lọc
+    return [math.sin(i / 50) + 0.1 * ((i * 7919) % 13 - 6) / 6 + (5.0 if i % 997 == 500 else 0.0)
+            for i in range(n)]
+
+
+# ==== ĐO THỜI GIAN ====
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo = math.floor(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(stage, samples, unit, latencies, total, runs):
+    latencies = sorted(latencies)
+    return {
+        "stage": stage,
+        "samples": samples,
+        "unit": unit,
+        "runs": runs,
+        "total_s": total,
+        "samples_per_s": samples * runs / total if total > 0 else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p90": percentile(latencies, 0.90) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": latencies[-1] * 1000 if latencies else 0.0,
+        },
+    }
+
+
+def time_batch(stage, samples, run, repeats, budget):
+    # Một lần gọi xử lý toàn bộ n mẫu; latency = thời gian mỗi lần gọi
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < repeats:
+        t0 = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - t0)
+        if time.perf_counter() - start > budget:
+            break
+    return summarize(stage, samples, "call", latencies, sum(latencies), len(latencies))
+
+
+def time_live(stage, samples, draw, repeats, budget):
+    # Khung hình khi đang đo: sau một lần vẽ toàn bộ, các lần sau chỉ blit các đường
+    draw()
+    return time_batch(stage, samples, lambda: draw(live=True), repeats, budget)
+
+
+def time_each(stage, samples, unit, func, items):
+    # Gọi func cho từng phần tử (dòng / chunk); latency = thời gian mỗi lần gọi
+    latencies = []
+    clock = time.perf_counter
+    for item in items:
+        t0 = clock()
+        func(item)
+        latencies.append(clock() - t0)
+    return summarize(stage, samples, unit, latencies, sum(latencies), 1)
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+# ==== ỨNG DỤNG GIẢ (không cần Tk) CHO CÁC KHÂU VẼ ====
+def _figure():
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=(8, 6), dpi=100)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def headless_app(cls, **attrs):
+    app = object.__new__(cls)
+    app.__dict__.update(attrs)
+    return app
+
+
+def plot_dpv(main1, lines):
+    fig = _figure()
+    ax = fig.add_subplot(111)
+    app = headless_app(main1.DPVApp, fig=fig, ax=ax, canvas=fig.canvas)
+    app.create_plot_lines()
+    app.dpv_data_process(lines)
+    return app
+
+
+def plot_swv(main1, lines, n):
+    fig = _figure()
+    ax = fig.add_subplot(111)
+    app = headless_app(main1.SWVApp, fig=fig, ax=ax, canvas=fig.canvas)
+    app.create_plot_lines()
+    s_vol, e_vol, step = swv_params(n)
+    app.sw_data_process(lines, acquisition.swv_device_range(s_vol, e_vol)[0], step)
+    return app
+
+
+def plot_cv(main1, lines, n):
+    fig = _figure()
+    ax = fig.add_subplot(111)
+    line, = ax.plot([], [])
+    s_vol, e_vol, step, repeat_times = cv_params(n)
+    app = headless_app(main1.CVApp, fig=fig, ax=ax, canvas=fig.canvas, line=line, trace=render.DecimatedLine(line),
+                       samples=buffers.SampleBuffer(("voltage", "current_raw", "current_filtered")),
+                       start_voltage=s_vol, end_voltage=e_vol)
+    app.samples.extend(*acquisition.process_cv_data(lines, s_vol, e_vol, step, repeat_times))
+    return app.update_plot
+
+
+def plot_eis_3e(main1, lines):
+    fig_bode = _figure()
+    ax_bode = fig_bode.add_subplot(111)
+    fig_nyquist = _figure()
+    app = headless_app(main1.EISApp, ax_bode=ax_bode, ax_phase=ax_bode.twinx(),
+                       ax_nyquist=fig_nyquist.add_subplot(111),
+                       canvas_bode=fig_bode.canvas, canvas_nyquist=fig_nyquist.canvas,
+                       samples=buffers.SampleBuffer(("freq", "real", "imag", "magnitude", "phase")),
+                       session=None, fitter=None, fitted_sweeps=0, sweep_points=0,
+                       mag_smoother=filters.technique_filter("eis_3e_bode").stream(),
+                       phase_smoother=filters.technique_filter("eis_3e_bode").stream(),
+                       real_nyquist=filters.technique_filter("eis_3e_nyquist").incremental(),
+                       imag_nyquist=filters.technique_filter("eis_3e_nyquist").incremental())
+    app.create_plot_lines()
+    app.add_samples([s for s in map(acquisition.parse_eis_line, lines) if s is not None])
+    return app
+
+
+def plot_ca(main1, lines, long_run=False):
+    fig = _figure()
+    ax = fig.add_subplot(111)
+    line_plot, = ax.plot([], [])
+    line_recent, = ax.plot([], [])
+    app = headless_app(main1.ChronoAmperometryApp, fig=fig, ax=ax, canvas=fig.canvas,
+                       line_plot=line_plot, line_recent=line_recent,
+                       trace_plot=render.DecimatedLine(line_plot, method="minmax", monotonic=True),
+                       trace_recent=render.DecimatedLine(line_recent, method="minmax", monotonic=True),
+                       samples=buffers.SampleBuffer(("time", "current")), long_run=None)
+    store = app.samples
+    if long_run:
+        store = app.long_run = buffers.LongRunBuffer(("time", "current"))
+    for line in lines:
+        parsed = acquisition.parse_ca_line(line)
+        if parsed is not None:
+            store.append(*parsed)
+    return app
+
+
+def eis_2e_app(main1, lines):
+    fig_bode = _figure()
+    ax_bode = fig_bode.add_subplot(111)
+    fig_nyquist = _figure()
+    app = headless_app(main1.EIS2EApp,
+                       fig_bode=fig_bode, ax_bode=ax_bode, ax_phase=ax_bode.twinx(),
+                       fig_nyquist=fig_nyquist, ax_nyquist=fig_nyquist.add_subplot(111),
+                       canvas_bode=fig_bode.canvas, canvas_nyquist=fig_nyquist.canvas,
+                       samples=buffers.SampleBuffer(("freq", "magnitude", "phase", "real", "imag")),
+                       session=None, fitter=None, fitted_sweeps=0, sweep_points=0,
+                       real_smoother=filters.technique_filter("eis_2e_nyquist").stream(),
+                       imag_smoother=filters.technique_filter("eis_2e_nyquist").stream(),
+                       bode_filter=filters.technique_filter("eis_2e_bode"))
+    app.create_plot_lines()
+    app.add_samples([s for s in map(acquisition.handle_serial_data, lines) if s is not None])
+    return app
+
+
+# ==== CÁC KHÂU ====
+def run_stage(stage, n, device, args):
+    repeats, budget = args.repeats, args.budget
+
+    if stage == "framing_text":
+        data = ("\r\n".join(dpv_lines(device, n)) + "\r\n").encode()
+        decoder = acquisition.FrameDecoder()
+        return time_each(stage, n, "chunk", decoder.feed, chunks(data, FRAMING_CHUNK))
+    if stage == "framing_binary":
+        samples = [tuple(math.inf if v is None else v for v in s)
+                   for s in device.generate(acquisition.dpv_command(0, n - 1, 1, 50, 50))]
+        data = b"".join(acquisition.encode_frame(7, samples[i:i + BINARY_FRAME_SAMPLES], seq=i & 0xFFFF)
+                        for i in range(0, len(samples), BINARY_FRAME_SAMPLES))
+        decoder = acquisition.FrameDecoder()
+        return time_each(stage, n, "chunk", decoder.feed, chunks(data, FRAMING_CHUNK))
+    if stage == "handle_serial_data":
+        return time_each(stage, n, "line", acquisition.handle_serial_data, eis_lines(device, n, 2))
+    if stage == "parse_eis_line":
+        return time_each(stage, n, "line", acquisition.parse_eis_line, eis_lines(device, n, 3))
+    if stage == "parse_ca_line":
+        return time_each(stage, n, "line", acquisition.parse_ca_line, ca_lines(device, n))
+    if stage == "dpv_data_process":
+        lines = dpv_lines(device, n)
+        return time_batch(stage, n, lambda: acquisition.dpv_data_process(lines), repeats, budget)
+    if stage == "sw_data_process":
+        lines = swv_lines(device, n)
+        s_vol, e_vol, step = swv_params(n)
+        dev_s_vol = acquisition.swv_device_range(s_vol, e_vol)[0]
+        return time_batch(stage, len(lines), lambda: acquisition.sw_data_process(lines, dev_s_vol, step),
+                          repeats, budget)
+    if stage == "process_cv_data":
+        lines = cv_lines(device, n)
+        s_vol, e_vol, step, repeat_times = cv_params(n)
+        return time_batch(stage, len(lines),
+                          lambda: acquisition.process_cv_data(lines, s_vol, e_vol, step, repeat_times),
+                          repeats, budget)
+    if stage == "cv_cycles":
+        # Dựng chỉ số chu kỳ và bảng từng chu kỳ cho n mẫu CV nhiều chu kỳ
+        s_vol, e_vol, step, repeat_times = cv_params(n)
+        voltage, _, current = acquisition.process_cv_data(cv_lines(device, n), s_vol, e_vol, step, repeat_times)
+        return time_batch(stage, n, lambda: cycles.analyze(cycles.CycleIndex(voltage), voltage, current), repeats, budget)
+    if stage == "smooth3":
+        data = [float(i % 97) for i in range(n)]
+        return time_batch(stage, n, lambda: filters.technique_filter("cv").apply(data), repeats, budget)
+    if stage == "smooth3_stream":
+        data = [float(i % 97) for i in range(n)]
+        smoother = filters.technique_filter("cv").stream()
+        return time_each(stage, n, "chunk", smoother.extend, chunks(data, STREAM_CHUNK))
+    if stage == "smooth3_inplace":
+        data = [float(i % 97) for i in range(n)]
+        return time_batch(stage, n, lambda: filters.technique_filter("swv").apply(data), repeats, budget)
+    if stage in ("session_write", "session_open", "session_to_csv", "import_csv"):
+        # Ghi file phiên đo trong lúc đo theo từng chunk mẫu CA / mở lại file (memmap) / xuất CSV / nhập CSV
+        samples = [s for s in map(acquisition.parse_ca_line, ca_lines(device, n)) if s is not None]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "benchmark" + session.SESSION_EXT)
+            writer = session.SessionWriter(path, "ca", [["Time Run", n, "[s]"], ["E Voltage", 500, "[mV]"],
+                                                        ["Time Interval", 1, "[ms]"], [], []],
+                                           ("Time (s)", "Current (uA)"))
+            try:
+                result = time_each(stage, n, "chunk", writer.extend_rows, chunks(samples, STREAM_CHUNK))
+            finally:
+                writer.close()
+            if stage == "session_open":
+                result = time_batch(stage, n, lambda: session.SessionFile(path)["Current (uA)"].max(), repeats, budget)
+            elif stage == "session_to_csv":
+                csv_path = os.path.join(directory, "benchmark.csv")
+                result = time_batch(stage, n, lambda: session.SessionFile(path).to_csv(csv_path), repeats, budget)
+            elif stage == "import_csv":
+                csv_path = os.path.join(directory, "benchmark.csv")
+                session.SessionFile(path).to_csv(csv_path)
+                result = time_batch(stage, n, lambda: importer.CsvExport(csv_path).read(), repeats, budget)
+            return result
+    if stage in ("eis_fit", "eis_fit_warm"):
+        # Khớp mạch Randles cho một lần quét n điểm (mô phỏng); warm: bắt đầu từ kết quả lần quét trước
+        samples = [s for s in map(acquisition.parse_eis_line, eis_lines(make_device(0), n, 3)) if s is not None]
+        freqs, reals, imags = np.array([s[:3] for s in samples]).T
+        fitter = circuits.SweepFitter(circuits.make_circuit("randles"))
+        if stage == "eis_fit":
+            return time_batch(stage, n, lambda: (fitter.reset(), fitter.fit(freqs, reals + 1j * imags)), repeats, budget)
+        fitter.fit(freqs, reals + 1j * imags)
+        return time_batch(stage, n, lambda: fitter.fit(freqs, reals + 1j * imags), repeats, budget)
+    if stage == "eis_kk":
+        # Kiểm tra Lin-KK cho một lần quét n điểm (ma trận thiết kế đã có trong bộ nhớ đệm sau lần đầu)
+        samples = [s for s in map(acquisition.parse_eis_line, eis_lines(make_device(0), n, 3)) if s is not None]
+        freqs, reals, imags = np.array([s[:3] for s in samples]).T
+        return time_batch(stage, n, lambda: kk.check(freqs, reals + 1j * imags), repeats, budget)
+    if stage == "eis_batch_fit":
+        # Khớp hàng loạt: n mẫu = n // FIT_SWEEP file xuất EIS 3E (mô phỏng) cùng lưới tần số, nhiều tiến trình
+        samples = [s for s in map(acquisition.parse_eis_line, eis_lines(make_device(0), FIT_SWEEP, 3)) if s is not None]
+        freqs, reals, imags = np.array([s[:3] for s in samples]).T
+        rows = np.column_stack([freqs, np.hypot(reals, imags), np.degrees(np.arctan2(imags, reals)), reals, imags])
+        with tempfile.TemporaryDirectory() as directory:
+            for i in range(max(1, n // len(freqs))):
+                with open(os.path.join(directory, f"eis_{i:05d}.csv"), "w", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(['Frequency (Hz)', 'Magnitude (Ohm)', 'Phase (Degree)', 'Re(Z) (Ohm)', 'Im(Z) (Ohm)'])
+                    writer.writerows(rows.tolist())
+            return time_batch(stage, n, lambda: circuits.fit_directory(directory, "randles"), repeats, budget)
+    if stage in ("peaks_linear", "peaks_asls"):
+        # Tìm đỉnh hàng loạt: n mẫu = n // PEAK_SCAN quét DPV mô phỏng cùng số điểm, tính chung một ma trận
+        voltages, _, filtered = acquisition.dpv_data_process(dpv_lines(device, PEAK_SCAN))
+        scans = max(1, n // len(voltages))
+        x = np.tile(voltages, (scans, 1))
+        y = np.tile(filtered, (scans, 1))
+        method = stage[len("peaks_"):]
+        return time_batch(stage, n, lambda: peaks.find_peaks(x, y, method=method, polarity="auto"), repeats, budget)
+    if stage.startswith("filter_"):
+        # filter_<tên> lọc cả khối, filter_<tên>_stream lọc causal theo từng chunk,
+        # filter_<tên>_incremental cập nhật kết quả như cả khối theo từng chunk
+        name, mode = stage[len("filter_"):], "batch"
+        for suffix in ("_stream", "_incremental"):
+            if name.endswith(suffix):
+                name, mode = name[:-len(suffix)], suffix[1:]
+        filt = filters.make_filter(name)
+        data = filter_signal(n)
+        if mode == "stream":
+            return time_each(stage, n, "chunk", filt.stream().extend, chunks(data, STREAM_CHUNK))
+        if mode == "incremental":
+            return time_each(stage, n, "chunk", filt.incremental().extend, chunks(data, STREAM_CHUNK))
+        return time_batch(stage, n, lambda: filt.apply(data), repeats, budget)
+
+    import main1
+    if stage == "eis_2e_smooth":
+        app = eis_2e_app(main1, eis_lines(device, n, 2))
+        return time_batch(stage, n, lambda: (app.smooth_bode(), app.smooth_nyquist()), repeats, budget)
+    if stage == "dpv_draw_graph":
+        return time_batch(stage, n, plot_dpv(main1, dpv_lines(device, n)).draw_graph, repeats, budget)
+    if stage == "dpv_draw_graph_live":
+        return time_live(stage, n, plot_dpv(main1, dpv_lines(device, n)).draw_graph, repeats, budget)
+    if stage == "swv_draw_graph":
+        lines = swv_lines(device, n)
+        return time_batch(stage, len(lines), plot_swv(main1, lines, n).draw_graph, repeats, budget)
+    if stage == "swv_draw_graph_live":
+        lines = swv_lines(device, n)
+        return time_live(stage, len(lines), plot_swv(main1, lines, n).draw_graph, repeats, budget)
+    if stage == "cv_update_plot":
+        lines = cv_lines(device, n)
+        return time_batch(stage, len(lines), plot_cv(main1, lines, n), repeats, budget)
+    if stage == "eis_3e_update_plots":
+        return time_batch(stage, n, plot_eis_3e(main1, eis_lines(device, n, 3)).update_plots, repeats, budget)
+    if stage == "eis_3e_update_plots_live":
+        return time_live(stage, n, plot_eis_3e(main1, eis_lines(device, n, 3)).update_plots, repeats, budget)
+    if stage == "ca_update_plot":
+        return time_batch(stage, n, plot_ca(main1, ca_lines(device, n)).update_plot, repeats, budget)
+    if stage == "ca_update_plot_long_run":
+        return time_batch(stage, n, plot_ca(main1, ca_lines(device, n), long_run=True).update_plot, repeats, budget)
+    if stage == "eis_2e_update_plots":
+        return time_batch(stage, n, eis_2e_app(main1, eis_lines(device, n, 2)).update_plots, repeats, budget)
+    if stage == "eis_2e_update_plots_live":
+        return time_live(stage, n, eis_2e_app(main1, eis_lines(device, n, 2)).update_plots, repeats, budget)
+    raise ValueError(f"Không có khâu {stage}")
+
+
+FILTER_STAGES = [f"filter_{name}{mode}" for name in filters.FILTERS for mode in ("", "_stream")] + [
+    "filter_savgol_incremental",
+]
+
+PLOT_STAGES = [
+    "dpv_draw_graph",
+    "swv_draw_graph",
+    "cv_update_plot",
+    "eis_3e_update_plots",
+    "ca_update_plot",
+    "ca_update_plot_long_run",
+    "eis_2e_update_plots",
+    "dpv_draw_graph_live",
+    "swv_draw_graph_live",
+    "eis_3e_update_plots_live",
+    "eis_2e_update_plots_live",
+]
+
+STAGES = [
+    "framing_text",
+    "framing_binary",
+    "handle_serial_data",
+    "parse_eis_line",
+    "parse_ca_line",
+    "dpv_data_process",
+    "sw_data_process",
+    "process_cv_data",
+    "cv_cycles",
+    "smooth3",
+    "smooth3_stream",
+    "smooth3_inplace",
+    "eis_2e_smooth",
+    "session_write",
+    "session_open",
+    "session_to_csv",
+    "import_csv",
+    "peaks_linear",
+    "peaks_asls",
+    "eis_fit",
+    "eis_fit_warm",
+    "eis_batch_fit",
+    "eis_kk",
+] + FILTER_STAGES + PLOT_STAGES
+
+
+# ==== SO SÁNH VỚI LẦN CHẠY TRƯỚC ====
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["stage"], r["samples"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get((r["stage"], r["samples"]))
+        if old is None or not old.get("samples_per_s") or not r["samples_per_s"]:
+            continue
+        ratio = r["samples_per_s"] / old["samples_per_s"]
+        flag = "CHẬM HƠN" if ratio < 1 - tolerance else ""
+        print(f"{r['stage']:<22}{r['samples']:>9}  x{ratio:6.2f} {flag}")
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các khâu thu và xử lý dữ liệu")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--repeats", type=int, default=5, help="số lần gọi tối đa cho khâu xử lý cả khối")
+    parser.add_argument("--budget", type=float, default=2.0, help="thời gian tối đa (s) cho mỗi khâu/kích thước")
+    parser.add_argument("--inf-rate", type=float, default=0.005)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="file JSON của lần chạy trước để so sánh")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = []
+    for stage in args.stages:
+        for n in args.sizes:
+            # Các khâu vẽ dùng dữ liệu không có inf (giới hạn trục không nhận inf)
+            inf_rate = 0 if stage in PLOT_STAGES else args.inf_rate
+            result = run_stage(stage, n, make_device(inf_rate), args)
+            results.append(result)
+            lat = result["latency_ms"]
+            print(f"{stage:<22}{n:>9}  {result['samples_per_s']:>14,.0f} mẫu/s  "
+                  f"p50 {lat['p50']:.3f} ms  p99 {lat['p99']:.3f} ms", flush=True)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "sizes": args.sizes,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print("Đã ghi", args.output)
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# Bộ đệm mẫu dạng cột dùng chung cho mọi kỹ thuật đo.
+# Mỗi cột là một hàng của mảng NumPy cấp phát trước (float64, 8 byte/giá trị thay vì ~32 byte
+# của float trong list), tăng gấp đôi khi đầy. buffer["tên cột"] trả về view (không copy)
+# dùng trực tiếp cho set_data, bộ lọc, min/max...
+# View chỉ hợp lệ tới lần ghi tiếp theo (mảng có thể được cấp phát lại khi tăng kích thước).
+#
+# LongRunBuffer dùng cho phép đo rất dài (dữ liệu đầy đủ nằm trong file phiên đo, xem session.py):
+# trong RAM chỉ giữ phần gần nhất và một bản thu gọn (min/max theo nhóm) của cả phép đo để vẽ.
+# Không mở được file phiên thì LongRunBuffer tự ghi mọi mẫu ra file tràn (path) để không mất lịch sử.
+import time
+
+import numpy as np
+
+INITIAL_CAPACITY = 1024
+# Số mẫu gần nhất giữ đủ độ phân giải / số nhóm tối đa của bản thu gọn trong LongRunBuffer
+RECENT_SIZE = 20_000
+OVERVIEW_SIZE = 2_000
+# Chu kỳ (s) đẩy dữ liệu đang đệm của file tràn ra đĩa
+FLUSH_INTERVAL = 1.0
+
+
+class SampleBuffer:
+    def __init__(self, columns, capacity=INITIAL_CAPACITY, dtype=np.float64):
+        self.columns = tuple(columns)
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        self._data = np.empty((len(self.columns), max(int(capacity), 1)), dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self._data[self._index[name], :self.size]
+
+    def column(self, name):
+        return self[name]
+
+    @property
+    def capacity(self):
+        return self._data.shape[1]
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def reserve(self, capacity):
+        # Tăng dung lượng (ít nhất gấp đôi) để chi phí append trung bình là O(1)
+        if capacity <= self.capacity:
+            return
+        data = np.empty((len(self.columns), max(capacity, self.capacity * 2)), dtype=self._data.dtype)
+        data[:, :self.size] = self._data[:, :self.size]
+        self._data = data
+
+    def append(self, *values):
+        # Một mẫu: append(v_cột_1, v_cột_2, ...)
+        self.reserve(self.size + 1)
+        self._data[:, self.size] = values
+        self.size += 1
+
+    def extend(self, *columns):
+        # Nhiều mẫu theo cột: extend(list_cột_1, list_cột_2, ...), các cột cùng độ dài
+        count = len(columns[0]) if columns else 0
+        if count == 0:
+            return
+        self.reserve(self.size + count)
+        for i, values in enumerate(columns):
+            self._data[i, self.size:self.size + count] = values
+        self.size += count
+
+    def extend_rows(self, rows):
+        # Nhiều mẫu theo hàng: [(v1, v2, ...), ...]
+        if len(rows) == 0:
+            return
+        rows = np.asarray(rows, dtype=self._data.dtype)
+        self.reserve(self.size + len(rows))
+        self._data[:, self.size:self.size + len(rows)] = rows.T
+        self.size += len(rows)
+
+    def truncate(self, size):
+        self.size = max(0, min(size, self.size))
+
+    def discard(self, count):
+        # Bỏ count mẫu cũ nhất (dịch phần còn lại về đầu)
+        count = max(0, min(count, self.size))
+        self._data[:, :self.size - count] = self._data[:, count:self.size]
+        self.size -= count
+
+    def clear(self):
+        self.size = 0
+
+    def rows(self):
+        # Duyệt từng mẫu dạng tuple float (dùng khi ghi CSV)
+        return zip(*(self[name].tolist() for name in self.columns))
+
+
+class LongRunBuffer:
+    # Bộ nhớ dùng không phụ thuộc độ dài phép đo, chỉ giữ:
+    #   recent    recent_size..2*recent_size mẫu mới nhất, đủ độ phân giải
+    #   overview  cả phép đo chia thành <= overview_size nhóm liên tiếp, mỗi nhóm giữ điểm min và max
+    #             của cột cuối; quá số nhóm thì gộp từng cặp và kích thước nhóm tăng gấp đôi
+    # path: thêm file tràn, mọi mẫu ghi nối tiếp (các hàng float64 liên tiếp, đọc lại bằng read()/np.memmap)
+    def __init__(self, columns, recent_size=RECENT_SIZE, overview_size=OVERVIEW_SIZE, path=None):
+        self.columns = tuple(columns)
+        self.recent_size = recent_size
+        self.overview_size = overview_size
+        self.size = 0
+        self.recent = SampleBuffer(self.columns, capacity=2 * recent_size)
+        self.overview = SampleBuffer(("x_min", "y_min", "x_max", "y_max"))
+        self.bucket = 1
+        self._pending = SampleBuffer(("x", "y"))
+        self.path = path
+        self.file = None
+        self.error = None
+        self._last_flush = time.monotonic()
+        if path is not None:
+            try:
+                self.file = open(path, "wb")
+            except OSError as e:
+                print("Không tạo được file tràn:", e)
+                self.error = e
+
+    def __len__(self):
+        return self.size
+
+    def append(self, *values):
+        self.extend(*([v] for v in values))
+
+    def extend(self, *columns):
+        rows = np.column_stack([np.asarray(c, dtype=np.float64) for c in columns])
+        if len(rows) == 0:
+            return
+        self._spill(rows)
+        self.size += len(rows)
+        self.recent.extend(*rows.T)
+        if len(self.recent) > 2 * self.recent_size:
+            self.recent.discard(len(self.recent) - self.recent_size)
+        self._add_overview(rows[:, 0], rows[:, -1])
+
+    def _add_overview(self, x, y):
+        self._pending.extend(x, y)
+        full = len(self._pending) // self.bucket * self.bucket
+        if full:
+            xs = self._pending["x"][:full].reshape(-1, self.bucket)
+            ys = self._pending["y"][:full].reshape(-1, self.bucket)
+            rows = np.arange(len(ys))
+            lo = ys.argmin(axis=1)
+            hi = ys.argmax(axis=1)
+            self.overview.extend(xs[rows, lo], ys[rows, lo], xs[rows, hi], ys[rows, hi])
+            self._pending.discard(full)
+        while len(self.overview) > self.overview_size:
+            self._merge_overview()
+
+    def _merge_overview(self):
+        # Gộp nhóm 2k với 2k+1; nhóm lẻ cuối cùng giữ nguyên
+        pairs = len(self.overview) // 2
+        merged = []
+        for x_name, y_name, pick in (("x_min", "y_min", np.less_equal), ("x_max", "y_max", np.greater_equal)):
+            x = self.overview[x_name][:2 * pairs]
+            y = self.overview[y_name][:2 * pairs]
+            first = pick(y[0::2], y[1::2])
+            merged += [np.where(first, x[0::2], x[1::2]), np.where(first, y[0::2], y[1::2])]
+        tail = [self.overview[name][2 * pairs:].copy() for name in self.overview.columns]
+        self.overview.clear()
+        self.overview.extend(*merged)
+        self.overview.extend(*tail)
+        self.bucket *= 2
+
+    def overview_points(self):
+        # (x, y) của bản thu gọn theo thứ tự thời gian: 2 điểm mỗi nhóm + các mẫu chưa đủ một nhóm
+        o = self.overview
+        swap = o["x_max"] < o["x_min"]
+        x = np.empty(2 * len(o))
+        y = np.empty(2 * len(o))
+        x[0::2] = np.where(swap, o["x_max"], o["x_min"])
+        y[0::2] = np.where(swap, o["y_max"], o["y_min"])
+        x[1::2] = np.where(swap, o["x_min"], o["x_max"])
+        y[1::2] = np.where(swap, o["y_min"], o["y_max"])
+        return np.concatenate((x, self._pending["x"])), np.concatenate((y, self._pending["y"]))
+
+    @property
+    def complete(self):
+        # Còn đủ mọi mẫu: chưa bỏ mẫu nào khỏi recent, hoặc file tràn ghi đủ (không có lỗi ghi)
+        if self.size == len(self.recent):
+            return True
+        return self.path is not None and self.error is None
+
+    def _spill(self, rows):
+        if self.file is None or self.file.closed:
+            return
+        try:
+            self.file.write(rows.tobytes())
+            if time.monotonic() - self._last_flush > FLUSH_INTERVAL:
+                self.flush()
+        except OSError as e:
+            # Đĩa đầy / mất ổ: ngừng ghi file tràn, chỉ còn recent + bản thu gọn
+            print("Lỗi ghi file tràn:", e)
+            self.error = e
+            self.close()
+
+    def flush(self):
+        if self.file is not None and not self.file.closed:
+            self.file.flush()
+        self._last_flush = time.monotonic()
+
+    def read(self, start=0, stop=None):
+        # Các hàng [start, stop) đọc từ file tràn (np.memmap, không nạp cả file vào RAM);
+        # không có file tràn thì lấy từ recent (chỉ đủ khi complete)
+        if self.file is None or self.error is not None:
+            return np.column_stack([self.recent[name] for name in self.columns])[start:stop]
+        self.flush()
+        if self.size == 0:
+            return np.empty((0, len(self.columns)))
+        data = np.memmap(self.path, dtype=np.float64, mode="r", shape=(self.size, len(self.columns)))
+        return data[start:stop]
+
+    def close(self):
+        if self.file is not None and not self.file.closed:
+            try:
+                self.file.close()
+            except OSError:
+                pass
@@ -0,0 +1,450 @@
+# Khớp mạch tương đương cho phổ EIS (Z(f) phức).
+# Mỗi mạch tính Z và Jacobian giải tích dZ/dp trên cả mảng tần số complex128 một lần (không vòng lặp Python),
+# khớp bằng Levenberg-Marquardt trên phần dư (Z_mô_hình - Z_đo) / |Z_đo| (thực và ảo):
+#   "randles"          Rs + (Rct || Cdl)
+#   "randles_warburg"  Rs + (Cdl || (Rct + W)),  W = Aw / sqrt(jw)  (Warburg bán vô hạn)
+#   "r_cpe", "r_cpe2"  Rs + (R1 || CPE1) [+ (R2 || CPE2)],  CPE: Y = Q (jw)^n
+# Điện trở, điện dung, Q, Aw khớp theo log (luôn dương, nhiều bậc độ lớn); n khớp tuyến tính trong [N_MIN, 1].
+# Dữ liệu theo quy ước của các kỹ thuật EIS: Im(Z) âm với phần điện dung.
+#
+#   fitter = SweepFitter(make_circuit("randles"))
+#   result = fitter.fit(freqs, reals + 1j * imags)   # mỗi lần quét bắt đầu từ kết quả lần trước
+#   result.values, result.errors, result.impedance(freqs)
+#
+# Khớp hàng loạt file xuất EIS (fit_directory): các file chia thành từng khối FIT_CHUNK file cho các tiến trình
+# của ProcessPoolExecutor; trong mỗi tiến trình FrequencyGrid của một lần quét được tính một lần và dùng lại
+# cho mọi file cùng lần quét. Kết quả (tham số, sai số chuẩn) ghi chung một bảng CSV.
+# Dòng lệnh: python circuits.py THƯ_MỤC [--circuit r_cpe] [--workers 8] [--output fits.csv]
+import argparse
+import csv
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import acquisition
+import importer
+
+MAX_ITERATIONS = 100
+# Dừng khi tổng bình phương phần dư giảm ít hơn tỉ lệ này
+TOLERANCE = 1e-10
+N_MIN = 0.3
+LOG_LIMIT = 60.0
+# Số điểm của đường mô hình vẽ trên Nyquist
+CURVE_POINTS = 200
+# Số file mỗi phần việc gửi cho một tiến trình / số lưới tần số giữ lại trong mỗi tiến trình
+FIT_CHUNK = 32
+GRID_CACHE = 64
+# |Z| từ giá trị "inf" của thiết bị (EIS 3E và 2E) trở lên không được dùng để khớp
+INF_MAGNITUDE = min(acquisition.EIS_3E_INF_VALUE, acquisition.EIS_2E_INF_MAGNITUDE)
+
+
+class FrequencyGrid:
+    # Các đại lượng chỉ phụ thuộc tần số (jw, ln(jw), (jw)^-1/2), tính một lần rồi dùng cho mọi vòng lặp khớp
+    # và mọi file cùng lần quét
+    def __init__(self, freqs):
+        self.freqs = np.asarray(freqs, dtype=np.float64)
+        self.omega = 2 * np.pi * self.freqs
+        self.s = 1j * self.omega
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.log_s = np.log(self.omega) + 0.5j * np.pi
+        self.inv_sqrt_s = np.exp(-0.5 * self.log_s)
+
+    def __len__(self):
+        return len(self.freqs)
+
+    def power(self, n):
+        # (jw)^n
+        return np.exp(n * self.log_s)
+
+    def subset(self, mask):
+        grid = FrequencyGrid.__new__(FrequencyGrid)
+        for name in ("freqs", "omega", "s", "log_s", "inv_sqrt_s"):
+            setattr(grid, name, getattr(self, name)[mask])
+        return grid
+
+
+class Circuit:
+    name = ""
+    params = ()
+    units = ()
+    # Tham số khớp tuyến tính (không theo log)
+    linear = ()
+
+    def impedance(self, p, grid):
+        return self.evaluate(p, grid)[0]
+
+    def evaluate(self, p, grid):
+        # (Z, J) trên FrequencyGrid, J[k] = dZ/dp[k]
+        raise NotImplementedError
+
+    def guess(self, omega, z):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return self.name
+
+
+def _apex(omega, z):
+    # (w, -Im(Z)) tại đỉnh bán nguyệt: cực đại cục bộ lớn nhất của -Im(Z) không nằm ở w_min. Khi đuôi Warburg
+    # chiếm ưu thế, cực đại toàn cục nằm ở w_min và cho Cdl lớn hơn cả nghìn lần
+    order = np.argsort(omega)
+    w, y = omega[order], -z.imag[order]
+    if len(y) >= 3:
+        interior = np.flatnonzero((y[1:-1] >= y[:-2]) & (y[1:-1] >= y[2:])) + 1
+        if len(interior):
+            k = interior[np.argmax(y[interior])]
+            return float(w[k]), float(y[k])
+    k = int(np.argmax(y))
+    return float(w[k]), float(y[k])
+
+
+def _estimates(omega, z):
+    # Rs (phần thực nhỏ nhất), R phân cực, tần số góc tại đỉnh bán nguyệt
+    rs = max(float(z.real.min()), 1e-3)
+    r = max(float(z.real.max()) - rs, rs * 1e-2, 1e-3)
+    return rs, r, _apex(omega, z)[0]
+
+
+class Randles(Circuit):
+    name = "randles"
+    params = ("Rs", "Rct", "Cdl")
+    units = ("Ω", "Ω", "F")
+
+    def evaluate(self, p, grid):
+        rs, rct, c = p
+        d = 1 + rct * c * grid.s
+        d2 = d * d
+        return rs + rct / d, np.array([np.ones_like(d2), 1 / d2, -rct * rct * grid.s / d2])
+
+    def guess(self, omega, z):
+        rs, r, peak = _estimates(omega, z)
+        return np.array([rs, r, 1 / (peak * r)])
+
+
+class RandlesWarburg(Circuit):
+    name = "randles_warburg"
+    params = ("Rs", "Rct", "Cdl", "Aw")
+    units = ("Ω", "Ω", "F", "Ω·s^-0.5")
+
+    def evaluate(self, p, grid):
+        rs, rct, c, aw = p
+        zf = rct + aw * grid.inv_sqrt_s
+        d = 1 + zf * c * grid.s
+        d2 = d * d
+        return rs + zf / d, np.array([np.ones_like(d2), 1 / d2, -zf * zf * grid.s / d2, grid.inv_sqrt_s / d2])
+
+    def guess(self, omega, z):
+        rs, r, _ = _estimates(omega, z)
+        # Rct từ đỉnh bán nguyệt (-Im(Z) đỉnh ~ Rct / 2), không từ phần thực lớn nhất (gồm cả đuôi Warburg)
+        peak, height = _apex(omega, z)
+        rct = min(max(2 * height, r * 1e-3), r)
+        # Đuôi tần số thấp 45°: -Im(Z) ~ Aw / sqrt(2w)
+        low = int(np.argmin(omega))
+        aw = max(float(-z.imag[low]) * np.sqrt(2 * omega[low]) * 0.5, r * 1e-3)
+        return np.array([rs, rct, 1 / (peak * rct), aw])
+
+
+class RCPEChain(Circuit):
+    def __init__(self, elements=1):
+        self.elements = int(elements)
+        self.name = "r_cpe" if self.elements == 1 else f"r_cpe{self.elements}"
+        self.params = ("Rs",) + sum(((f"R{k}", f"Q{k}", f"n{k}") for k in range(1, self.elements + 1)), ())
+        self.units = ("Ω",) + ("Ω", "S·s^n", "") * self.elements
+        self.linear = tuple(f"n{k}" for k in range(1, self.elements + 1))
+
+    def evaluate(self, p, grid):
+        z = np.full(len(grid), p[0], dtype=np.complex128)
+        jac = [np.ones(len(grid), dtype=np.complex128)]
+        for k in range(self.elements):
+            r, q, n = p[1 + 3 * k:4 + 3 * k]
+            sn = grid.power(n)
+            d = 1 + r * q * sn
+            d2 = d * d
+            z += r / d
+            jac += [1 / d2, -r * r * sn / d2, -r * r * q * sn * grid.log_s / d2]
+        return z, np.array(jac)
+
+    def guess(self, omega, z):
+        rs, r, peak = _estimates(omega, z)
+        if self.elements == 1:
+            centers = [peak]
+        else:
+            centers = np.geomspace(omega.max(), omega.min(), self.elements + 2)[1:-1]
+        values = [rs]
+        for center in centers:
+            values += [r / self.elements, self.elements / (center * r), 0.9]
+        return np.array(values)
+
+
+CIRCUITS = {
+    "randles": Randles,
+    "randles_warburg": RandlesWarburg,
+    "r_cpe": RCPEChain,
+    "r_cpe2": lambda: RCPEChain(2),
+}
+
+
+def make_circuit(name, **params):
+    if name not in CIRCUITS:
+        raise ValueError(f"Không có mạch {name} (chọn: {', '.join(CIRCUITS)})")
+    return CIRCUITS[name](**params)
+
+
+class FitResult:
+    def __init__(self, circuit, values, errors, chi2, points, iterations, converged):
+        self.circuit = circuit
+        self.values = values
+        self.errors = errors
+        self.chi2 = chi2
+        self.points = points
+        self.iterations = iterations
+        self.converged = converged
+
+    @property
+    def rms(self):
+        # Sai số tương đối trung bình của mô hình so với |Z| đo
+        return float(np.sqrt(self.chi2 / max(2 * self.points, 1)))
+
+    def as_dict(self):
+        return dict(zip(self.circuit.params, self.values.tolist()))
+
+    def impedance(self, freqs):
+        return self.circuit.impedance(self.values, FrequencyGrid(freqs))
+
+    def curve(self, freqs, points=CURVE_POINTS):
+        # Z mô hình trên lưới log đều trong khoảng tần số của dữ liệu (đường khớp trên đồ thị)
+        freqs = np.asarray(freqs, dtype=np.float64)
+        freqs = freqs[np.isfinite(freqs) & (freqs > 0)]
+        return self.impedance(np.geomspace(freqs.min(), freqs.max(), points))
+
+    def describe(self, separator="\n"):
+        lines = [f"{name} = {value:.4g} ± {error:.2g} {unit}".rstrip()
+                 for name, value, error, unit in zip(self.circuit.params, self.values, self.errors, self.circuit.units)]
+        lines.append(f"{self.circuit.name}: sai số {100 * self.rms:.2f}%, {self.iterations} vòng")
+        return separator.join(lines)
+
+
+def _to_theta(circuit, p):
+    mask = _log_mask(circuit)
+    return np.where(mask, np.log(np.maximum(p, 1e-300)), p)
+
+
+def _from_theta(circuit, theta):
+    mask = _log_mask(circuit)
+    return np.where(mask, np.exp(np.clip(theta, -LOG_LIMIT, LOG_LIMIT)), np.clip(theta, N_MIN, 1.0))
+
+
+def _log_mask(circuit):
+    return np.array([name not in circuit.linear for name in circuit.params])
+
+
+def _residuals(circuit, theta, grid, z, weight):
+    p = _from_theta(circuit, theta)
+    model, jac = circuit.evaluate(p, grid)
+    # dZ/dtheta: tham số log nhân thêm p
+    jac = jac * np.where(_log_mask(circuit), p, 1.0)[:, None] * weight
+    r = (model - z) * weight
+    return np.concatenate((r.real, r.imag)), np.concatenate((jac.real, jac.imag), axis=1).T
+
+
+def fit(circuit, freqs, z, initial=None, grid=None, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    # Khớp circuit với phổ (freqs, z); bỏ các điểm không hữu hạn. initial: giá trị tham số bắt đầu,
+    # grid: FrequencyGrid(freqs) đã tính sẵn (dùng chung giữa các phổ cùng lần quét)
+    if grid is None:
+        grid = FrequencyGrid(freqs)
+    z = np.asarray(z, dtype=np.complex128)
+    valid = np.isfinite(grid.freqs) & np.isfinite(z) & (grid.freqs > 0) & (np.abs(z) > 0)
+    if not valid.all():
+        grid = grid.subset(valid)
+        z = z[valid]
+    k = len(circuit.params)
+    if len(z) * 2 <= k:
+        raise ValueError(f"Cần ít nhất {k // 2 + 1} điểm để khớp {circuit.name}")
+    weight = 1 / np.abs(z)
+    p0 = circuit.guess(grid.omega, z) if initial is None else np.asarray(initial, dtype=np.float64)
+    theta = _to_theta(circuit, p0)
+    r, jac = _residuals(circuit, theta, grid, z, weight)
+    cost = r @ r
+    damping = 1e-3
+    converged = False
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        gradient = jac.T @ r
+        hessian = jac.T @ jac
+        scale = np.diag(hessian).copy()
+        scale[scale <= 0] = 1.0
+        while True:
+            try:
+                step = np.linalg.solve(hessian + damping * np.diag(scale), -gradient)
+            except np.linalg.LinAlgError:
+                step = None
+            if step is not None:
+                trial = _to_theta(circuit, _from_theta(circuit, theta + step))
+                r_new, jac_new = _residuals(circuit, trial, grid, z, weight)
+                cost_new = r_new @ r_new
+                if np.isfinite(cost_new) and cost_new <= cost:
+                    break
+            damping *= 10
+            if damping > 1e12:
+                break
+        if damping > 1e12:
+            break  # không còn bước nào giảm được phần dư: kẹt, không coi là hội tụ
+        improvement = cost - cost_new
+        theta, r, jac, cost = trial, r_new, jac_new, cost_new
+        damping = max(damping / 10, 1e-12)
+        if improvement <= tolerance * max(cost, 1e-30):
+            converged = True
+            break
+
+    p = _from_theta(circuit, theta)
+    # Sai số chuẩn từ (J^T J)^-1 * s^2, đổi từ theta về tham số
+    dof = max(len(r) - k, 1)
+    try:
+        covariance = np.linalg.pinv(jac.T @ jac) * cost / dof
+        sigma = np.sqrt(np.maximum(np.diag(covariance), 0))
+    except np.linalg.LinAlgError:
+        sigma = np.full(k, np.nan)
+    errors = np.where(_log_mask(circuit), p * sigma, sigma)
+    return FitResult(circuit, p, errors, float(cost), len(z), iteration, converged)
+
+
+class SweepFitter:
+    # Khớp lần lượt từng lần quét (repeat) của một phép đo: mỗi lần bắt đầu từ kết quả lần trước,
+    # thường chỉ cần vài vòng lặp. Nếu khởi đầu cũ cho kết quả không hội tụ thì khớp lại từ ước lượng ban đầu.
+    def __init__(self, circuit):
+        self.circuit = circuit
+        self.result = None
+
+    def reset(self):
+        self.result = None
+
+    def fit(self, freqs, z, grid=None):
+        if self.result is None:
+            result = fit(self.circuit, freqs, z, grid=grid)
+        else:
+            result = fit(self.circuit, freqs, z, self.result.values, grid)
+            if not result.converged:
+                cold = fit(self.circuit, freqs, z, grid=grid)
+                if cold.chi2 < result.chi2:
+                    result = cold
+        self.result = result
+        return result
+
+
+# ==== KHỚP HÀNG LOẠT ====
+_grids = {}
+
+
+def shared_grid(freqs):
+    # FrequencyGrid dùng chung cho mọi phổ có cùng mảng tần số (trong một tiến trình)
+    key = freqs.tobytes()
+    grid = _grids.get(key)
+    if grid is None:
+        if len(_grids) >= GRID_CACHE:
+            _grids.clear()
+        grid = _grids[key] = FrequencyGrid(freqs)
+    return grid
+
+
+def sweep_bounds(freqs):
+    # Vị trí bắt đầu các lần quét (và len(freqs) ở cuối): lần quét mới bắt đầu tại chỗ tần số đổi chiều
+    freqs = np.asarray(freqs, dtype=np.float64)
+    steps = np.sign(np.diff(freqs))
+    direction = steps[0] if len(steps) else 0
+    if not direction:
+        return np.r_[0, len(freqs)]
+    return np.r_[0, np.flatnonzero(steps == -direction) + 1, len(freqs)]
+
+
+def read_spectra(path):
+    # Các lần quét [(freqs, z), ...] trong một file xuất EIS 3E / 2E (cột đầu là tần số). Các lần quét lặp lại
+    # tách tại chỗ tần số đổi chiều; điểm "inf" của thiết bị thành NaN (bị bỏ khi khớp)
+    data = importer.CsvExport(path).read([0, "Re(Z) (Ohm)", "Im(Z) (Ohm)"])
+    if len(data) == 0:
+        raise ValueError("File không có dữ liệu")
+    freqs, reals, imags = (data[c] for c in data.columns)
+    z = reals + 1j * imags
+    z[np.abs(z) >= INF_MAGNITUDE] = np.nan
+    bounds = sweep_bounds(freqs)
+    return [(freqs[a:b].copy(), z[a:b]) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def _fit_files(task):
+    # Một phần việc (chạy trong tiến trình con): khớp mọi lần quét của các file; các phổ cùng lưới tần số
+    # dùng chung FrequencyGrid và bắt đầu từ kết quả phổ trước đó
+    circuit_name, paths = task
+    circuit = make_circuit(circuit_name)
+    fitters = {}
+    rows = []
+    for path in paths:
+        try:
+            spectra = read_spectra(path)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            rows.append((path, 0, None, None, 0, 0, 0, False, str(e)))
+            continue
+        for sweep, (freqs, z) in enumerate(spectra, 1):
+            grid = shared_grid(freqs)
+            fitter = fitters.setdefault(freqs.tobytes(), SweepFitter(circuit))
+            try:
+                result = fitter.fit(freqs, z, grid)
+            except ValueError as e:
+                fitter.reset()
+                rows.append((path, sweep, None, None, 0, len(freqs), 0, False, str(e)))
+                continue
+            rows.append((path, sweep, result.values.tolist(), result.errors.tolist(), result.rms, result.points,
+                         result.iterations, result.converged, ""))
+    return rows
+
+
+def fit_directory(directory, circuit="randles", pattern="*.csv", workers=None, chunk=FIT_CHUNK):
+    # Khớp mọi file xuất EIS trong thư mục; trả về các hàng
+    # (file, lần quét, giá trị, sai số chuẩn, rms, số điểm, số vòng, hội tụ, lỗi) theo thứ tự file
+    make_circuit(circuit)  # báo lỗi tên mạch ngay
+    # File "_meta.csv" đi kèm file xuất EIS 2E chỉ có tham số đo
+    paths = sorted(p for p in glob.glob(os.path.join(directory, pattern)) if not p.endswith("_meta.csv"))
+    tasks = [(circuit, paths[i:i + chunk]) for i in range(0, len(paths), chunk)]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        parts = list(map(_fit_files, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_fit_files, tasks))
+    return [row for part in parts for row in part]
+
+
+def write_table(path, circuit, rows):
+    params = make_circuit(circuit).params
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["File", "Sweep", "Circuit", "Points"] + list(params) + [f"σ {name}" for name in params]
+                        + ["RMS (%)", "Iterations", "Converged", "Error"])
+        for file, sweep, values, errors, rms, points, iterations, converged, error in rows:
+            if values is None:
+                values = errors = [""] * len(params)
+                rms = ""
+            else:
+                rms = 100 * rms
+            writer.writerow([os.path.basename(file), sweep, circuit, points] + list(values) + list(errors)
+                            + [rms, iterations, converged, error])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Khớp mạch tương đương cho mọi file xuất EIS trong một thư mục")
+    parser.add_argument("directory")
+    parser.add_argument("--circuit", default="randles", choices=list(CIRCUITS))
+    parser.add_argument("--pattern", default="*.csv")
+    parser.add_argument("--workers", type=int, help="số tiến trình (mặc định: số CPU)")
+    parser.add_argument("--chunk", type=int, default=FIT_CHUNK, help="số file mỗi phần việc")
+    parser.add_argument("--output", default="fits.csv")
+    args = parser.parse_args()
+
+    rows = fit_directory(args.directory, args.circuit, args.pattern, args.workers, args.chunk)
+    write_table(args.output, args.circuit, rows)
+    failed = sum(1 for row in rows if row[2] is None)
+    print(f"{len(rows)} phổ ({failed} lỗi) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
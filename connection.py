@@ -0,0 +1,151 @@
+# Một cổng serial dùng chung cho tất cả các tab đo.
+# SerialManager giữ cổng mở suốt phiên làm việc (không mở lại → ESP không bị reset khi đổi tab),
+# mỗi phép đo thuê (lease) một SerialChannel; tại một thời điểm chỉ một kỹ thuật giữ kênh,
+# các yêu cầu khác xếp hàng theo thứ tự đến.
+import collections
+import contextlib
+import threading
+
+BAUDRATE = 115200
+SERIAL_TIMEOUT = 1
+
+
+class ChannelError(Exception):
+    pass
+
+
+class SerialChannel:
+    # Giao diện giống serial.Serial ở mức các reader cần: write/read/readline/in_waiting/is_open
+    def __init__(self, manager, owner):
+        self.manager = manager
+        self.owner = owner
+        self.active = True
+
+    def _port(self):
+        if not self.active:
+            raise ChannelError(f"Kênh của {self.owner} đã được trả lại")
+        ser = self.manager.ser
+        if ser is None or not ser.is_open:
+            raise ChannelError("Cổng serial chưa kết nối")
+        return ser
+
+    @property
+    def is_open(self):
+        return self.active and self.manager.is_open
+
+    @property
+    def timeout(self):
+        return self._port().timeout
+
+    @property
+    def in_waiting(self):
+        return self._port().in_waiting
+
+    def write(self, data):
+        ser = self._port()
+        with self.manager.write_lock:
+            return ser.write(data)
+
+    def read(self, size=1):
+        ser = self._port()
+        with self.manager.read_lock:
+            return ser.read(size)
+
+    def readline(self):
+        ser = self._port()
+        with self.manager.read_lock:
+            return ser.readline()
+
+    def reset_input_buffer(self):
+        ser = self._port()
+        with self.manager.read_lock:
+            ser.reset_input_buffer()
+
+    def release(self):
+        self.manager.release(self)
+
+
+class SerialManager:
+    def __init__(self, serial_factory=None, baudrate=BAUDRATE, timeout=SERIAL_TIMEOUT):
+        if serial_factory is None:
+            import serial
+            serial_factory = serial.Serial
+        self.serial_factory = serial_factory
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.ser = None
+        self.port = None
+        self.read_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._holder = None
+        self._waiting = collections.deque()
+
+    @property
+    def is_open(self):
+        return self.ser is not None and self.ser.is_open
+
+    @property
+    def owner(self):
+        holder = self._holder
+        return holder.owner if holder is not None else None
+
+    def connect(self, port):
+        # Cùng cổng đang mở thì dùng lại, không mở lại
+        if self.is_open and port == self.port:
+            return False
+        self.disconnect()
+        self.ser = self.serial_factory(port, self.baudrate, timeout=self.timeout)
+        self.port = port
+        return True
+
+    def disconnect(self):
+        with self._cond:
+            if self._holder is not None:
+                self._holder.active = False
+                self._holder = None
+            self._cond.notify_all()
+        if self.ser is not None and self.ser.is_open:
+            self.ser.close()
+        self.ser = None
+        self.port = None
+
+    def acquire(self, owner, timeout=None):
+        # Chờ tới lượt (FIFO); trả về None nếu hết timeout. timeout=0: không chờ.
+        ticket = object()
+        with self._cond:
+            self._waiting.append(ticket)
+            try:
+                ready = self._cond.wait_for(
+                    lambda: self._holder is None and self._waiting[0] is ticket, timeout)
+                if not ready:
+                    return None
+                channel = self._holder = SerialChannel(self, owner)
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+        # Bỏ dữ liệu còn sót của phép đo trước (vd. dòng END chưa đọc) trước khi kỹ thuật mới gửi lệnh,
+        # nếu không dòng đó sẽ kết thúc ngay lần đọc tiếp theo
+        if self.is_open:
+            channel.reset_input_buffer()
+        return channel
+
+    def try_acquire(self, owner):
+        return self.acquire(owner, timeout=0)
+
+    def release(self, channel):
+        with self._cond:
+            channel.active = False
+            if self._holder is channel:
+                self._holder = None
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def lease(self, owner, timeout=None):
+        channel = self.acquire(owner, timeout)
+        if channel is None:
+            raise ChannelError(f"Cổng serial đang được {self.owner} sử dụng")
+        try:
+            yield channel
+        finally:
+            channel.release()
@@ -0,0 +1,156 @@
+# Phân tích CV theo từng chu kỳ cho chuỗi đã nối liền repeat_times chu kỳ (CVApp.buffer_voltage / dòng đã lọc).
+# CycleIndex dựng một lần khi nhận / nhập dữ liệu: điện thế là bậc thang đi lên rồi đi xuống nên mỗi nửa chu kỳ
+# là một đoạn cùng chiều quét; điểm lặp lại ở đỉnh / đáy (bước 0) thuộc đoạn của điểm trước, điểm "inf" đã bị bỏ
+# không làm lệch chỉ số. Chu kỳ = hai đoạn liền nhau tính từ đoạn đầu; chu kỳ thiếu nửa sau bị bỏ.
+# Trên chỉ số đó mọi đại lượng của mọi chu kỳ tính bằng vài phép mảng (không lặp theo chu kỳ):
+#   Epa, Ipa: cực đại dòng trên đoạn quét dương; Epc, Ipc: cực tiểu dòng trên đoạn quét âm; ΔEp = Epa - Epc
+#   Qa, Qc: tích phân hình thang của dòng theo thời gian trên từng đoạn (dt = |dE| / tốc độ quét);
+#           chưa biết tốc độ quét thì là tích phân theo điện thế (μA·mV)
+#   trôi: độ dốc theo chu kỳ (bình phương tối thiểu) và thay đổi của chu kỳ cuối so với chu kỳ đầu
+#
+# Dòng lệnh: python cycles.py FILE.csv [--scan-rate 50] [--output cycles.csv]
+import argparse
+import csv
+
+import numpy as np
+
+import buffers
+import importer
+
+CYCLE_COLUMNS = ("cycle", "epa", "ipa", "epc", "ipc", "dep", "qa", "qc")
+# Các đại lượng tính độ trôi theo chu kỳ
+DRIFT_COLUMNS = ("epa", "ipa", "epc", "ipc", "dep", "qa", "qc")
+
+
+class CycleIndex:
+    def __init__(self, voltage):
+        v = np.asarray(voltage, dtype=np.float64)
+        self.count = len(v)
+        steps = np.sign(np.diff(v))
+        moving = np.flatnonzero(steps)
+        if len(moving) == 0:
+            self.starts = self.stops = self.directions = np.zeros(0, dtype=np.int64)
+            self.labels = np.zeros(self.count, dtype=np.int64)
+            self.cycles = 0
+            return
+        # Chiều của mỗi điểm = chiều bước tới điểm sau; bước 0 lấy chiều bước khác 0 gần nhất phía trước
+        last = np.maximum.accumulate(np.where(steps != 0, np.arange(len(steps)), moving[0]))
+        direction = np.r_[steps[last], steps[last[-1]]]
+        self.starts = np.r_[0, np.flatnonzero(np.diff(direction)) + 1]
+        self.stops = np.r_[self.starts[1:], self.count]
+        self.directions = direction[self.starts].astype(np.int64)
+        self.labels = np.repeat(np.arange(len(self.starts)), self.stops - self.starts)
+        self.cycles = len(self.starts) // 2
+        # Dữ liệu dừng giữa nửa sau của chu kỳ cuối: nửa sau ngắn hơn nửa đầu quá 2 bước điện thế
+        if self.cycles:
+            step = np.median(np.abs(np.diff(v)[moving]))
+            opening, closing = (np.ptp(v[self.starts[k]:self.stops[k]])
+                                for k in (2 * self.cycles - 2, 2 * self.cycles - 1))
+            if closing < opening - 2 * step:
+                self.cycles -= 1
+
+    @property
+    def segments(self):
+        return len(self.starts)
+
+    def cycle_slice(self, cycle):
+        # Vị trí các điểm của chu kỳ (đánh số từ 0)
+        return slice(self.starts[2 * cycle], self.stops[2 * cycle + 1])
+
+
+def analyze(index, voltage, current, scan_rate=None):
+    # Bảng chu kỳ CYCLE_COLUMNS; scan_rate (mV/s) cho điện tích theo μC
+    table = buffers.SampleBuffer(CYCLE_COLUMNS)
+    cycles = index.cycles
+    if cycles == 0:
+        return table
+    segments = 2 * cycles
+    stop = index.stops[segments - 1]
+    v = np.asarray(voltage, dtype=np.float64)[:stop]
+    i = np.asarray(current, dtype=np.float64)[:stop]
+    labels = index.labels[:stop]
+    starts, stops = index.starts[:segments], index.stops[:segments]
+
+    # Cực đại / cực tiểu dòng của mọi đoạn: sắp theo (đoạn, dòng), lấy phần tử cuối / đầu của mỗi nhóm
+    order = np.lexsort((i, labels))
+    top, bottom = order[stops - 1], order[starts]
+    first = np.arange(0, segments, 2)
+    anodic = np.where(index.directions[first] > 0, first, first + 1)
+    cathodic = np.where(index.directions[first] > 0, first + 1, first)
+
+    # Tích phân hình thang trên từng đoạn (bỏ cặp điểm nằm ở hai đoạn khác nhau)
+    inside = labels[1:] == labels[:-1]
+    area = 0.5 * (i[1:] + i[:-1]) * np.abs(np.diff(v))
+    charge = np.bincount(labels[1:][inside], weights=area[inside], minlength=segments)
+    if scan_rate:
+        charge /= scan_rate
+
+    epa, ipa = v[top[anodic]], i[top[anodic]]
+    epc, ipc = v[bottom[cathodic]], i[bottom[cathodic]]
+    table.extend(np.arange(1, cycles + 1), epa, ipa, epc, ipc, epa - epc, charge[anodic], charge[cathodic])
+    return table
+
+
+def drift(table):
+    # {đại lượng: (độ dốc mỗi chu kỳ, chu kỳ cuối - chu kỳ đầu)}
+    if len(table) < 2:
+        return {}
+    values = np.column_stack([table[name] for name in DRIFT_COLUMNS])
+    slopes = np.polyfit(table["cycle"], values, 1)[0]
+    changes = values[-1] - values[0]
+    return {name: (slopes[k], changes[k]) for k, name in enumerate(DRIFT_COLUMNS)}
+
+
+def describe(table, scan_rate=None):
+    # Chu kỳ cuối và độ trôi dạng chữ để hiện trên giao diện
+    if len(table) == 0:
+        return "Chưa đủ một chu kỳ"
+    unit = "μC" if scan_rate else "μA·mV"
+    k = len(table) - 1
+    text = (f"{len(table)} chu kỳ, chu kỳ cuối:\n"
+            f"  Epa {table['epa'][k]:.1f} mV  Ipa {table['ipa'][k]:.4g} μA\n"
+            f"  Epc {table['epc'][k]:.1f} mV  Ipc {table['ipc'][k]:.4g} μA\n"
+            f"  ΔEp {table['dep'][k]:.1f} mV  Qa {table['qa'][k]:.4g}  Qc {table['qc'][k]:.4g} {unit}")
+    changes = drift(table)
+    if changes:
+        relative = [f"{label} {100 * changes[name][1] / abs(table[name][0]):+.2f}%"
+                    for label, name in (("Ipa", "ipa"), ("Ipc", "ipc")) if table[name][0]]
+        text += f"\nTrôi: ΔEp {changes['dep'][0]:+.4f} mV/chu kỳ  " + "  ".join(relative)
+    return text
+
+
+def read_cycles(path):
+    # (điện thế, dòng đã lọc) của một file CSV xuất từ CV; dùng dòng thô nếu cột đã lọc thiếu
+    data = importer.CsvExport(path).read((0, 2, 1), required=1)
+    if len(data) == 0:
+        raise ValueError("File không có dữ liệu")
+    voltage, filtered, raw = (data[c] for c in data.columns)
+    return voltage, (raw if np.isnan(filtered).any() else filtered)
+
+
+def write_table(path, table, scan_rate=None):
+    unit = "μC" if scan_rate else "μA·mV"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Cycle", "Epa (mV)", "Ipa (μA)", "Epc (mV)", "Ipc (μA)", "ΔEp (mV)",
+                         f"Qa ({unit})", f"Qc ({unit})"])
+        for row in table.rows():
+            writer.writerow([int(row[0])] + list(row[1:]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Phân tích từng chu kỳ của một file xuất CV")
+    parser.add_argument("file")
+    parser.add_argument("--scan-rate", type=float, help="tốc độ quét (mV/s) để tính điện tích theo μC")
+    parser.add_argument("--output", default="cycles.csv")
+    args = parser.parse_args()
+
+    voltage, current = read_cycles(args.file)
+    table = analyze(CycleIndex(voltage), voltage, current, args.scan_rate)
+    write_table(args.output, table, args.scan_rate)
+    print(describe(table, args.scan_rate))
+    print(f"-> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
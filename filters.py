@@ -0,0 +1,480 @@
+# Bộ lọc tín hiệu dùng chung cho mọi kỹ thuật đo (thay các hàm làm mượt riêng lẻ trước đây).
+# Mỗi bộ lọc có ba cách dùng:
+#   filt.apply(data)             cả khối: sau khi đo xong / khi nhập file (zero_phase: không làm lệch pha)
+#   stream = filt.stream()       causal khi đang đo: mỗi điểm chỉ dùng mẫu hiện tại và các mẫu trước,
+#   stream.extend(new_values)    mỗi lần chỉ tính các mẫu mới; stream.output là view NumPy của kết quả
+#
+#   tail = filt.incremental()    như apply() trên toàn bộ dữ liệu đã nhận nhưng cập nhật tăng dần:
+#   tail.sync(column)            Savitzky-Golay chỉ tính lại window điểm cuối mỗi lần có mẫu mới
+#
+# Bộ lọc của từng kỹ thuật lấy qua technique_filter(key); đổi bằng set_technique_filter(...) hoặc
+# tham số dòng lệnh của main1.py, ví dụ: --filter=dpv=savgol:window=9,polyorder=2
+# Butterworth cần scipy (chỉ import khi được chọn); các bộ lọc còn lại chỉ dùng NumPy.
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import buffers
+
+
+def round_array(values, ndigits):
+    # Như round(v, ndigits) của Python cho từng phần tử (kết quả trùng từng bit) nhưng tính bằng mảng.
+    # np.rint(v * 10**n) chỉ có thể chọn sai số nguyên khi v * 10**n sát nửa số nguyên
+    # (hoặc quá lớn / không hữu hạn); chỉ các phần tử đó mới tính lại bằng round().
+    x = np.asarray(values, dtype=np.float64)
+    scale = 10.0 ** ndigits
+    scaled = x * scale
+    out = np.rint(scaled) / scale
+    with np.errstate(invalid="ignore"):
+        distance = np.abs(scaled - np.floor(scaled) - 0.5)
+        exact = (distance > 1e-9 * np.maximum(np.abs(scaled), 1)) & (np.abs(scaled) < 2.0 ** 50)
+    for i in np.flatnonzero(~exact):
+        out[i] = round(float(x[i]), ndigits)
+    return out
+
+
+def _trailing(data, window, reduce):
+    # reduce(windows, current) trên cửa sổ [i - window + 1, i]; vài điểm đầu dùng cửa sổ ngắn hơn
+    x = np.asarray(data, dtype=np.float64)
+    out = np.empty(len(x))
+    for i in range(min(len(x), window - 1)):
+        out[i] = reduce(x[None, :i + 1], x[i:i + 1])[0]
+    if len(x) >= window:
+        out[window - 1:] = reduce(sliding_window_view(x, window), x[window - 1:])
+    return out
+
+
+def _centered(data, window, reduce):
+    # reduce(windows, current) trên cửa sổ đối xứng quanh i, hai đầu phản xạ (như mode="reflect" của scipy.ndimage)
+    x = np.asarray(data, dtype=np.float64)
+    if len(x) == 0:
+        return x.copy()
+    left = window // 2
+    padded = np.pad(x, (left, window - 1 - left), mode="symmetric")
+    return reduce(sliding_window_view(padded, window), x)
+
+
+# ==== LUỒNG (CAUSAL) ====
+class FilterStream:
+    # Kết quả lọc tăng dần của một cột chỉ được append (giống cách các kỹ thuật nhận dữ liệu)
+    def __init__(self, filt):
+        self.filter = filt
+        self.reset()
+
+    def reset(self):
+        self.buffer = buffers.SampleBuffer(("value",))
+        self.count = 0
+        self._reset_state()
+
+    def _reset_state(self):
+        pass
+
+    def _process(self, x):
+        raise NotImplementedError
+
+    @property
+    def output(self):
+        return self.buffer["value"]
+
+    def extend(self, values):
+        # Lọc các mẫu mới và trả về phần output tương ứng
+        start = len(self.buffer)
+        x = np.asarray(values, dtype=np.float64)
+        if len(x):
+            new = self._process(x)
+            self.count += len(x)
+            self.buffer.extend(new)
+        return self.output[start:]
+
+    def sync(self, data):
+        # Theo kịp một cột chỉ được append: chỉ lọc phần mới.
+        # Nếu cột ngắn đi (đã xóa) thì làm lại từ đầu; khi thay toàn bộ dữ liệu hãy gọi reset().
+        if len(data) < self.count:
+            self.reset()
+        return self.extend(data[self.count:])
+
+    def filtered(self, data, live=True):
+        # Khi đang đo: kết quả causal; vẽ lần cuối: bộ lọc zero_phase được tính lại cả khối
+        if live or not self.filter.zero_phase:
+            self.sync(data)
+            return self.output
+        return self.filter.apply(data)
+
+
+class WindowStream(FilterStream):
+    # Cho bộ lọc có cửa sổ hữu hạn: chỉ cần giữ window - 1 mẫu thô trước đó
+    def _reset_state(self):
+        self.history = np.empty(0)
+
+    def _process(self, x):
+        keep = self.filter.window - 1
+        extended = np.concatenate((self.history, x))
+        out = self.filter.causal(extended)[len(self.history):]
+        self.history = extended[max(len(extended) - keep, 0):] if keep else extended[:0]
+        return out
+
+
+class MovingAverageStream(FilterStream):
+    # Trung bình trượt causal, kết quả trùng từng bit với cách tính tuần tự:
+    #   y[i] = (x[i] + x[i-1] + ... + x[i-window+1]) / window, vài điểm đầu chia cho số điểm đang có
+    # recursive: các điểm trước dùng giá trị đã làm mượt (như bản ghi đè tại chỗ cũ của SWV).
+    # ndigits: làm tròn từ điểm thứ hai; min_length: chưa đủ số mẫu này thì output là dữ liệu thô.
+    def _reset_state(self):
+        self.previous = []  # tối đa window - 1 giá trị trước, mới nhất ở cuối
+        self._head = []
+
+    def _process(self, x):
+        filt = self.filter
+        if filt.recursive:
+            smoothed = self._recursive(x.tolist())
+        else:
+            smoothed = self._batch(x)
+        if self.count + len(x) < filt.min_length:
+            # Chưa đủ min_length mẫu: output là dữ liệu thô, giá trị đã làm mượt để dành
+            self._head.extend(smoothed)
+            return x
+        if self._head:
+            self.output[:len(self._head)] = self._head
+            self._head = []
+        return smoothed
+
+    def _batch(self, x):
+        # Cùng thứ tự phép cộng (x[i] + x[i-1]) + x[i-2]... như vòng lặp tuần tự nên trùng từng bit
+        window = self.filter.window
+        extended = np.concatenate((self.previous, x))
+        offset = len(self.previous)
+        index = np.arange(offset, len(extended))
+        out = x.copy()
+        terms = np.ones(len(x))
+        for k in range(1, window):
+            valid = index >= k
+            out[valid] += extended[index[valid] - k]
+            terms += valid
+        out /= terms
+        if self.filter.ndigits is not None:
+            first = 1 if self.count == 0 else 0
+            out[first:] = round_array(out[first:], self.filter.ndigits)
+        self.previous = extended[max(len(extended) - (window - 1), 0):].tolist() if window > 1 else []
+        return out
+
+    def _recursive(self, values):
+        window = self.filter.window
+        ndigits = self.filter.ndigits
+        previous = self.previous
+        i = self.count
+        out = []
+        for k, x in enumerate(values):
+            if window == 3 and len(previous) == 2:
+                return out + self._recursive3(values[k:])
+            value = x
+            for p in reversed(previous):
+                value += p
+            value /= len(previous) + 1
+            if ndigits is not None and i > 0:
+                value = round(value, ndigits)
+            previous.append(value)
+            if len(previous) >= window:
+                del previous[0]
+            out.append(value)
+            i += 1
+        return out
+
+    def _recursive3(self, values):
+        # Trường hợp hay gặp nhất (SWV): cửa sổ 3 điểm đã đầy, vòng lặp chỉ dùng biến cục bộ
+        ndigits = self.filter.ndigits
+        prev2, prev1 = self.previous
+        out = []
+        append = out.append
+        for x in values:
+            value = (x + prev1 + prev2) / 3
+            if ndigits is not None:
+                value = round(value, ndigits)
+            prev1, prev2 = value, prev1
+            append(value)
+        self.previous[:] = [prev2, prev1]
+        return out
+
+
+class RecomputeStream(FilterStream):
+    # output luôn bằng filter.apply(toàn bộ dữ liệu); mặc định tính lại cả khối mỗi lần có mẫu mới
+    def _reset_state(self):
+        self.raw = buffers.SampleBuffer(("value",))
+
+    def extend(self, values):
+        x = np.asarray(values, dtype=np.float64)
+        previous = self.count
+        if len(x):
+            self.raw.extend(x)
+            self.count += len(x)
+            previous = self._update(previous)
+        return self.output[previous:]
+
+    def _update(self, previous):
+        # Cập nhật output sau khi raw có thêm mẫu; trả về vị trí đầu tiên của output bị thay đổi
+        self.buffer.clear()
+        self.buffer.extend(self.filter.apply(self.raw["value"]))
+        return 0
+
+
+class SavgolTailStream(RecomputeStream):
+    # Savitzky-Golay tăng dần: điểm i chỉ phụ thuộc x[i - half : i + half + 1] nên khi có mẫu mới
+    # chỉ các điểm cuối (chưa đủ nửa cửa sổ bên phải) và các điểm mới phải tính lại -> O(window) mỗi mẫu
+    def _update(self, previous):
+        filt = self.filter
+        window = filt.window
+        half = window // 2
+        n = self.count
+        raw = self.raw["value"]
+        if n < window or previous < window:
+            return super()._update(previous)
+        start = previous - half
+        self.buffer.truncate(start)
+        self.buffer.extend(sliding_window_view(raw[start - half:], window) @ filt.coefficients)
+        self.buffer.extend(filt.evaluate[half + 1:] @ raw[n - window:])
+        return start
+
+
+class ButterworthStream(FilterStream):
+    # IIR causal: giữ trạng thái zi giữa các lần extend, khởi tạo theo mẫu đầu để không bị quá độ
+    def _reset_state(self):
+        self.zi = None
+
+    def _process(self, x):
+        signal = self.filter.signal
+        if self.zi is None:
+            self.zi = signal.sosfilt_zi(self.filter.sos) * x[0]
+        out, self.zi = signal.sosfilt(self.filter.sos, x, zi=self.zi)
+        return out
+
+
+# ==== BỘ LỌC ====
+class Filter:
+    name = ""
+    zero_phase = False
+    window = 1
+
+    def apply(self, data):
+        return self.causal(data)
+
+    def causal(self, data):
+        raise NotImplementedError
+
+    def stream(self):
+        return WindowStream(self)
+
+    def incremental(self):
+        if not self.zero_phase:
+            return self.stream()  # causal: apply() và stream() cho cùng kết quả
+        return RecomputeStream(self)
+
+    def __repr__(self):
+        params = ", ".join(f"{k}={v}" for k, v in self.params.items())
+        return f"{self.name}({params})"
+
+
+class MovingAverage(Filter):
+    name = "moving_average"
+
+    def __init__(self, window=3, centered=False, ndigits=None, min_length=0, recursive=False):
+        if window < 1:
+            raise ValueError("window phải >= 1")
+        self.window = int(window)
+        self.centered = centered
+        self.zero_phase = centered
+        self.ndigits = ndigits
+        self.min_length = min_length
+        self.recursive = recursive
+        self.params = {"window": window, "centered": centered, "ndigits": ndigits,
+                       "min_length": min_length, "recursive": recursive}
+
+    def apply(self, data):
+        if not self.centered:
+            return self.causal(data)
+        x = np.asarray(data, dtype=np.float64)
+        if len(x) < self.min_length:
+            return x.copy()
+        out = _centered(x, self.window, lambda windows, current: windows.mean(axis=1))
+        return round_array(out, self.ndigits) if self.ndigits is not None else out
+
+    def causal(self, data):
+        stream = self.stream()
+        stream.extend(data)
+        return stream.output
+
+    def stream(self):
+        return MovingAverageStream(self)
+
+
+class SavitzkyGolay(Filter):
+    # Khớp đa thức bậc polyorder trên cửa sổ window điểm (window lẻ) bằng bình phương tối thiểu.
+    # Hệ số tích chập tính sẵn một lần; hai đầu dùng đa thức khớp trên window điểm đầu/cuối
+    # (như mode="interp" của scipy.signal.savgol_filter). Ít hơn window điểm thì trả về dữ liệu thô.
+    name = "savgol"
+    zero_phase = True
+
+    def __init__(self, window=11, polyorder=3):
+        if window % 2 == 0 or window <= polyorder:
+            raise ValueError("window phải lẻ và lớn hơn polyorder")
+        self.window = int(window)
+        self.polyorder = int(polyorder)
+        self.params = {"window": window, "polyorder": polyorder}
+        half = self.window // 2
+        positions = np.arange(-half, half + 1, dtype=np.float64)
+        vander = positions[:, None] ** np.arange(self.polyorder + 1)
+        fit = np.linalg.pinv(vander)
+        # evaluate[j] @ x[i - half : i + half + 1] = giá trị đa thức khớp tại vị trí j của cửa sổ
+        self.evaluate = vander @ fit
+        self.coefficients = self.evaluate[half]   # điểm giữa (batch)
+        self.causal_coefficients = self.evaluate[-1]   # điểm cuối (causal)
+
+    def apply(self, data):
+        x = np.asarray(data, dtype=np.float64)
+        if len(x) < self.window:
+            return x.copy()
+        half = self.window // 2
+        out = np.empty(len(x))
+        out[half:len(x) - half] = sliding_window_view(x, self.window) @ self.coefficients
+        out[:half] = self.evaluate[:half] @ x[:self.window]
+        out[len(x) - half:] = self.evaluate[half + 1:] @ x[len(x) - self.window:]
+        return out
+
+    def causal(self, data):
+        x = np.asarray(data, dtype=np.float64)
+        out = x.copy()
+        if len(x) >= self.window:
+            out[self.window - 1:] = sliding_window_view(x, self.window) @ self.causal_coefficients
+        return out
+
+    def incremental(self):
+        return SavgolTailStream(self)
+
+
+class MedianFilter(Filter):
+    name = "median"
+    zero_phase = True
+
+    def __init__(self, window=5):
+        self.window = int(window)
+        self.params = {"window": window}
+
+    @staticmethod
+    def _reduce(windows, current):
+        return np.median(windows, axis=1)
+
+    def apply(self, data):
+        return _centered(data, self.window, self._reduce)
+
+    def causal(self, data):
+        return _trailing(data, self.window, self._reduce)
+
+
+class HampelFilter(Filter):
+    # Điểm lệch khỏi median của cửa sổ quá n_sigmas * (1.4826 * MAD) bị thay bằng median; còn lại giữ nguyên
+    name = "hampel"
+    zero_phase = True
+
+    def __init__(self, window=7, n_sigmas=3.0):
+        self.window = int(window)
+        self.n_sigmas = float(n_sigmas)
+        self.params = {"window": window, "n_sigmas": n_sigmas}
+
+    def _reduce(self, windows, current):
+        median = np.median(windows, axis=1)
+        mad = 1.4826 * np.median(np.abs(windows - median[:, None]), axis=1)
+        return np.where(np.abs(current - median) > self.n_sigmas * mad, median, current)
+
+    def apply(self, data):
+        return _centered(data, self.window, self._reduce)
+
+    def causal(self, data):
+        return _trailing(data, self.window, self._reduce)
+
+
+class Butterworth(Filter):
+    # Thông thấp bậc order, cutoff là tần số cắt chuẩn hóa theo Nyquist (0..1).
+    # Batch: sosfiltfilt (lọc xuôi + ngược, không lệch pha); luồng: sosfilt giữ trạng thái.
+    name = "butterworth"
+    zero_phase = True
+
+    def __init__(self, order=2, cutoff=0.1):
+        from scipy import signal
+        self.signal = signal
+        self.order = int(order)
+        self.cutoff = float(cutoff)
+        self.params = {"order": order, "cutoff": cutoff}
+        self.sos = signal.butter(self.order, self.cutoff, output="sos")
+        self.padlen = 3 * (2 * len(self.sos) + 1)
+
+    def apply(self, data):
+        x = np.asarray(data, dtype=np.float64)
+        if len(x) < 2:
+            return x.copy()
+        return self.signal.sosfiltfilt(self.sos, x, padlen=min(self.padlen, len(x) - 1))
+
+    def causal(self, data):
+        stream = self.stream()
+        stream.extend(data)
+        return stream.output
+
+    def stream(self):
+        return ButterworthStream(self)
+
+
+FILTERS = {
+    "moving_average": MovingAverage,
+    "savgol": SavitzkyGolay,
+    "median": MedianFilter,
+    "hampel": HampelFilter,
+    "butterworth": Butterworth,
+}
+
+
+# ==== BỘ LỌC THEO KỸ THUẬT ====
+# Mặc định giữ đúng cách làm mượt trước đây của từng kỹ thuật
+TECHNIQUE_FILTERS = {
+    "dpv": ("moving_average", {"window": 3, "min_length": 3}),
+    "swv": ("moving_average", {"window": 3, "ndigits": 3, "min_length": 3, "recursive": True}),
+    "cv": ("moving_average", {"window": 3, "ndigits": 3}),
+    "eis_3e_bode": ("moving_average", {"window": 3, "ndigits": 3}),
+    "eis_3e_nyquist": ("savgol", {"window": 11, "polyorder": 3}),
+    "eis_2e_bode": ("moving_average", {"window": 3, "centered": True, "min_length": 3}),
+    "eis_2e_nyquist": ("moving_average", {"window": 3, "ndigits": 3}),
+}
+
+
+def make_filter(name, **params):
+    if name not in FILTERS:
+        raise ValueError(f"Không có bộ lọc {name} (chọn: {', '.join(FILTERS)})")
+    return FILTERS[name](**params)
+
+
+def technique_filter(key):
+    name, params = TECHNIQUE_FILTERS[key]
+    return make_filter(name, **params)
+
+
+def set_technique_filter(key, name, **params):
+    if key not in TECHNIQUE_FILTERS:
+        raise ValueError(f"Không có kỹ thuật {key} (chọn: {', '.join(TECHNIQUE_FILTERS)})")
+    make_filter(name, **params)  # báo lỗi tham số ngay
+    TECHNIQUE_FILTERS[key] = (name, params)
+
+
+def _parse_value(text):
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    if text.lower() in ("true", "false"):
+        return text.lower() == "true"
+    return None if text.lower() == "none" else text
+
+
+def parse_spec(spec):
+    # "savgol:window=9,polyorder=2" -> ("savgol", {"window": 9, "polyorder": 2})
+    name, _, options = spec.partition(":")
+    params = {}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        params[key.strip()] = _parse_value(value.strip())
+    return name.strip(), params
@@ -0,0 +1,104 @@
+# Đọc nhanh file CSV xuất từ chương trình (mọi kỹ thuật, cả CSV chuyển từ file phiên đo).
+# Bố cục chung: các dòng tham số ["Tên", giá trị, "[đơn vị]"] (có thể xen dòng trống) | hàng tên cột | dữ liệu số
+#   DPV/SWV: 5 dòng tham số, CV: 4, CA: 3 + 2 dòng trống, EIS: chỉ có hàng tên cột
+# Bố cục tự nhận ra: hàng tên cột là dòng không trống cuối cùng trước dòng đầu tiên có ô đầu là số.
+# Phần số đọc một lượt bằng bộ đọc C của pandas theo từng khối IMPORT_CHUNK dòng và ghi thẳng vào
+# bộ đệm float64: bộ nhớ dùng = dữ liệu + một khối (không giữ list dòng / chuỗi của cả file).
+import csv
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import buffers
+
+# Số dòng mỗi khối khi đọc phần số
+IMPORT_CHUNK = 200_000
+# Số dòng đầu file tối đa được coi là phần tham số
+HEADER_LINES = 64
+
+
+def is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
+class CsvExport:
+    def __init__(self, path):
+        self.path = path
+        rows = []
+        with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+            self.skip = 0
+            for line in f:
+                row = next(csv.reader([line]), [])
+                if row and is_number(row[0].strip()):
+                    break
+                rows.append(row)
+                self.skip += 1
+                if self.skip > HEADER_LINES:
+                    raise ValueError("Không tìm thấy dữ liệu số trong file")
+        while rows and not any(cell.strip() for cell in rows[-1]):
+            rows.pop()
+        self.columns = tuple(cell.strip() for cell in rows.pop()) if rows else ()
+        self.header_rows = rows
+
+    def parameter(self, name, default=None):
+        # Giá trị trong các dòng tham số ["Tên", giá trị, "[đơn vị]"]
+        for row in self.header_rows:
+            if len(row) >= 2 and row[0].strip() == name:
+                return row[1].strip()
+        return default
+
+    def column_index(self, column):
+        # Cột theo tên (phải có) hoặc theo vị trí
+        if isinstance(column, str):
+            if column not in self.columns:
+                raise ValueError(f"File không có cột {column}")
+            return self.columns.index(column)
+        return column
+
+    def chunks(self, usecols=None, required=None, size=IMPORT_CHUNK):
+        # Các khối float64 (dòng x cột theo usecols); cột không có trong file là NaN.
+        # Dòng thiếu giá trị ở required cột đầu (mặc định: mọi cột) bị bỏ.
+        if usecols is None:
+            usecols = range(len(self.columns))
+        index = [self.column_index(c) for c in usecols]
+        required = len(index) if required is None else required
+        width = max(len(self.columns), 1)
+        reader = pd.read_csv(self.path, header=None, skiprows=self.skip, usecols=range(width), names=range(width),
+                             dtype=np.float64, chunksize=size, encoding="utf-8", encoding_errors="replace")
+        with reader:
+            for frame in reader:
+                values = frame.to_numpy(dtype=np.float64)
+                block = np.full((len(values), len(index)), np.nan)
+                for j, i in enumerate(index):
+                    if i < width:
+                        block[:, j] = values[:, i]
+                if required:
+                    block = block[~np.isnan(block[:, :required]).any(axis=1)]
+                yield block
+
+    def read_into(self, buffer, usecols=None, required=None):
+        # Nối dữ liệu vào bộ đệm có sẵn (SampleBuffer, LongRunBuffer...) theo từng khối
+        for block in self.chunks(usecols, required):
+            buffer.extend(*block.T)
+        return buffer
+
+    def read(self, usecols=None, required=None):
+        names = [str(c) for c in (usecols if usecols is not None else self.columns)]
+        return self.read_into(buffers.SampleBuffer(names), usecols, required)
+
+    @property
+    def complete(self):
+        return True
+
+    def close(self):
+        pass
+
+    def export_csv(self, path):
+        # Xuất lại dữ liệu đã nhập: chép nguyên file gốc
+        if path != self.path:
+            shutil.copyfile(self.path, path)
@@ -0,0 +1,140 @@
+# Kiểm tra Kramers–Kronig (Lin-KK, Schönleber 2014) cho một lần quét EIS.
+# Mô hình: Z = R0 + jwL + 1/(jwC) + sum R_k / (1 + jw tau_k), tau_k cách đều theo log trong [1/w_max, 1/w_min]
+# (tụ nối tiếp cho phần đuôi tần số thấp: Warburg, điện cực chặn).
+# Mô hình tuyến tính theo (R0, L, 1/C, R_k) nên mỗi M chỉ cần một lần bình phương tối thiểu (phần thực và ảo
+# xếp chồng, trọng số 1/|Z|). Ma trận thiết kế chỉ phụ thuộc lưới tần số và M nên được tính một lần cho mỗi lưới
+# và dùng lại cho mọi lần quét cùng lưới.
+# Số phần tử M chọn theo tiêu chí μ (Schönleber): tăng M cho tới khi μ < MU_LIMIT (bắt đầu quá khớp).
+# Phần dư tương đối theo từng tần số (Z - Z_kk) / |Z|: phổ thỏa KK (tuyến tính, ổn định, nhân quả) cho phần dư
+# cỡ nhiễu đo; phần dư lớn hoặc có xu hướng = phép đo trôi / không ổn định. Đạt / không đạt theo RMS phần dư
+# (một điểm nhiễu lẻ không làm cả lần quét bị đánh dấu).
+#
+#   result = kk.check(freqs, z)
+#   result.residuals_real, result.residuals_imag, result.rms_residual, result.valid
+import numpy as np
+
+# Số phần tử RC nhỏ nhất thử: ELEMENTS_PER_DECADE mỗi decade tần số, ít nhất MIN_ELEMENTS
+# (μ không tin được khi M còn nhỏ); lớn nhất giới hạn theo số điểm (tránh khớp cả nhiễu)
+ELEMENTS_PER_DECADE = 5
+MIN_ELEMENTS = 10
+# Dừng tăng M khi μ nhỏ hơn giá trị này
+MU_LIMIT = 0.85
+# RMS phần dư tương đối (phần thực và ảo) lớn nhất để coi là thỏa KK; nhiễu 1% |Z| (như bộ mô phỏng) đã cho
+# RMS cỡ 1% nên giới hạn gấp đôi mức đó
+KK_LIMIT = 0.02
+# Số ma trận thiết kế giữ lại
+DESIGN_CACHE = 32
+# Các cột R0, L, 1/C đứng trước các phần tử RC
+BASE_COLUMNS = 3
+
+_designs = {}
+
+
+def max_elements(freqs):
+    return max(1, (len(freqs) - BASE_COLUMNS) // 2)
+
+
+def min_elements(freqs):
+    decades = np.log10(freqs.max() / freqs.min())
+    return int(min(max(np.ceil(decades * ELEMENTS_PER_DECADE), MIN_ELEMENTS), max_elements(freqs)))
+
+
+def design_matrix(freqs, m):
+    # Ma trận [phần thực; phần ảo] (2N x (3 + M)) của các cột R0, L, 1/C, R_1..R_M (chưa nhân trọng số)
+    freqs = np.ascontiguousarray(freqs, dtype=np.float64)
+    key = (freqs.tobytes(), m)
+    design = _designs.get(key)
+    if design is None:
+        omega = 2 * np.pi * freqs
+        taus = np.geomspace(1 / omega.max(), 1 / omega.min(), m) if m > 1 else np.array([1 / np.sqrt(omega.max() * omega.min())])
+        wt = omega[:, None] * taus[None, :]
+        d = 1 / (1 + wt * wt)
+        n = len(freqs)
+        design = np.zeros((2 * n, BASE_COLUMNS + m))
+        design[:n, 0] = 1
+        design[n:, 1] = omega
+        design[n:, 2] = -1 / omega
+        design[:n, BASE_COLUMNS:] = d
+        design[n:, BASE_COLUMNS:] = -wt * d
+        if len(_designs) >= DESIGN_CACHE:
+            _designs.clear()
+        _designs[key] = design
+    return design
+
+
+class KKResult:
+    def __init__(self, freqs, z, fitted, coefficients, limit):
+        self.freqs = freqs
+        self.fitted = fitted
+        magnitude = np.abs(z)
+        self.residuals_real = (z.real - fitted.real) / magnitude
+        self.residuals_imag = (z.imag - fitted.imag) / magnitude
+        self.coefficients = coefficients
+        self.limit = limit
+
+    @property
+    def elements(self):
+        return len(self.coefficients) - BASE_COLUMNS
+
+    @property
+    def mu(self):
+        # Chỉ số quá khớp: 1 - sum|R_k âm| / sum R_k dương (gần 0 = quá nhiều phần tử)
+        r = self.coefficients[BASE_COLUMNS:]
+        positive = r[r > 0].sum()
+        return float(1 - np.abs(r[r < 0]).sum() / positive) if positive > 0 else 0.0
+
+    @property
+    def rms_residual(self):
+        if len(self.freqs) == 0:
+            return np.inf
+        return float(np.sqrt((np.mean(self.residuals_real ** 2) + np.mean(self.residuals_imag ** 2)) / 2))
+
+    @property
+    def max_residual(self):
+        if len(self.freqs) == 0:
+            return np.inf
+        return float(max(np.abs(self.residuals_real).max(), np.abs(self.residuals_imag).max()))
+
+    @property
+    def valid(self):
+        return self.rms_residual <= self.limit
+
+    def bad_frequencies(self):
+        # Các tần số có phần dư vượt giới hạn
+        bad = (np.abs(self.residuals_real) > self.limit) | (np.abs(self.residuals_imag) > self.limit)
+        return self.freqs[bad]
+
+    def describe(self):
+        state = "đạt" if self.valid else f"KHÔNG ĐẠT ({len(self.bad_frequencies())} điểm)"
+        return (f"KK: dư RMS {100 * self.rms_residual:.2f}% (max {100 * self.max_residual:.2f}%)  "
+                f"M={self.elements}  μ={self.mu:.2f}  {state}")
+
+
+def solve(freqs, z, m, limit=KK_LIMIT):
+    # Một lần bình phương tối thiểu với M = m phần tử RC
+    design = design_matrix(freqs, m)
+    weight = 1 / np.abs(z)
+    w2 = np.concatenate([weight, weight])
+    coefficients = np.linalg.lstsq(design * w2[:, None], np.concatenate([z.real, z.imag]) * w2, rcond=None)[0]
+    model = design @ coefficients
+    n = len(freqs)
+    return KKResult(freqs, z, model[:n] + 1j * model[n:], coefficients, limit)
+
+
+def check(freqs, z, elements=None, limit=KK_LIMIT):
+    # Kiểm tra Lin-KK cho phổ (freqs, z); bỏ các điểm không hữu hạn. elements: M cố định (mặc định chọn theo μ)
+    freqs = np.asarray(freqs, dtype=np.float64)
+    z = np.asarray(z, dtype=np.complex128)
+    valid = np.isfinite(freqs) & np.isfinite(z) & (freqs > 0) & (np.abs(z) > 0)
+    if not valid.all():
+        freqs, z = freqs[valid], z[valid]
+    if len(freqs) < 4:
+        raise ValueError("Không đủ điểm để kiểm tra KK")
+    if elements is not None:
+        return solve(freqs, z, elements, limit)
+    top = max_elements(freqs)
+    for m in range(min_elements(freqs), top + 1):
+        result = solve(freqs, z, m, limit)
+        if result.mu < MU_LIMIT:
+            break
+    return result
@@ -12,13 +12,29 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolb
 import csv
 import math
 import pandas as pd
-from scipy.signal import savgol_filter
 import tkinter.font as tkFont
+import queue
+import sys
+import tempfile
+import acquisition
+import buffers
+import circuits
+import connection
+import cycles
+import filters
+import importer
+import kk
+import peaks
+import render
+import session
+
+# Chu kỳ (ms) GUI lấy dữ liệu từ hàng đợi của luồng đọc serial
+SERIAL_POLL_MS = 50
 # Chuyển toàn bộ code SWV thành một class SWVApp đầy đủ và sẵn sàng nhúng vào frame
 
 # DPV
 class DPVApp:
-    def __init__(self, parent):
+    def __init__(self, parent, serial_manager=None):
         import tkinter as tk
         from tkinter import ttk, messagebox, filedialog
         import serial
@@ -35,11 +51,14 @@ class DPVApp:
         self.filedialog = filedialog
         self.ttk = ttk
 
+        # Cổng serial dùng chung giữa các tab; self.ser là kênh được thuê trong lúc đo
+        self.serial_manager = serial_manager or connection.SerialManager()
         self.ser = None
         self.is_measuring = False
-        self.bufferV = []
-        self.bufferI = []
-        self.bufferIfilter = []
+        # Dữ liệu nằm trong bộ đệm cột NumPy; bufferV / bufferI / bufferIfilter là view của nó
+        self.dpv = acquisition.DPVStream()
+        # File phiên đo (session.py): mẫu được ghi ra đĩa ngay khi nhận
+        self.session = None
 
         self.parent = parent
 
@@ -102,7 +121,7 @@ class DPVApp:
 
         # Program Control
         tk.Label(control_panel, text="Program Control", font=("Segoe UI", 15, "bold"), fg="#388E3C", bg=bg_color).pack(anchor="w", pady=(12, 5))
-        ttk.Button(control_panel, text="\u25B6\ufe0f Measure", command=lambda: threading.Thread(target=self.start_measurement).start(), style="DPV.TButton").pack(fill="x", pady=3)
+        ttk.Button(control_panel, text="\u25B6\ufe0f Measure", command=self.start_measurement, style="DPV.TButton").pack(fill="x", pady=3)
         ttk.Button(control_panel, text="🧹 Clear Data", command=self.clear_all, style="DPV.TButton").pack(fill="x", pady=3)
         ttk.Button(control_panel, text="\U0001F4C2 Import CSV", command=self.import_from_csv, style="DPV.TButton").pack(fill="x", pady=3)
         ttk.Button(control_panel, text="\U0001F4BE Export CSV", command=self.export_to_csv, style="DPV.TButton").pack(fill="x", pady=3)
@@ -115,6 +134,16 @@ class DPVApp:
         self.amp_entry = self.add_labeled_entry("Pulse Amplitude (mV)", 50, font=("Segoe UI", 12, "bold"), parent=control_panel)
         self.width_entry = self.add_labeled_entry("Pulse Width (ms)", 50, font=("Segoe UI", 12, "bold"), parent=control_panel)
 
+        # Peak analysis
+        tk.Label(control_panel, text="Peak Analysis", font=("Segoe UI", 15, "bold"), fg="#6A1B9A", bg=bg_color).pack(anchor="w", pady=(10, 4))
+        self.baseline_combo = ttk.Combobox(control_panel, values=peaks.BASELINES, state="readonly", font=("Segoe UI", 12, "bold"), width=14)
+        self.baseline_combo.set("linear")
+        self.baseline_combo.pack(fill="x", pady=3)
+        ttk.Button(control_panel, text="\U0001F50D Find Peaks", command=self.analyze_peaks, style="DPV.TButton").pack(fill="x", pady=3)
+        ttk.Button(control_panel, text="\U0001F4C1 Batch Peaks", command=self.batch_peaks, style="DPV.TButton").pack(fill="x", pady=3)
+        self.peak_label = tk.Label(control_panel, text="", font=("Segoe UI", 11, "bold"), bg=bg_color, justify="left", anchor="w")
+        self.peak_label.pack(fill="x", pady=3)
+
         # ========== Plot Area ==========
         self.frame_right = tk.Frame(main_content, bg=bg_color)
         self.frame_right.pack(side="right", expand=True, fill="both", padx=10, pady=10)
@@ -137,6 +166,7 @@ class DPVApp:
             label.set_fontsize(18)
             label.set_fontweight('bold')
             label.set_color("#000000")
+        self.create_plot_lines()
         self.canvas.draw()
 
     def add_labeled_entry(self, label, default, font=("Segoe UI", 14, "bold"), parent=None):
@@ -174,29 +204,68 @@ class DPVApp:
     def connect_serial(self):
         try:
             port = self.port_combo.get()
-            self.ser = self.serial.Serial(port, 115200, timeout=1)
+            self.serial_manager.connect(port)
             self.messagebox.showinfo("COM", f"Kết nối {port} thành công!")
         except Exception as e:
             self.messagebox.showerror("Lỗi COM", str(e))
 
     def disconnect_serial(self):
-        if self.ser and self.ser.is_open:
-            self.ser.close()
+        if self.serial_manager.is_open:
+            self.serial_manager.disconnect()
             self.messagebox.showinfo("COM", "Đã ngắt kết nối!")
 
+    @property
+    def bufferV(self):
+        return self.dpv.bufferV
+
+    @property
+    def bufferI(self):
+        return self.dpv.bufferI
+
+    @property
+    def bufferIfilter(self):
+        return self.dpv.bufferIfilter
+
     def clear_all(self):
-        self.bufferV.clear()
-        self.bufferI.clear()
-        self.bufferIfilter.clear()
-        self.ax.cla()
+        self.dpv.clear()
+        self.trace_raw.set_data([], [])
+        self.trace_filtered.set_data([], [])
+        self.line_peaks.set_data([], [])
+        self.peak_label.config(text="")
+        self.legend.set_visible(False)
         self.ax.set_title("Differential Pulse Voltammetry", fontsize=18, fontweight="bold", color="#0288D1")
         self.ax.set_xlabel("Voltage (mV)", fontsize=18)
         self.ax.set_ylabel("Current (μA)", fontsize=18)
         self.ax.grid(True)
-        self.canvas.draw()
+        self.blit.redraw()
+
+    def analyze_peaks(self):
+        # Đỉnh trên dòng đã lọc (tự nhận chiều đỉnh), đánh dấu trên đồ thị
+        self.peak_table = peaks.find_peaks(self.bufferV, self.bufferIfilter, method=self.baseline_combo.get(), polarity="auto")
+        index = self.peak_table["index"].astype(int)
+        self.line_peaks.set_data(self.bufferV[index], self.bufferIfilter[index])
+        self.peak_label.config(text=peaks.describe(self.peak_table) if len(self.bufferV) else "")
+        self.blit.update()
+
+    def batch_peaks(self):
+        # Tìm đỉnh cho mọi file CSV xuất DPV trong một thư mục, ghi bảng kết quả ra CSV
+        directory = self.filedialog.askdirectory()
+        if not directory:
+            return
+        file_path = self.filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")],
+                                                      initialfile="peaks.csv")
+        if not file_path:
+            return
+        try:
+            files, table = peaks.analyze_directory(directory, technique="dpv", method=self.baseline_combo.get(),
+                                                   polarity="auto")
+            peaks.write_table(file_path, files, table)
+            self.messagebox.showinfo("Thành công", f"{len(files)} file, {len(table)} đỉnh:\n{file_path}")
+        except Exception as e:
+            self.messagebox.showerror("Lỗi", str(e))
 
     def export_to_csv(self):
-        if not self.bufferV:
+        if len(self.bufferV) == 0:
             self.messagebox.showwarning("Cảnh báo", "Không có dữ liệu để xuất!")
             return
 
@@ -213,12 +282,7 @@ class DPVApp:
                 writer.writerow(["Pulse Amplitude", self.amp_entry.get(), "[mV]"])
                 writer.writerow(["Pulse Width", self.width_entry.get(), "[ms]"])
                 writer.writerow(["Voltage (mV)", "Current (μA)", "Filtered (μA)"])
-                for i in range(len(self.bufferV)):
-                    writer.writerow([
-                        self.bufferV[i],
-                        self.bufferI[i],
-                        self.bufferIfilter[i] if i < len(self.bufferIfilter) else ""
-                    ])
+                writer.writerows(zip(self.bufferV.tolist(), self.bufferI.tolist(), self.bufferIfilter.tolist()))
             import os
             image_path = os.path.splitext(file_path)[0] + "_plot.png"
             self.fig.savefig(image_path, bbox_inches='tight', dpi=300)
@@ -232,25 +296,26 @@ class DPVApp:
             return
 
         try:
-            with open(file_path, mode='r') as file:
-                reader = csv.reader(file)
-                rows = list(reader)
-                self.clear_all()
-                for row in rows[5:]:
-                    if len(row) >= 2:
-                        self.bufferV.append(float(row[0]))
-                        self.bufferI.append(float(row[1]))
-                        if len(row) > 2 and row[2]:
-                            self.bufferIfilter.append(float(row[2]))
-                self.draw_graph()
-                self.messagebox.showinfo("Thành công", f"Đã nhập dữ liệu từ file:\n{file_path}")
+            # Cột lọc có thể thiếu (CSV chuyển từ file phiên đo): khi đó tự lọc lại
+            data = importer.CsvExport(file_path).read((0, 1, 2), required=2)
+            self.clear_all()
+            self.dpv.load(*(data[c] for c in data.columns))
+            self.draw_graph()
+            self.analyze_peaks()
+            self.messagebox.showinfo("Thành công", f"Đã nhập dữ liệu từ file:\n{file_path}")
         except Exception as e:
             self.messagebox.showerror("Lỗi", f"Lỗi khi đọc file:\n{str(e)}")
 
     def start_measurement(self):
-        if not self.ser or not self.ser.is_open:
+        if not self.serial_manager.is_open:
             self.messagebox.showerror("COM", "Chưa kết nối cổng COM!")
             return
+        if self.is_measuring:
+            return
+        self.ser = self.serial_manager.try_acquire(self.__class__.__name__)
+        if self.ser is None:
+            self.messagebox.showwarning("COM", f"Cổng COM đang được {self.serial_manager.owner} sử dụng!")
+            return
 
         try:
             s_vol = int(self.start_entry.get())
@@ -259,55 +324,77 @@ class DPVApp:
             amp = int(self.amp_entry.get())
             width = int(self.width_entry.get())
 
-            num_samples = ((e_vol - s_vol) // step) + 1
-            cmd = f"7#{s_vol}?{e_vol}/{step}|{amp}${width}!"
+            num_samples = acquisition.dpv_num_samples(s_vol, e_vol, step)
+            cmd = acquisition.dpv_command(s_vol, e_vol, step, amp, width)
             print("Gửi lệnh:", cmd)
             self.ser.write(cmd.encode())
-
-            self.is_measuring = True
-            serial_lines = []
-
-            while True:
-                line = self.ser.readline().decode().strip()
-                if line == "END":
-                    break
-                if ";" in line:
-                    serial_lines.append(line)
-                # Nếu nhận đủ num_samples thì cũng có thể break (phòng trường hợp ESP không gửi END)
-                if len(serial_lines) >= num_samples:
-                    break
-
-            self.dpv_data_process(serial_lines)
-            self.draw_graph()
-
         except Exception as e:
+            self.ser.release()
             self.messagebox.showerror("Lỗi đo", str(e))
-        finally:
-            self.is_measuring = False
+            return
+
+        # Đọc serial trên luồng nền, GUI lấy dữ liệu qua after() nên không bị treo
+        self.is_measuring = True
+        self.serial_lines = []
+        # Chỉ xử lý và làm mượt các dòng mới ở mỗi lần cập nhật
+        self.dpv = acquisition.DPVStream()
+        self.session = session.open_session("dpv", [
+            ["Start Voltage", s_vol, "[mV]"],
+            ["End Voltage", e_vol, "[mV]"],
+            ["Step", step, "[mV]"],
+            ["Pulse Amplitude", amp, "[mV]"],
+            ["Pulse Width", width, "[ms]"],
+        ], ["Voltage (mV)", "Current (μA)"])
+        self.serial_queue = queue.Queue()
+        self.reader = acquisition.SerialReader(self.ser, self.serial_queue, max_lines=num_samples)
+        self.reader.start()
+        self.parent.after(SERIAL_POLL_MS, self.poll_serial)
+
+    def poll_serial(self):
+        lines, finished = acquisition.drain_queue(self.serial_queue)
+        self.serial_lines.extend(lines)
+        if lines or finished:
+            count = len(self.bufferV)
+            self.dpv.feed(lines)
+            if self.session is not None:
+                self.session.extend(self.bufferV[count:], self.bufferI[count:])
+            if finished:
+                self.dpv.finish()
+            self.draw_graph(live=not finished)
+            if finished:
+                self.analyze_peaks()
+        if not finished:
+            self.parent.after(SERIAL_POLL_MS, self.poll_serial)
+            return
+        self.is_measuring = False
+        self.ser.release()
+        if self.session is not None:
+            self.session.close()
+        if self.reader.error is not None:
+            self.messagebox.showerror("Lỗi đo", str(self.reader.error))
+        elif self.reader.timed_out:
+            self.messagebox.showwarning("Lỗi đo", f"Thiết bị ngừng gửi dữ liệu, đã nhận {len(self.serial_lines)} điểm.")
 
     def smoothing_data_dpv(self, data):
-        if len(data) < 3:
-            return data
-        result = [data[0], (data[0] + data[1]) / 2]
-        for i in range(2, len(data)):
-            result.append((data[i] + data[i - 1] + data[i - 2]) / 3)
-        return result
+        return filters.technique_filter("dpv").apply(data)
 
     def dpv_data_process(self, serial_lines):
-        self.bufferV.clear()
-        self.bufferI.clear()
-        self.bufferIfilter.clear()
-        for line in serial_lines:
-            try:
-                voltage, current = line.split(";")
-                self.bufferV.append(float(voltage))
-                self.bufferI.append(float(current))
-            except:
-                continue
-        self.bufferIfilter = self.smoothing_data_dpv(self.bufferI)
-
-    def draw_graph(self):
-        self.ax.cla()
+        self.dpv = acquisition.DPVStream()
+        self.dpv.feed(serial_lines)
+
+    def create_plot_lines(self):
+        # Đường vẽ cố định: mỗi lần cập nhật chỉ set_data rồi blit
+        self.line_raw, = self.ax.plot([], [], label="Raw", color="red")
+        self.line_filtered, = self.ax.plot([], [], label="Filtered", color="black")
+        self.line_peaks, = self.ax.plot([], [], "v", label="Peaks", color="#6A1B9A", markersize=10)
+        self.legend = self.ax.legend()
+        self.legend.set_visible(False)
+        self.blit = render.BlitManager(self.canvas, [self.line_raw, self.line_filtered, self.line_peaks])
+        # Chỉ đưa cho matplotlib số điểm cỡ độ phân giải màn hình
+        self.trace_raw = render.DecimatedLine(self.line_raw)
+        self.trace_filtered = render.DecimatedLine(self.line_filtered)
+
+    def style_graph(self):
         self.fig.patch.set_facecolor("#E1F5FE")
         self.ax.set_facecolor('white')
         self.ax.set_title("Differential Pulse Voltammetry", fontsize=18, fontweight="bold", color="#0288D1")
@@ -319,27 +406,29 @@ class DPVApp:
             label.set_fontweight('bold')
             label.set_color("#0288D1")
         self.ax.grid(True, linewidth=1.5)
+
+    def draw_graph(self, live=False):
+        # live=True: đang đo, chỉ vẽ lại toàn bộ khi dữ liệu vượt ra ngoài trục
+        self.trace_raw.set_data(self.bufferV, self.bufferI)
+        self.trace_filtered.set_data(self.bufferV, self.bufferIfilter)
+        changed = not live
         if len(self.bufferV) > 0:
-            self.ax.plot(self.bufferV, self.bufferI, label="Raw", color="red")
-            self.ax.plot(self.bufferV, self.bufferIfilter, label="Filtered", color="black")
-            y_min = min(self.bufferI + self.bufferIfilter)
-            y_max = max(self.bufferI + self.bufferIfilter)
-            if y_min == y_max:
-                delta = abs(y_min) * 0.1 if y_min != 0 else 1
-                y_min -= delta
-                y_max += delta
-            else:
-                y_range = y_max - y_min
-                y_min -= y_range * 0.05
-                y_max += y_range * 0.05
-            self.ax.set_xlim(min(self.bufferV), max(self.bufferV))
-            self.ax.set_ylim(y_min, y_max)
-            self.ax.legend()
-        self.canvas.draw()
+            y_min, y_max = render.padded(min(self.bufferI.min(), self.bufferIfilter.min()),
+                                         max(self.bufferI.max(), self.bufferIfilter.max()))
+            changed = render.apply_limits(self.ax, (self.bufferV.min(), self.bufferV.max()),
+                                          (y_min, y_max), live) or changed
+        if self.legend.get_visible() != (len(self.bufferV) > 0):
+            self.legend.set_visible(len(self.bufferV) > 0)
+            changed = True
+        if changed:
+            self.style_graph()
+            self.blit.redraw()
+        else:
+            self.blit.update()
 
 # SWV
 class SWVApp:
-    def __init__(self, parent):
+    def __init__(self, parent, serial_manager=None):
         import tkinter as tk
         from tkinter import ttk, messagebox, filedialog
         import matplotlib.pyplot as plt
@@ -356,13 +445,14 @@ class SWVApp:
         self.filedialog = filedialog
         self.ttk = ttk
 
+        # Cổng serial dùng chung giữa các tab; self.ser là kênh được thuê trong lúc đo
+        self.serial_manager = serial_manager or connection.SerialManager()
         self.ser = None
         self.is_measuring = False
-        self.bufferVSW = []
-        self.bufferCnet = []
-        self.bufferCf = []
-        self.bufferCb = []
-        self.bufffil = []
+        # Dữ liệu nằm trong bộ đệm cột NumPy; bufferVSW / bufferCnet / ... là view của nó
+        self.swv = acquisition.SWVStream()
+        # File phiên đo (session.py): mẫu được ghi ra đĩa ngay khi nhận
+        self.session = None
 
 
         self.parent = parent
@@ -426,7 +516,7 @@ class SWVApp:
 
         # Program Control
         tk.Label(control_panel, text="Program Control", font=("Segoe UI", 15, "bold"), fg="#388E3C", bg="#94F1C6").pack(anchor="w", pady=(12, 5))
-        ttk.Button(control_panel, text="\u25B6\ufe0f Measure", command=lambda: threading.Thread(target=self.start_measurement).start(), style="SWV.TButton").pack(fill="x", pady=3)
+        ttk.Button(control_panel, text="\u25B6\ufe0f Measure", command=self.start_measurement, style="SWV.TButton").pack(fill="x", pady=3)
         ttk.Button(control_panel, text="🧹 Clear Data", command=self.clear_all, style="SWV.TButton").pack(fill="x", pady=3)
         ttk.Button(control_panel, text="\U0001F4C2 Import CSV", command=self.import_from_csv, style="SWV.TButton").pack(fill="x", pady=3)
         ttk.Button(control_panel, text="\U0001F4BE Export CSV", command=self.export_to_csv, style="SWV.TButton").pack(fill="x", pady=3)
@@ -439,6 +529,16 @@ class SWVApp:
         self.amp_entry = self.add_labeled_entry("Amplitude (mV)", 25, font=("Segoe UI", 12, "bold"), parent=control_panel)
         self.freq_entry = self.add_labeled_entry("Frequency (Hz)", 10, font=("Segoe UI", 12, "bold"), parent=control_panel)
 
+        # Peak analysis
+        tk.Label(control_panel, text="Peak Analysis", font=("Segoe UI", 15, "bold"), fg="#6A1B9A", bg="#94F1C6").pack(anchor="w", pady=(10, 4))
+        self.baseline_combo = ttk.Combobox(control_panel, values=peaks.BASELINES, state="readonly", font=("Segoe UI", 12, "bold"), width=14)
+        self.baseline_combo.set("linear")
+        self.baseline_combo.pack(fill="x", pady=3)
+        ttk.Button(control_panel, text="\U0001F50D Find Peaks", command=self.analyze_peaks, style="SWV.TButton").pack(fill="x", pady=3)
+        ttk.Button(control_panel, text="\U0001F4C1 Batch Peaks", command=self.batch_peaks, style="SWV.TButton").pack(fill="x", pady=3)
+        self.peak_label = tk.Label(control_panel, text="", font=("Segoe UI", 11, "bold"), bg="#94F1C6", justify="left", anchor="w")
+        self.peak_label.pack(fill="x", pady=3)
+
         # Sweep selection
         tk.Label(control_panel, text="Sweep Display", font=("Segoe UI", 15, "bold"), fg="#00838F", bg="#94F1C6").pack(anchor="w", pady=(10, 4))
         self.sweep_var = tk.StringVar(value="All")
@@ -473,12 +573,14 @@ class SWVApp:
             label.set_fontsize(18)
             label.set_fontweight('bold')
             label.set_color("#000000")
+        self.create_plot_lines()
         self.canvas.draw()
 
         
     def on_closing(self):
-        if self.ser and self.ser.is_open:
-            self.ser.close()
+        if self.is_measuring:
+            self.reader.stop()
+        self.serial_manager.disconnect()
         self.parent.destroy()
 
     def add_labeled_entry(self, label, default, font=("Segoe UI", 14, "bold"), parent=None):
@@ -518,33 +620,57 @@ class SWVApp:
     def connect_serial(self):
         try:
             port = self.port_combo.get()
-            self.ser = self.serial.Serial(port, 115200, timeout=1)
+            self.serial_manager.connect(port)
             self.messagebox.showinfo("COM", f"Kết nối {port} thành công!")
         except Exception as e:
             self.messagebox.showerror("Lỗi COM", str(e))
 
     def disconnect_serial(self):
-        if self.ser and self.ser.is_open:
-            self.ser.close()
+        if self.serial_manager.is_open:
+            self.serial_manager.disconnect()
             self.messagebox.showinfo("COM", "Đã ngắt kết nối!")
 
     def clear_all(self):
-        self.bufferVSW.clear()
-        self.bufferCnet.clear()
-        self.bufferCf.clear()
-        self.bufferCb.clear()
-        self.bufffil.clear()
-        self.ax.cla()
+        self.swv.clear()
+        for trace in self.traces:
+            trace.set_data([], [])
+        self.line_peaks.set_data([], [])
+        self.peak_label.config(text="")
         # Tăng kích thước font cho tiêu đề và nhãn trục
         self.ax.set_title("Square Wave Voltammetry", fontsize=18, fontweight="bold")  # Tăng kích thước font tiêu đề
         self.ax.set_xlabel("Voltage (mV)", fontsize=18)  # Tăng kích thước font nhãn trục X
         self.ax.set_ylabel("Current (μA)", fontsize=18)  # Tăng kích thước font nhãn trục Y
 
         self.ax.grid(True)
-        self.canvas.draw()
+        self.blit.redraw()
+
+    def analyze_peaks(self):
+        # Đỉnh trên dòng đã lọc (tự nhận chiều đỉnh), đánh dấu trên đồ thị
+        self.peak_table = peaks.find_peaks(self.bufferVSW, self.bufffil, method=self.baseline_combo.get(), polarity="auto")
+        index = self.peak_table["index"].astype(int)
+        self.line_peaks.set_data(self.bufferVSW[index], self.bufffil[index])
+        self.peak_label.config(text=peaks.describe(self.peak_table) if len(self.bufferVSW) else "")
+        self.blit.update()
+
+    def batch_peaks(self):
+        # Tìm đỉnh cho mọi file CSV xuất SWV trong một thư mục, ghi bảng kết quả ra CSV
+        directory = self.filedialog.askdirectory()
+        if not directory:
+            return
+        file_path = self.filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")],
+                                                      initialfile="peaks.csv")
+        if not file_path:
+            return
+        try:
+            files, table = peaks.analyze_directory(directory, technique="swv", method=self.baseline_combo.get(),
+                                                   polarity="auto")
+            peaks.write_table(file_path, files, table)
+            self.messagebox.showinfo("Thành công", f"{len(files)} file, {len(table)} đỉnh:\n{file_path}")
+        except Exception as e:
+            self.messagebox.showerror("Lỗi", str(e))
 
     def export_to_csv(self):
-        if not self.bufferVSW:
+        if len(self.bufferVSW) == 0:
             self.messagebox.showwarning("Cảnh báo", "Không có dữ liệu để xuất!")
             return
 
@@ -561,14 +687,8 @@ class SWVApp:
                 writer.writerow(["Amplitude", self.amp_entry.get(), "[mV]"])
                 writer.writerow(["Frequency", self.freq_entry.get(), "[Hz]"])
                 writer.writerow(["Voltage (mV)", "Net (μA)", "If (μA)", "Ib (μA)", "Filtered (μA)"])
-                for i in range(len(self.bufferVSW)):
-                    writer.writerow([
-                        self.bufferVSW[i],
-                        self.bufferCnet[i],
-                        self.bufferCf[i],
-                        self.bufferCb[i],
-                        self.bufffil[i]
-                    ])
+                writer.writerows(zip(self.bufferVSW.tolist(), self.bufferCnet.tolist(), self.bufferCf.tolist(),
+                                     self.bufferCb.tolist(), self.bufffil.tolist()))
             import os
             image_path = os.path.splitext(file_path)[0] + "_plot.png"
             self.fig.savefig(image_path, bbox_inches='tight', dpi=300)
@@ -583,101 +703,136 @@ class SWVApp:
             return
 
         try:
-            with open(file_path, mode='r') as file:
-                reader = csv.reader(file)
-                rows = list(reader)
-
-                self.spin_start.set(rows[0][1])
-                self.spin_end.set(rows[1][1])
-                self.spin_step.set(rows[2][1])
-                self.spin_amp.set(rows[3][1])
-                self.spin_freq.set(rows[4][1])
-
-                self.clear_all()
-
-                for row in rows[5:]:
-                    if len(row) >= 5:
-                        self.bufferVSW.append(float(row[0]))
-                        self.bufferCnet.append(float(row[1]))
-                        self.bufferCf.append(float(row[2]))
-                        self.bufferCb.append(float(row[3]))
-                        self.bufffil.append(float(row[4]))
+            export = importer.CsvExport(file_path)
+            data = export.read(range(5))
+            for entry, name in ((self.start_entry, "Start Voltage"), (self.end_entry, "End Voltage"),
+                                (self.step_entry, "Step"), (self.amp_entry, "Amplitude"), (self.freq_entry, "Frequency")):
+                value = export.parameter(name)
+                if value is not None:
+                    entry.delete(0, "end")
+                    entry.insert(0, value)
+
+            self.clear_all()
+            self.swv.load(*(data[c] for c in data.columns))
             self.draw_graph()
+            self.analyze_peaks()
             self.messagebox.showinfo("Thành công", f"Đã nhập dữ liệu từ file:\n{file_path}")
         except Exception as e:
             self.messagebox.showerror("Lỗi", f"Lỗi khi đọc file:\n{str(e)}")
 
     def start_measurement(self):
-        if not self.ser or not self.ser.is_open:
+        if not self.serial_manager.is_open:
             self.messagebox.showerror("COM", "Chưa kết nối cổng COM!")
             return
+        if self.is_measuring:
+            return
+        self.ser = self.serial_manager.try_acquire(self.__class__.__name__)
+        if self.ser is None:
+            self.messagebox.showwarning("COM", f"Cổng COM đang được {self.serial_manager.owner} sử dụng!")
+            return
 
         try:
             s_vol = int(self.start_entry.get())
             e_vol = int(self.end_entry.get())
             step = int(self.step_entry.get())
-            amp = int(self.amp_entry.get()) * 2
+            amp = int(self.amp_entry.get())
             freq = int(self.freq_entry.get())
 
-            temp_s_vol = s_vol
-            s_vol = -s_vol
-            e_vol = (e_vol - temp_s_vol) + s_vol
-
-            num_samples = ((e_vol - s_vol) // step) * 2
-            cmd = f"4#{s_vol}?{e_vol}/{step}|{amp}${freq}!"
+            num_samples = acquisition.swv_num_samples(s_vol, e_vol, step)
+            cmd = acquisition.swv_command(s_vol, e_vol, step, amp, freq)
             print("Gửi lệnh:", cmd)
             self.ser.write(cmd.encode())
-
-            self.is_measuring = True
-            serial_lines = []
-
-            while len(serial_lines) < num_samples:
-                line = self.ser.readline().decode().strip()
-                if ";" in line:
-                    serial_lines.append(line)
-
-            self.sw_data_process(serial_lines, s_vol, step)
-            self.draw_graph()
-
         except Exception as e:
+            self.ser.release()
             self.messagebox.showerror("Lỗi đo", str(e))
-        finally:
-            self.is_measuring = False
-
-    def smoothing_data_swv_filter(self, data):
-        if len(data) < 3:
             return
-        data[0] = data[0]
-        data[1] = round((data[0] + data[1]) / 2, 3)
-        for i in range(2, len(data)):
-            data[i] = round((data[i] + data[i - 1] + data[i - 2]) / 3, 3)
 
-    def sw_data_process(self, serial_lines, s_vol, step):
-        self.bufferVSW.clear()
-        self.bufferCf.clear()
-        self.bufferCb.clear()
-        self.bufferCnet.clear()
-        self.bufffil.clear()
-
-        for i in range(0, len(serial_lines) - 1, 2):
-            try:
-                index1, current1 = serial_lines[i].split(";")
-                index2, current2 = serial_lines[i + 1].split(";")
-                current1 = float(current1)
-                current2 = float(current2)
-                voltage = s_vol + (i // 2) * step
-                self.bufferVSW.append(voltage)
-                self.bufferCf.append(current1)
-                self.bufferCb.append(current2)
-                self.bufferCnet.append(current1 - current2)
-                self.bufffil.append(current1 - current2)
-            except:
-                continue
-        self.smoothing_data_swv_filter(self.bufffil)
+        # Luồng nền tự dừng khi nhận END, đủ mẫu, hoặc thiết bị im lặng quá lâu
+        self.is_measuring = True
+        self.serial_lines = []
+        self.sweep_s_vol, _ = acquisition.swv_device_range(s_vol, e_vol)
+        self.sweep_step = step
+        # Chỉ xử lý và làm mượt các dòng mới ở mỗi lần cập nhật
+        self.swv = acquisition.SWVStream(self.sweep_s_vol, self.sweep_step)
+        self.session = session.open_session("swv", [
+            ["Start Voltage", s_vol, "[mV]"],
+            ["End Voltage", e_vol, "[mV]"],
+            ["Step", step, "[mV]"],
+            ["Amplitude", amp, "[mV]"],
+            ["Frequency", freq, "[Hz]"],
+        ], ["Voltage (mV)", "Net (μA)", "If (μA)", "Ib (μA)"])
+        self.serial_queue = queue.Queue()
+        self.reader = acquisition.SerialReader(self.ser, self.serial_queue, max_lines=num_samples)
+        self.reader.start()
+        self.parent.after(SERIAL_POLL_MS, self.poll_serial)
+
+    def poll_serial(self):
+        lines, finished = acquisition.drain_queue(self.serial_queue)
+        self.serial_lines.extend(lines)
+        if lines or finished:
+            count = len(self.bufferVSW)
+            self.swv.feed(lines)
+            if self.session is not None:
+                self.session.extend(self.bufferVSW[count:], self.bufferCnet[count:],
+                                    self.bufferCf[count:], self.bufferCb[count:])
+            if finished:
+                self.swv.finish()
+            self.draw_graph(live=not finished)
+            if finished:
+                self.analyze_peaks()
+        if not finished:
+            self.parent.after(SERIAL_POLL_MS, self.poll_serial)
+            return
+        self.is_measuring = False
+        self.ser.release()
+        if self.session is not None:
+            self.session.close()
+        if self.reader.error is not None:
+            self.messagebox.showerror("Lỗi đo", str(self.reader.error))
+        elif self.reader.timed_out:
+            self.messagebox.showwarning("Lỗi đo", f"Thiết bị ngừng gửi dữ liệu, đã nhận {len(self.serial_lines)} dòng.")
 
-    def draw_graph(self):
-        self.ax.cla()  # Xóa đồ thị hiện tại
+    def smoothing_data_swv_filter(self, data):
+        data[:] = filters.technique_filter("swv").apply(data)
 
+    def sw_data_process(self, serial_lines, s_vol, step):
+        self.swv = acquisition.SWVStream(s_vol, step)
+        self.swv.feed(serial_lines)
+
+    @property
+    def bufferVSW(self):
+        return self.swv.bufferVSW
+
+    @property
+    def bufferCnet(self):
+        return self.swv.bufferCnet
+
+    @property
+    def bufferCf(self):
+        return self.swv.bufferCf
+
+    @property
+    def bufferCb(self):
+        return self.swv.bufferCb
+
+    @property
+    def bufffil(self):
+        return self.swv.bufffil
+
+    def create_plot_lines(self):
+        # Đường vẽ cố định: mỗi lần cập nhật chỉ set_data rồi blit
+        self.line_net, = self.ax.plot([], [], label="Net (If - Ib)", color="red")
+        self.line_cf, = self.ax.plot([], [], label="If", color="blue")
+        self.line_cb, = self.ax.plot([], [], label="Ib", color="green")
+        self.line_fil, = self.ax.plot([], [], label="Filtered", color="black")
+        self.blit = render.BlitManager(self.canvas, [self.line_net, self.line_cf, self.line_cb, self.line_fil])
+        # Chỉ đưa cho matplotlib số điểm cỡ độ phân giải màn hình
+        self.traces = [render.DecimatedLine(line) for line in self.blit.artists]
+        self.line_peaks, = self.ax.plot([], [], "v", label="Peaks", color="#6A1B9A", markersize=10)
+        self.line_peaks.set_animated(True)
+        self.blit.artists.append(self.line_peaks)
+
+    def style_graph(self):
         # Đặt màu nền của toàn bộ khung đồ thị (fig) thành màu xanh lá cây nhạt
         self.fig.patch.set_facecolor('#90EE90')
 
@@ -697,51 +852,33 @@ class SWVApp:
             label.set_fontsize(18)
             label.set_fontweight('bold')
             label.set_color("#760FCF")
-            
-        self.canvas.draw()  # Vẽ lại đồ thị
-        # Làm cho các đường trục (trục điện thế và dòng điện) đậm lên
-        self.ax.spines['top'].set_linewidth(2)  # Đường trục trên dày lên
-        self.ax.spines['bottom'].set_linewidth(2)  # Đường trục dưới dày lên
-        self.ax.spines['left'].set_linewidth(2)  # Đường trục trái dày lên
-        self.ax.spines['right'].set_linewidth(2)  # Đường trục phải dày lên
-
-        # Đặt màu sắc các trục thành màu đen để rõ ràng hơn
-        self.ax.spines['top'].set_color('black')
-        self.ax.spines['bottom'].set_color('black')
-        self.ax.spines['left'].set_color('black')
-        self.ax.spines['right'].set_color('black')
+
+        # Làm cho các đường trục (trục điện thế và dòng điện) đậm lên và màu đen để rõ ràng hơn
+        for spine in self.ax.spines.values():
+            spine.set_linewidth(2)
+            spine.set_color('black')
 
         # Lưới đồ thị (grid)
         self.ax.grid(True, linewidth=1.5)  # Tăng độ dày lưới
 
+    def draw_graph(self, live=False):
+        # live=True: đang đo, chỉ vẽ lại toàn bộ khi dữ liệu vượt ra ngoài trục
+        for trace, current in zip(self.traces, (self.bufferCnet, self.bufferCf, self.bufferCb, self.bufffil)):
+            trace.set_data(self.bufferVSW, current)
+        changed = not live
+
         # Kiểm tra nếu có dữ liệu
-        # ...existing code...
         if len(self.bufferVSW) > 0:
-            # Vẽ các đường
-            self.ax.plot(self.bufferVSW, self.bufferCnet, label="Net (If - Ib)", color="red")
-            self.ax.plot(self.bufferVSW, self.bufferCf, label="If", color="blue")
-            self.ax.plot(self.bufferVSW, self.bufferCb, label="Ib", color="green")
-            self.ax.plot(self.bufferVSW, self.bufffil, label="Filtered", color="black")
-
-            # Tính min/max toàn bộ dữ liệu Y
-            all_y = self.bufferCnet + self.bufferCf + self.bufferCb + self.bufffil
-            y_min = min(all_y)
-            y_max = max(all_y)
-            if y_min == y_max:
-                # Nếu chỉ có 1 giá trị, mở rộng ±10%
-                delta = abs(y_min) * 0.1 if y_min != 0 else 1
-                y_min -= delta
-                y_max += delta
-            else:
-                # Mở rộng biên ±5% mỗi đầu
-                y_range = y_max - y_min
-                y_min -= y_range * 0.05
-                y_max += y_range * 0.05
-
-            self.ax.set_xlim(min(self.bufferVSW), max(self.bufferVSW))
-            self.ax.set_ylim(y_min, y_max)
-        # ...existing code...
-        self.canvas.draw()  # Vẽ lại đồ thị
+            # Tính min/max toàn bộ dữ liệu Y, mở rộng biên ±5% mỗi đầu
+            columns = (self.bufferCnet, self.bufferCf, self.bufferCb, self.bufffil)
+            y_min, y_max = render.padded(min(c.min() for c in columns), max(c.max() for c in columns))
+            changed = render.apply_limits(self.ax, (self.bufferVSW.min(), self.bufferVSW.max()),
+                                          (y_min, y_max), live) or changed
+        if changed:
+            self.style_graph()
+            self.blit.redraw()  # Vẽ lại toàn bộ đồ thị
+        else:
+            self.blit.update()  # Chỉ vẽ lại các đường
 
 
 
@@ -759,8 +896,9 @@ import pandas as pd
 import tkinter.font as tkFont
 
 class CVApp:
-    def __init__(self, parent):
+    def __init__(self, parent, serial_manager=None):
         self.root = parent
+        self.serial_manager = serial_manager or connection.SerialManager()
         self.serial_port = None
 
         # Thông số mặc định
@@ -771,14 +909,17 @@ class CVApp:
 
         # Dữ liệu
         self.buffer_serial = []
-        self.buffer_voltage = []
-        self.buffer_current_raw = []
-        self.buffer_current_filtered = []
-        self.x_data = []
-        self.y_data = []
+        # Kết quả đã dựng lại; buffer_voltage / buffer_current_* / x_data / y_data là view của nó
+        self.samples = buffers.SampleBuffer(("voltage", "current_raw", "current_filtered"))
         self.receiver_count = 0
         self.expected_samples = 0
         self.is_receiving = False
+        # File phiên đo (session.py): bản ghi thô của thiết bị được ghi ra đĩa ngay khi nhận,
+        # điện thế / dòng điện được dựng lại sau khi đo xong
+        self.session = None
+        # Chỉ số chu kỳ / nửa chu kỳ (cycles.py) dựng một lần khi nhận hoặc nhập dữ liệu, và bảng từng chu kỳ
+        self.cycle_index = None
+        self.cycle_table = None
 
         self.setup_gui()
         self.setup_plot()
@@ -848,12 +989,20 @@ class CVApp:
         self.end_entry = self.add_labeled_entry(param_frame, "End Voltage (mV):", self.end_voltage, row=1)
         self.step_entry = self.add_labeled_entry(param_frame, "Step (mV):", self.step_voltage, row=2)
         self.repeat_entry = self.add_labeled_entry(param_frame, "Repeat:", 1, row=3)
+        self.scan_rate_entry = self.add_labeled_entry(param_frame, "Scan Rate (mV/s):", "", row=4)
+        self.scan_rate_entry.bind("<Return>", lambda event: self.analyze_cycles())
 
         # Import/Export
         ttk.Label(self.frame_left, text="Data Control", font=("Segoe UI", 15, "bold"), foreground="#00838F").pack(anchor="w", pady=(12, 5))
         ttk.Button(self.frame_left, text="\U0001F4C2 Import CSV", command=self.import_file, style="CV.TButton").pack(fill="x", pady=3)
         ttk.Button(self.frame_left, text="\U0001F4BE Export CSV", command=self.export_file, style="CV.TButton").pack(fill="x", pady=3)
 
+        # Cycle analysis
+        ttk.Label(self.frame_left, text="Cycle Analysis", font=("Segoe UI", 15, "bold"), foreground="#6A1B9A").pack(anchor="w", pady=(12, 5))
+        ttk.Button(self.frame_left, text="\U0001F4CA Export Cycles", command=self.export_cycles, style="CV.TButton").pack(fill="x", pady=3)
+        self.cycle_label = tk.Label(self.frame_left, text="", font=("Segoe UI", 11, "bold"), bg="#FFCCCB", anchor="w", justify="left")
+        self.cycle_label.pack(fill="x", pady=3)
+
         # Status label
         self.status_label = ttk.Label(self.frame_left, text="Ready", foreground="blue", font=("Segoe UI", 13, "bold"))
         self.status_label.pack(pady=8)
@@ -876,6 +1025,8 @@ class CVApp:
         self.ax.set_ylabel("Current (µA)", fontsize=16, color="#760FCF")
         self.ax.grid(True, linestyle='--', color='gray', alpha=0.5)
         self.line, = self.ax.plot([], [], 'r-', linewidth=2)
+        # Zoom/pan bằng toolbar sẽ thu gọn lại dữ liệu theo vùng đang nhìn
+        self.trace = render.DecimatedLine(self.line)
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.frame_right)
         self.canvas.draw()
         self.toolbar = NavigationToolbar2Tk(self.canvas, self.frame_right)
@@ -901,9 +1052,7 @@ class CVApp:
             messagebox.showwarning("Warning", "Please select a port")
             return
         try:
-            self.serial_port = serial.Serial(port, 115200, timeout=1)
-            self.thread = threading.Thread(target=self.read_serial, daemon=True)
-            self.thread.start()
+            self.serial_manager.connect(port)
             messagebox.showinfo("Connected", f"Connected to {port}")
         except serial.SerialException as e:
             messagebox.showerror("Serial Error", f"Could not open port {port}\n\n{str(e)}")
@@ -911,111 +1060,150 @@ class CVApp:
             messagebox.showerror("Error", str(e))
 
     def disconnect_serial(self):
-        if self.serial_port and self.serial_port.is_open:
-            self.serial_port.close()
+        if self.serial_manager.is_open:
+            self.is_receiving = False
+            self.serial_manager.disconnect()
             messagebox.showinfo("Disconnected", "Serial port disconnected")
 
     def send_measure_command(self):
-        if self.serial_port and self.serial_port.is_open:
+        if self.serial_manager.is_open:
+            if self.is_receiving:
+                return
+            self.serial_port = self.serial_manager.try_acquire("CV")
+            if self.serial_port is None:
+                messagebox.showwarning("Warning", f"Serial port is busy ({self.serial_manager.owner})")
+                return
             try:
                 self.start_voltage = int(self.start_entry.get())
                 self.end_voltage = int(self.end_entry.get())
                 self.step_voltage = int(self.step_entry.get())
                 self.repeat_times = int(self.repeat_entry.get())
-                num_step = ((self.end_voltage - self.start_voltage) // self.step_voltage + 1) * 2
-                cv_command = f"1#{-self.end_voltage}?{-self.start_voltage}/{num_step}|{self.repeat_times}$0!"
+                num_step = acquisition.cv_num_step(self.start_voltage, self.end_voltage, self.step_voltage)
+                cv_command = acquisition.cv_command(self.start_voltage, self.end_voltage, self.step_voltage, self.repeat_times)
                 print(f"Send: {cv_command}")
                 self.serial_port.write(cv_command.encode())
                 self.buffer_serial.clear()
                 self.receiver_count = 0
                 self.expected_samples = num_step * self.repeat_times
+                self.session = session.open_session("cv", [
+                    ["Start Voltage", self.start_voltage, "[mV]"],
+                    ["End Voltage", self.end_voltage, "[mV]"],
+                    ["Step", self.step_voltage, "[mV]"],
+                    ["Repeat Times", self.repeat_times, "[times]"],
+                ], ["Index", "Current (device)"])
                 self.is_receiving = True
                 self.status_label.config(text="Receiving data...")
                 self.thread = threading.Thread(target=self.read_serial, daemon=True)
                 self.thread.start()
             except Exception as e:
+                self.is_receiving = False
+                self.serial_port.release()
                 messagebox.showerror("Send Error", f"Could not send command.\n\n{str(e)}")
         else:
             messagebox.showwarning("Warning", "Serial port not connected")
 
     def read_serial(self):
+        reader = acquisition.ChunkedLineReader(self.serial_port)
+        written = 0
         while self.is_receiving and self.receiver_count < self.expected_samples:
             try:
-                line = self.serial_port.readline().decode('utf-8').strip()
-                if line and line[0].isdigit():
-                    self.buffer_serial.append(line)
-                    self.receiver_count += 1
+                for line in reader.read_lines():
+                    if acquisition.is_cv_line(line):
+                        self.buffer_serial.append(line)
+                        self.receiver_count += 1
+                        if self.receiver_count >= self.expected_samples:
+                            break
             except Exception as e:
                 print("Read error:", e)
                 break
+            written = self.record_session(written)
+        self.record_session(written)
+        if self.session is not None:
+            self.session.close()
         self.is_receiving = False
+        self.serial_port.release()
         self.process_cv_data()
 
+    def record_session(self, start):
+        # Ghi các bản ghi mới (chỉ số, dòng điện thô của thiết bị) vào file phiên đo
+        if self.session is not None and start < len(self.buffer_serial):
+            values, _ = acquisition.parse_records(self.buffer_serial[start:], 2)
+            self.session.extend(values[:, 0], values[:, 1])
+        return len(self.buffer_serial)
+
     def process_cv_data(self):
-        S_Vol = self.start_voltage
-        E_Vol = self.end_voltage
-        Step = self.step_voltage
-        RepeatTimes = self.repeat_times
-        self.num_step = ((E_Vol - S_Vol) // Step + 1) * 2
-        numStep = self.num_step
-        numSample = numStep * RepeatTimes
-        buff = self.buffer_serial.copy()
-        if len(buff) >= 5:
-            for i in range(4):
-                buff[i] = buff[4]
-        if len(buff) < self.num_step * self.repeat_times:
-            print("❌ Dữ liệu chưa đủ:", len(buff), "đã nhận,", self.num_step * self.repeat_times, "cần thiết")
+        self.num_step = acquisition.cv_num_step(self.start_voltage, self.end_voltage, self.step_voltage)
+        result = acquisition.process_cv_data(self.buffer_serial, self.start_voltage, self.end_voltage,
+                                             self.step_voltage, self.repeat_times)
+        if result is None:
+            print("❌ Dữ liệu chưa đủ:", len(self.buffer_serial), "đã nhận,", self.num_step * self.repeat_times, "cần thiết")
             self.status_label.config(text="Error: Not enough data")
             return
-        for i in range(self.repeat_times * 2):
-            start = i * (self.num_step // 2)
-            for j in range(self.num_step // 4):
-                idx1 = start + j
-                idx2 = start + (self.num_step // 2 - j - 1)
-                if idx1 < len(buff) and idx2 < len(buff):
-                    buff[idx1], buff[idx2] = buff[idx2], buff[idx1]
-        self.buffer_voltage = []
-        self.buffer_current_raw = []
-        for i in range(len(buff)):
-            try:
-                parts = buff[i].split(";")
-                if parts[1].lower() == "inf":
-                    continue
-                current = float(parts[1]) * -25000
-                self.buffer_current_raw.append(current)
-                if i == 0:
-                    voltage = S_Vol
-                elif i % numStep == 0:
-                    voltage = S_Vol
-                elif ((i // (numStep // 2)) % 2 == 0):
-                    voltage = self.buffer_voltage[i - 1] + Step
-                elif (i % (numStep // 2) == 0):
-                    voltage = self.buffer_voltage[i - 1]
-                else:
-                    voltage = self.buffer_voltage[i - 1] - Step
-                self.buffer_voltage.append(voltage)
-            except:
-                continue
-        self.smooth_data()
-        self.x_data = self.buffer_voltage
-        self.y_data = self.buffer_current_filtered
+        self.samples.clear()
+        self.samples.extend(*result)
+        self.index_cycles()
         self.status_label.config(text=f"Received: {self.receiver_count} points")
         self.update_plot()
 
+    def index_cycles(self):
+        self.cycle_index = cycles.CycleIndex(self.buffer_voltage)
+        self.analyze_cycles()
+
+    def scan_rate(self):
+        # Tốc độ quét (mV/s) để tính điện tích theo μC; để trống thì điện tích tính theo μA·mV
+        try:
+            rate = float(self.scan_rate_entry.get())
+        except ValueError:
+            return None
+        return rate if rate > 0 else None
+
+    def analyze_cycles(self):
+        if self.cycle_index is None:
+            self.cycle_table = None
+            self.cycle_label.config(text="")
+            return
+        scan_rate = self.scan_rate()
+        self.cycle_table = cycles.analyze(self.cycle_index, self.buffer_voltage, self.buffer_current_filtered, scan_rate)
+        self.cycle_label.config(text=cycles.describe(self.cycle_table, scan_rate))
+
+    def export_cycles(self):
+        if self.cycle_table is None or len(self.cycle_table) == 0:
+            messagebox.showwarning("Warning", "Chưa có chu kỳ nào để xuất!")
+            return
+        filepath = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")],
+                                                initialfile="cycles.csv")
+        if filepath:
+            try:
+                cycles.write_table(filepath, self.cycle_table, self.scan_rate())
+                messagebox.showinfo("Exported", f"{len(self.cycle_table)} chu kỳ:\n{filepath}")
+            except Exception as e:
+                messagebox.showerror("Export Error", str(e))
+
+    @property
+    def buffer_voltage(self):
+        return self.samples["voltage"]
+
+    @property
+    def buffer_current_raw(self):
+        return self.samples["current_raw"]
+
+    @property
+    def buffer_current_filtered(self):
+        return self.samples["current_filtered"]
+
+    @property
+    def x_data(self):
+        return self.buffer_voltage
+
+    @property
+    def y_data(self):
+        return self.buffer_current_filtered
+
     def smooth_data(self):
-        self.buffer_current_filtered = [0] * len(self.buffer_current_raw)
-        b = self.buffer_current_raw
-        f = self.buffer_current_filtered
-        if len(b) == 0: return
-        f[0] = b[0]
-        if len(b) > 1:
-            f[1] = round((b[0] + b[1]) / 2, 3)
-        for i in range(2, len(b)):
-            f[i] = round((b[i] + b[i - 1] + b[i - 2]) / 3, 3)
+        self.buffer_current_filtered[:] = filters.technique_filter("cv").apply(self.buffer_current_raw)
 
     def update_plot(self):
-        scaled_y = [y / 1000 for y in self.y_data]
-        self.line.set_data(self.x_data, scaled_y)
+        self.trace.set_data(self.x_data, self.y_data / 1000)
         self.ax.relim()
         self.ax.autoscale_view()
         self.ax.set_xlim(self.start_voltage - 100, self.end_voltage + 100)
@@ -1028,11 +1216,9 @@ class CVApp:
         self.canvas.draw()
 
     def clear_data(self):
-        self.x_data.clear()
-        self.y_data.clear()
-        self.buffer_voltage.clear()
-        self.buffer_current_raw.clear()
-        self.buffer_current_filtered.clear()
+        self.samples.clear()
+        self.cycle_index = None
+        self.analyze_cycles()
         self.receiver_count = 0
         self.buffer_serial.clear()
         self.status_label.config(text="Ready")
@@ -1041,39 +1227,30 @@ class CVApp:
     def import_file(self):
         filepath = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")])
         if filepath:
-            with open(filepath, 'r') as f:
-                lines = f.readlines()
-                if len(lines) < 6:
+            try:
+                export = importer.CsvExport(filepath)
+                if len(export.header_rows) < 4:
                     messagebox.showerror("Error", "File format is incorrect!")
                     return
-                try:
-                    self.start_voltage = int(lines[0].split(',')[1])
-                    self.end_voltage = int(lines[1].split(',')[1])
-                    self.step_voltage = int(lines[2].split(',')[1])
-                    self.repeat_times = int(lines[3].split(',')[1])
-                    self.start_entry.delete(0, tk.END)
-                    self.start_entry.insert(0, str(self.start_voltage))
-                    self.end_entry.delete(0, tk.END)
-                    self.end_entry.insert(0, str(self.end_voltage))
-                    self.step_entry.delete(0, tk.END)
-                    self.step_entry.insert(0, str(self.step_voltage))
-                    self.repeat_entry.delete(0, tk.END)
-                    self.repeat_entry.insert(0, str(self.repeat_times))
-                    self.buffer_voltage.clear()
-                    self.buffer_current_raw.clear()
-                    self.buffer_current_filtered.clear()
-                    for line in lines[5:]:
-                        parts = line.strip().split(",")
-                        if len(parts) == 3:
-                            self.buffer_voltage.append(float(parts[0]))
-                            self.buffer_current_raw.append(float(parts[1]))
-                            self.buffer_current_filtered.append(float(parts[2]))
-                    self.x_data = self.buffer_voltage
-                    self.y_data = self.buffer_current_filtered
-                    self.status_label.config(text="Data imported successfully.")
-                    self.update_plot()
-                except Exception as e:
-                    messagebox.showerror("Import Error", str(e))
+                self.start_voltage = int(export.header_rows[0][1])
+                self.end_voltage = int(export.header_rows[1][1])
+                self.step_voltage = int(export.header_rows[2][1])
+                self.repeat_times = int(export.header_rows[3][1])
+                self.start_entry.delete(0, tk.END)
+                self.start_entry.insert(0, str(self.start_voltage))
+                self.end_entry.delete(0, tk.END)
+                self.end_entry.insert(0, str(self.end_voltage))
+                self.step_entry.delete(0, tk.END)
+                self.step_entry.insert(0, str(self.step_voltage))
+                self.repeat_entry.delete(0, tk.END)
+                self.repeat_entry.insert(0, str(self.repeat_times))
+                self.samples.clear()
+                export.read_into(self.samples, range(3))
+                self.index_cycles()
+                self.status_label.config(text="Data imported successfully.")
+                self.update_plot()
+            except Exception as e:
+                messagebox.showerror("Import Error", str(e))
 
     def export_file(self):
         filepath = filedialog.asksaveasfilename(defaultextension=".csv")
@@ -1085,7 +1262,7 @@ class CVApp:
                     f.write(f"Step,{self.step_voltage},[mV]\n")
                     f.write(f"Repeat Times,{self.repeat_times},[times]\n")
                     f.write("Voltage (mV),Current Raw (uA),Current Filtered (uA)\n")
-                    for v, raw, filt in zip(self.buffer_voltage, self.buffer_current_raw, self.buffer_current_filtered):
+                    for v, raw, filt in self.samples.rows():
                         f.write(f"{v},{raw},{filt}\n")
                 import os
                 image_path = os.path.splitext(filepath)[0] + "_plot.png"
@@ -1096,8 +1273,101 @@ class CVApp:
 
 # eis_3e
 
-class EISApp:
-    def __init__(self, parent):
+# Phần chung của EIS 3E / 2E: kiểm tra Kramers–Kronig và khớp mạch tương đương theo từng lần quét.
+# Lớp con đặt inf_magnitude: |Z| từ giá trị "inf" của thiết bị trở lên bị bỏ
+class EISSweepAnalysis:
+    def batch_fit(self):
+        # Khớp mạch đang chọn cho mọi file CSV xuất EIS trong một thư mục (nhiều tiến trình),
+        # ghi bảng tham số + sai số chuẩn ra CSV
+        name = self.circuit_combo.get()
+        if name == "none":
+            messagebox.showwarning("Batch Fit", "Chọn mạch tương đương trước.")
+            return
+        directory = filedialog.askdirectory()
+        if not directory:
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")],
+                                                 initialfile="fits.csv")
+        if not file_path:
+            return
+        try:
+            rows = circuits.fit_directory(directory, name)
+            circuits.write_table(file_path, name, rows)
+            failed = sum(1 for row in rows if row[2] is None)
+            messagebox.showinfo("Batch Fit", f"{len(rows)} phổ ({failed} lỗi):\n{file_path}")
+        except Exception as e:
+            messagebox.showerror("Batch Fit", str(e))
+
+    def select_circuit(self, event=None):
+        name = self.circuit_combo.get()
+        self.fitter = None if name == "none" else circuits.SweepFitter(circuits.make_circuit(name))
+        self.fit_circuit(*self.last_sweep())
+        self.blit_nyquist.update()
+
+    def last_sweep(self):
+        # (start, stop) của lần quét đủ điểm gần nhất; chưa biết số điểm mỗi lần quét thì lấy toàn bộ dữ liệu
+        sweeps = len(self.freqs) // self.sweep_points if self.sweep_points >= 2 else 0
+        if sweeps == 0:
+            return 0, len(self.freqs)
+        return (sweeps - 1) * self.sweep_points, sweeps * self.sweep_points
+
+    def analyze_imported(self):
+        # Sau khi nhập file: số điểm mỗi lần quét lấy từ chính dữ liệu (không dùng giá trị còn lại từ lần đo trước),
+        # rồi khớp mạch và kiểm tra KK trên cùng lần quét cuối
+        bounds = circuits.sweep_bounds(self.freqs)
+        self.sweep_points = int(bounds[1] - bounds[0]) if len(bounds) > 2 else len(self.freqs)
+        self.fitted_sweeps = len(self.freqs) // self.sweep_points if self.sweep_points else 0
+        self.fit_circuit(*self.last_sweep())
+        self.check_kk(*self.last_sweep())
+
+    def fit_sweeps(self):
+        # Mỗi khi một lần quét đủ điểm: kiểm tra KK và khớp mạch (bắt đầu từ kết quả của lần quét trước)
+        if self.sweep_points < 2:
+            return
+        while (self.fitted_sweeps + 1) * self.sweep_points <= len(self.freqs):
+            start = self.fitted_sweeps * self.sweep_points
+            self.fitted_sweeps += 1
+            self.check_kk(start, start + self.sweep_points)
+            if self.fitter is not None:
+                self.fit_circuit(start, start + self.sweep_points)
+
+    def fit_circuit(self, start=0, stop=None):
+        self.fit_result = None
+        self.line_nyquist_fit.set_data([], [])
+        self.fit_label.config(text="")
+        if self.fitter is None:
+            return
+        freqs = self.freqs[start:stop]
+        # Bỏ các điểm "inf" của thiết bị
+        valid = self.magnitudes[start:stop] < self.inf_magnitude
+        try:
+            self.fit_result = self.fitter.fit(freqs[valid], self.reals[start:stop][valid] + 1j * self.imags[start:stop][valid])
+        except ValueError as e:
+            print("Không khớp được mạch:", e)
+            return
+        z = self.fit_result.curve(freqs[valid])
+        self.line_nyquist_fit.set_data(z.real, z.imag)
+        self.fit_label.config(text=self.fit_result.describe("   "))
+
+    def check_kk(self, start=0, stop=None):
+        # Kiểm tra Kramers–Kronig cho một lần quét; lần quét không đạt (trôi, không ổn định) được báo ngay
+        self.kk_result = None
+        self.kk_label.config(text="")
+        valid = self.magnitudes[start:stop] < self.inf_magnitude
+        try:
+            self.kk_result = kk.check(self.freqs[start:stop][valid],
+                                      self.reals[start:stop][valid] + 1j * self.imags[start:stop][valid])
+        except ValueError:
+            return
+        self.kk_label.config(text=self.kk_result.describe(), fg="green" if self.kk_result.valid else "red")
+        if not self.kk_result.valid:
+            print("Lần quét không thỏa Kramers–Kronig:", self.kk_result.describe())
+
+
+class EISApp(EISSweepAnalysis):
+    inf_magnitude = acquisition.EIS_3E_INF_VALUE
+
+    def __init__(self, parent, serial_manager=None):
         import tkinter as tk
         from tkinter import ttk, messagebox
         import serial
@@ -1106,22 +1376,34 @@ class EISApp:
         import matplotlib.pyplot as plt
         import serial.tools.list_ports
         import numpy as np
-        from scipy.ndimage import uniform_filter1d 
         from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
         from PIL import Image, ImageTk
         import pandas as pd
         from tkinter import filedialog
-        from scipy.signal import savgol_filter
         
         self.root = parent
+        self.serial_manager = serial_manager or connection.SerialManager()
         self.serial_port = None
         self.running = False
-
-        self.freqs = []
-        self.magnitudes = []
-        self.phases = []
-        self.reals = []
-        self.imags = []
+        self.render_scheduler = None
+        # File phiên đo (session.py): mẫu được ghi ra đĩa ngay khi nhận, Export đọc lại từ file này
+        self.session = None
+        self.mag_smoother = filters.technique_filter("eis_3e_bode").stream()
+        self.phase_smoother = filters.technique_filter("eis_3e_bode").stream()
+        # Nyquist: lọc như cả khối nhưng chỉ tính lại phần đuôi khi có điểm mới
+        self.nyquist_filter = filters.technique_filter("eis_3e_nyquist")
+        self.real_nyquist = self.nyquist_filter.incremental()
+        self.imag_nyquist = self.nyquist_filter.incremental()
+
+        # Bộ đệm cột NumPy; freqs / reals / imags / magnitudes / phases là view của nó
+        self.samples = buffers.SampleBuffer(("freq", "real", "imag", "magnitude", "phase"))
+        # Khớp mạch tương đương sau mỗi lần quét (circuits.py)
+        self.fitter = circuits.SweepFitter(circuits.make_circuit("randles"))
+        self.fit_result = None
+        # Kiểm tra Kramers–Kronig (kk.py) mỗi khi một lần quét xong
+        self.kk_result = None
+        self.fitted_sweeps = 0
+        self.sweep_points = 0
 
         self.setup_ui()
         self.setup_plot()
@@ -1163,6 +1445,8 @@ class EISApp:
         self.export_btn.grid(row=0, column=6, padx=5)
         self.import_btn = ttk.Button(control_frame, text="\U0001F4C2 Import CSV", width=14, command=self.import_from_excel, style="EIS3E.TButton")
         self.import_btn.grid(row=0, column=7, padx=5)
+        self.batch_btn = ttk.Button(control_frame, text="\U0001F4C1 Batch Fit", width=14, command=self.batch_fit, style="EIS3E.TButton")
+        self.batch_btn.grid(row=0, column=8, padx=5)
 
         # Logo bên phải
         from PIL import Image, ImageTk
@@ -1207,33 +1491,71 @@ class EISApp:
         self.repeat_times_spin.delete(0, "end")
         self.repeat_times_spin.insert(0, "1")
         self.repeat_times_spin.grid(row=0, column=7, padx=5)
+
+        tk.Label(param_frame, text="Circuit Fit", **label_opts).grid(row=1, column=0, padx=5, pady=5)
+        self.circuit_combo = ttk.Combobox(param_frame, values=["none"] + list(circuits.CIRCUITS), state="readonly",
+                                          width=16, font=font_conf)
+        self.circuit_combo.set("randles")
+        self.circuit_combo.grid(row=1, column=1, padx=5)
+        self.circuit_combo.bind("<<ComboboxSelected>>", self.select_circuit)
+        self.fit_label = tk.Label(param_frame, text="", font=("Segoe UI", 11, "bold"), bg=bg_color, anchor="w", justify="left")
+        self.fit_label.grid(row=1, column=2, columnspan=6, padx=5, sticky="w")
+        self.kk_label = tk.Label(param_frame, text="", font=("Segoe UI", 11, "bold"), bg=bg_color, anchor="w")
+        self.kk_label.grid(row=2, column=0, columnspan=8, padx=5, sticky="w")
     
     
+    @property
+    def freqs(self):
+        return self.samples["freq"]
+
+    @property
+    def reals(self):
+        return self.samples["real"]
+
+    @property
+    def imags(self):
+        return self.samples["imag"]
+
+    @property
+    def magnitudes(self):
+        return self.samples["magnitude"]
+
+    @property
+    def phases(self):
+        return self.samples["phase"]
+
     def clear_data(self):
-        self.freqs.clear()
-        self.reals.clear()
-        self.imags.clear()
-        self.magnitudes.clear()
-        self.phases.clear()
+        self.samples.clear()
+        if self.session is not None:
+            self.session.close()
+        self.session = None
+        self.fitted_sweeps = 0
+        if self.fitter is not None:
+            self.fitter.reset()
+        self.fit_circuit()
+        self.check_kk(0, 0)
+        self.mag_smoother.reset()
+        self.phase_smoother.reset()
+        self.real_nyquist.reset()
+        self.imag_nyquist.reset()
 
         # Xoá đồ thị Bode
-        self.ax_bode.cla()
-        self.ax_phase.cla()
+        for trace in self.traces:
+            trace.set_data([], [])
         self.ax_bode.set_title("Bode Plot")
         self.ax_bode.set_xlabel("Frequency (Hz)")
         self.ax_bode.set_ylabel("Magnitude (Ohm)", color='r')
         self.ax_phase.set_ylabel("Phase (°)", color='b')
-        self.canvas_bode.draw()
+        self.blit_bode.redraw()
 
         # Xoá đồ thị Nyquist
-        self.ax_nyquist.cla()
         self.ax_nyquist.set_title("Nyquist Plot")
         self.ax_nyquist.set_xlabel("Re(Z) (Ohm)")
         self.ax_nyquist.set_ylabel("Im(Z) (Ohm)")
-        self.canvas_nyquist.draw()
+        self.blit_nyquist.redraw()
     
     def export_to_excel(self):
-        if not self.freqs:
+        if len(self.freqs) == 0:
             messagebox.showwarning("No Data", "No data to export.")
             return
 
@@ -1248,7 +1570,11 @@ class EISApp:
         file_path = filedialog.asksaveasfilename(defaultextension=".csv",
                                                 filetypes=[("CSV Files", "*.csv")])
         if file_path:
-            df.to_csv(file_path, index=False)
+            if self.session is not None and self.session.complete:
+                # Chuyển file phiên đo (đã có đủ dữ liệu) sang CSV
+                self.session.export_csv(file_path)
+            else:
+                df.to_csv(file_path, index=False)
             import os
             image_path_bode = os.path.splitext(file_path)[0] + "_bode_plot.png"
             image_path_nyquist = os.path.splitext(file_path)[0] + "_nyquist_plot.png"
@@ -1264,13 +1590,11 @@ class EISApp:
             return
 
         try:
-            df = pd.read_csv(file_path)
-
-            self.freqs = df['Frequency (Hz)'].tolist()
-            self.magnitudes = df['Magnitude (Ohm)'].tolist()
-            self.phases = df['Phase (Degree)'].tolist()
-            self.reals = df['Re(Z) (Ohm)'].tolist()
-            self.imags = df['Im(Z) (Ohm)'].tolist()
+            export = importer.CsvExport(file_path)
+            self.clear_data()
+            export.read_into(self.samples, ['Frequency (Hz)', 'Re(Z) (Ohm)', 'Im(Z) (Ohm)',
+                                            'Magnitude (Ohm)', 'Phase (Degree)'])
+            self.analyze_imported()
 
             self.update_plots()
             messagebox.showinfo("Imported", f"Data imported from:\n{file_path}")
@@ -1279,9 +1603,9 @@ class EISApp:
 
             
     def disconnect_serial(self):
-        if self.serial_port and self.serial_port.is_open:
+        if self.serial_manager.is_open:
             self.running = False  # Dừng luồng đọc dữ liệu nếu đang chạy
-            self.serial_port.close()
+            self.serial_manager.disconnect()
             messagebox.showinfo("Disconnected", "Serial port has been disconnected.")
         else:
             messagebox.showwarning("Warning", "No serial connection to disconnect.")
@@ -1339,6 +1663,7 @@ class EISApp:
             label.set_fontsize(16)
             label.set_fontweight('bold')
             label.set_color("#388E3C")
+        self.create_plot_lines()
 
     def connect_serial(self):
         port = self.port_combo.get().strip()
@@ -1346,16 +1671,18 @@ class EISApp:
             messagebox.showwarning("Warning", "Please select a port.")
             return
         try:
-            self.serial_port = serial.Serial(port, 115200, timeout=1)
+            self.serial_manager.connect(port)
             messagebox.showinfo("Connected", f"Connected to {port}")
         except Exception as e:
             messagebox.showerror("Connection Error", f"Could not open {port}\n{e}")
 
 
     def start_reading(self):
-        if not self.serial_port or not self.serial_port.is_open:
+        if not self.serial_manager.is_open:
             messagebox.showwarning("Warning", "Serial port not connected.")
             return
+        if self.running:
+            return
 
         try:
             # Đọc và kiểm tra giá trị đầu vào
@@ -1372,18 +1699,29 @@ class EISApp:
                 messagebox.showerror("Invalid Sweep Points", "Sweep points must be at least 2.")
                 return
 
-            # Tạo và gửi lệnh
-            command = f"3#{start_freq}?{stop_freq}/{self.sweep_points}|{self.repeat_times}$0!"
-            self.serial_port.write(command.encode())
+            # Thuê cổng serial dùng chung rồi gửi lệnh
+            self.serial_port = self.serial_manager.try_acquire("EIS_3E")
+            if self.serial_port is None:
+                messagebox.showwarning("Warning", f"Serial port is busy ({self.serial_manager.owner}).")
+                return
+            command = acquisition.eis_command(start_freq, stop_freq, self.sweep_points, self.repeat_times, electrodes=3)
+            try:
+                self.serial_port.write(command.encode())
+            except Exception:
+                self.serial_port.release()
+                raise
             print(f"Sent: {command}")
 
             # Xoá dữ liệu cũ trước khi đọc mới
             self.clear_data()
+            self.session = session.open_session("eis_3e", [], [
+                "Frequency (Hz)", "Magnitude (Ohm)", "Phase (Degree)", "Re(Z) (Ohm)", "Im(Z) (Ohm)"])
 
             # Gán expected_points để theo dõi số lượng dữ liệu mong đợi
             self.expected_points = self.sweep_points * self.repeat_times
 
-            # Bắt đầu luồng đọc
+            # Bắt đầu luồng đọc; đồ thị được vẽ trên luồng Tk với tốc độ giới hạn
+            self.start_render()
             self.running = True
             threading.Thread(target=self.read_serial, daemon=True).start()
 
@@ -1396,125 +1734,131 @@ class EISApp:
     def stop_reading(self):
         self.running = False
 
+    def start_render(self):
+        if self.render_scheduler is not None:
+            self.render_scheduler.cancel()
+        self.render_scheduler = render.RenderScheduler(self.root, lambda: self.update_plots(live=True),
+                                                       consume=self.add_samples, on_finish=self.finish_measurement)
+        self.render_scheduler.start()
+
+    def add_samples(self, samples):
+        # Chạy trên luồng Tk: chỉ ở đây bộ đệm dữ liệu mới bị thay đổi
+        self.samples.extend_rows(samples)
+        if self.session is not None:
+            self.session.extend_rows([(f, m, p, re, im) for f, re, im, m, p in samples])
+        self.fit_sweeps()
+
+    def finish_measurement(self):
+        if self.session is not None:
+            self.session.close()
+        self.update_plots()
+
     def read_serial(self):
+        reader = acquisition.ChunkedLineReader(self.serial_port)
+        scheduler = self.render_scheduler
+        received = 0
         while self.running:
+            batch = []
             try:
-                line = self.serial_port.readline().decode().strip()
-                if not line or ";" not in line:
-                    continue
-
-                print(f"Received: {line}")
-
-                parts = line.split(";")
-                if len(parts) != 3:
-                    continue
-
-                try:
-                    freq = float(parts[0])
-
-                    if parts[1].lower() == "inf" or parts[2].lower() == "inf":
-                        magnitude = 600_000_000
-                        phase = 0
-                        rz_real = 600_000_000
-                        rz_imag = 0
-                    else:
-                        rz_real = float(parts[1])
-                        rz_imag = float(parts[2])
-                        magnitude = math.sqrt(rz_real**2 + rz_imag**2)
-                        phase = math.degrees(math.atan2(-rz_imag, rz_real))
+                for line in reader.read_lines():
+                    if not acquisition.is_data_record(line):
+                        continue
 
-                    self.freqs.append(freq)
-                    self.reals.append(rz_real)
-                    self.imags.append(rz_imag)
-                    self.magnitudes.append(magnitude)
-                    self.phases.append(phase)
+                    sample = acquisition.parse_eis_line(line)
+                    if sample is None:
+                        print("⚠️ Lỗi định dạng:", line)
+                        continue
 
-                    self.update_plots()
+                    batch.append(sample)
+                    received += 1
 
                     # ✅ Nếu đo đủ điểm, dừng tự động
-                    if len(self.freqs) >= self.expected_points:
+                    if received >= self.expected_points:
                         print("✅ Đã đo xong, dừng đọc.")
                         self.running = False
-
-                except ValueError as e:
-                    print("⚠️ Lỗi định dạng:", e)
+                        break
 
             except Exception as e:
                 print("❌ Lỗi khi đọc dữ liệu:", e)
+                if not self.serial_port.is_open:
+                    break
+            finally:
+                if batch:
+                    scheduler.push(batch)
+        self.running = False
+        self.serial_port.release()
+        scheduler.finish()
 
 
-    def update_plots(self):
+    def create_plot_lines(self):
+        # Đường vẽ cố định: mỗi lần cập nhật chỉ set_data rồi blit
+        self.ax_bode.set_xscale('linear')  # bạn có thể đổi thành 'log' nếu cần
+        self.ax_phase.set_ylim(-100, 10)
+        self.line_mag, = self.ax_bode.plot([], [], 'k-', linewidth=2.5, label="Magnitude (Ohm)")
+        self.line_phase, = self.ax_phase.plot([], [], 'r-', linewidth=2.5, label="Phase (Degree)")
+        self.line_nyquist_smooth, = self.ax_nyquist.plot([], [], 'k-', linewidth=2.5, label="Smoothed")
+        self.line_nyquist_raw, = self.ax_nyquist.plot([], [], 'r.', markersize=3, label="Raw Data")
+        self.line_nyquist_fit, = self.ax_nyquist.plot([], [], 'b--', linewidth=1.5, label="Circuit Fit")
+        self.ax_nyquist.legend()
+        self.blit_bode = render.BlitManager(self.canvas_bode, [self.line_mag, self.line_phase])
+        self.blit_nyquist = render.BlitManager(self.canvas_nyquist, [self.line_nyquist_smooth, self.line_nyquist_raw])
+        # Chỉ đưa cho matplotlib số điểm cỡ độ phân giải màn hình
+        self.traces = [render.DecimatedLine(line) for line in self.blit_bode.artists + self.blit_nyquist.artists]
+        self.trace_mag, self.trace_phase, self.trace_nyquist_smooth, self.trace_nyquist_raw = self.traces
+        # Đường mô hình đã ít điểm (circuits.CURVE_POINTS), không cần thu gọn
+        self.line_nyquist_fit.set_animated(True)
+        self.blit_nyquist.artists.append(self.line_nyquist_fit)
+
+    def update_plots(self, live=False):
+        # live=True: đang đo, chỉ vẽ lại toàn bộ khi dữ liệu vượt ra ngoài trục
         # Bỏ qua nếu chưa có đủ dữ liệu
         if len(self.freqs) < 5:
             return
 
-        # ==== HÀM LÀM MƯỢT ====
-        def smooth_data(data):
-            result = []
-            for i in range(len(data)):
-                if i == 0:
-                    result.append(data[0])
-                elif i == 1:
-                    result.append(round((data[0] + data[1]) / 2, 3))
-                else:
-                    result.append(round((data[i] + data[i - 1] + data[i - 2]) / 3, 3))
-            return result
-
-        def smooth_nyquist(real_list, imag_list, window=11, poly=3):
-            if len(real_list) < window or len(imag_list) < window:
-                return real_list, imag_list  # không đủ điểm để lọc
-
-            # Áp dụng Savitzky-Golay filter
-            real_smooth = savgol_filter(real_list, window_length=window, polyorder=poly).tolist()
-            imag_smooth = savgol_filter(imag_list, window_length=window, polyorder=poly).tolist()
-            return real_smooth, imag_smooth
-
-
         # ==== LÀM MƯỢT DỮ LIỆU ====
-        mag_smooth = smooth_data(self.magnitudes)
-        pha_smooth = smooth_data(self.phases)
-        re_smooth, im_smooth = smooth_nyquist(self.reals, self.imags, window=11, poly=3)
+        # Bode: bộ lọc luồng chỉ làm mượt các điểm mới kể từ lần vẽ trước
+        mag_smooth = self.mag_smoother.filtered(self.magnitudes, live)
+        pha_smooth = self.phase_smoother.filtered(self.phases, live)
+        # Nyquist: mặc định Savitzky-Golay 11 điểm, bậc 3; chỉ window điểm cuối được tính lại
+        self.real_nyquist.sync(self.reals)
+        self.imag_nyquist.sync(self.imags)
+        re_smooth = self.real_nyquist.output
+        im_smooth = self.imag_nyquist.output
 
-        
-        # ==== BODE PLOT ====
-        self.ax_bode.cla()
-        self.ax_phase.cla()
-        self.ax_bode.set_title("Bode Plot")
-        self.ax_bode.set_xlabel("Frequency (Hz)")
-        self.ax_bode.set_ylabel("Magnitude (Ohm)", color='r')
-        self.ax_phase.set_ylabel("Phase (°)", color='b')
-
-        self.ax_bode.set_xscale('linear')  # bạn có thể đổi thành 'log' nếu cần
-        self.ax_bode.set_xlim(min(self.freqs), max(self.freqs))
-        self.ax_bode.set_ylim(0, max(mag_smooth) * 1.2)
-        self.ax_phase.set_ylim(-100, 10)
-
-        self.ax_bode.plot(self.freqs, mag_smooth, 'k-', linewidth=2.5, label="Magnitude (Ohm)")
-        self.ax_phase.plot(self.freqs, pha_smooth, 'r-', linewidth=2.5, label="Phase (Degree)")
 
-        self.ax_bode.grid(True)
-        self.canvas_bode.draw()
+        # ==== BODE PLOT ====
+        self.trace_mag.set_data(self.freqs, mag_smooth)
+        self.trace_phase.set_data(self.freqs, pha_smooth)
+        changed = render.apply_limits(self.ax_bode, (self.freqs.min(), self.freqs.max()),
+                                      (0, mag_smooth.max() * 1.2), live)
+        if changed or not live:
+            self.ax_bode.set_title("Bode Plot")
+            self.ax_bode.set_xlabel("Frequency (Hz)")
+            self.ax_bode.set_ylabel("Magnitude (Ohm)", color='r')
+            self.ax_phase.set_ylabel("Phase (°)", color='b')
+            self.ax_bode.grid(True)
+            self.blit_bode.redraw()
+        else:
+            self.blit_bode.update()
 
         # ==== NYQUIST PLOT ====
-        self.ax_nyquist.cla()
-        self.ax_nyquist.set_title("Nyquist Plot")
-        self.ax_nyquist.set_xlabel("Re(Z) (Ohm)")
-        self.ax_nyquist.set_ylabel("Im(Z) (Ohm)")
-
-        self.ax_nyquist.plot(re_smooth, im_smooth, 'k-', linewidth=2.5, label="Smoothed")
-        self.ax_nyquist.plot(self.reals, self.imags, 'r.', markersize=3, label="Raw Data")
-
-        self.ax_nyquist.set_xlim(0, max(self.reals) * 1.1)
-        self.ax_nyquist.set_ylim(min(self.imags) * 1.1, max(self.imags) * 1.1)
-
-        self.ax_nyquist.grid(True)
-        self.ax_nyquist.legend()
-        self.canvas_nyquist.draw()
+        self.trace_nyquist_smooth.set_data(re_smooth, im_smooth)
+        self.trace_nyquist_raw.set_data(self.reals, self.imags)
+        changed = render.apply_limits(self.ax_nyquist, (0, self.reals.max() * 1.1),
+                                      (self.imags.min() * 1.1, self.imags.max() * 1.1), live)
+        if changed or not live:
+            self.ax_nyquist.set_title("Nyquist Plot")
+            self.ax_nyquist.set_xlabel("Re(Z) (Ohm)")
+            self.ax_nyquist.set_ylabel("Im(Z) (Ohm)")
+            self.ax_nyquist.grid(True)
+            self.blit_nyquist.redraw()
+        else:
+            self.blit_nyquist.update()
 
 # CA
 
 class ChronoAmperometryApp:
-    def __init__(self, parent):
+    def __init__(self, parent, serial_manager=None):
         import tkinter as tk
         from tkinter import ttk, messagebox, filedialog
         import serial
@@ -1539,6 +1883,7 @@ class ChronoAmperometryApp:
         self.threading = threading
 
         self.root = parent
+        self.serial_manager = serial_manager or connection.SerialManager()
         self.serial_port = None
         self.running = False
 
@@ -1546,8 +1891,15 @@ class ChronoAmperometryApp:
         self.time_run = tk.IntVar(value=10)
         self.time_interval = tk.IntVar(value=100)
 
-        self.time_data = []
-        self.current_data = []
+        # Bộ đệm cột NumPy; time_data / current_data là view của nó
+        self.samples = buffers.SampleBuffer(("time", "current"))
+        # Chế độ đo dài: dữ liệu đầy đủ chỉ nằm trong file phiên đo, RAM giữ cửa sổ gần nhất + bản thu gọn
+        # (buffers.LongRunBuffer). Tự bật khi số điểm dự kiến vượt acquisition.CA_LONG_RUN_POINTS.
+        # Không mở được file phiên thì LongRunBuffer ghi file tràn riêng trong thư mục tạm.
+        self.long_run_var = tk.BooleanVar(value=False)
+        self.long_run = None
+        # File phiên đo (session.py): mẫu được ghi ra đĩa ngay khi nhận
+        self.session = None
 
         # ===== Top bar với logo và tiêu đề =====
         top_frame = tk.Frame(self.root, bg="#FFF9C4")
@@ -1613,6 +1965,8 @@ class ChronoAmperometryApp:
         self.add_labeled_entry("E Voltage (mV):", self.e_voltage, row=0, font=("Segoe UI", 14, "bold"))
         self.add_labeled_entry("Time Run (s):", self.time_run, row=1, font=("Segoe UI", 14, "bold"))
         self.add_labeled_entry("Time Interval (ms):", self.time_interval, row=2, font=("Segoe UI", 14, "bold"))
+        tk.Checkbutton(self.frame_left, text="Long run (low memory)", variable=self.long_run_var,
+                       font=("Segoe UI", 13, "bold"), bg="#FFF9C4").pack(anchor="w", pady=3)
 
         # Import/Export
         tk.Label(self.frame_left, text="Data Control", font=("Segoe UI", 15, "bold"), fg="#00838F", bg="#FFF9C4").pack(anchor="w", pady=(12, 5))
@@ -1635,6 +1989,11 @@ class ChronoAmperometryApp:
         self.ax.set_ylabel("Current (uA)", fontsize=15, color="#F9A825")
         self.ax.grid(True, linestyle='--', color='gray', alpha=0.5)
         self.line_plot, = self.ax.plot([], [], color='red', linewidth=2)
+        # Chế độ đo dài: line_plot vẽ bản thu gọn cả phép đo, line_recent vẽ đủ độ phân giải phần gần nhất
+        self.line_recent, = self.ax.plot([], [], color='#B71C1C', linewidth=1)
+        # Chuỗi thời gian nhiễu: thu gọn min/max mỗi pixel để giữ nguyên các đỉnh nhọn
+        self.trace_plot = render.DecimatedLine(self.line_plot, method="minmax", monotonic=True)
+        self.trace_recent = render.DecimatedLine(self.line_recent, method="minmax", monotonic=True)
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.frame_right)
         self.canvas.draw()
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
@@ -1668,32 +2027,50 @@ class ChronoAmperometryApp:
             self.messagebox.showwarning("Warning", "Please select a COM port.")
             return
         try:
-            self.serial_port = self.serial.Serial(port_name, 115200, timeout=1)
+            self.serial_manager.connect(port_name)
             self.status_label.config(text=f"Connected: {port_name}")
             self.messagebox.showinfo("Connected", f"Connected to {port_name}")
         except Exception as e:
             self.messagebox.showerror("Error", str(e))
 
     def disconnect_serial(self):
-        if self.serial_port and self.serial_port.is_open:
+        if self.serial_manager.is_open:
             self.running = False
-            self.serial_port.close()
+            self.serial_manager.disconnect()
             self.status_label.config(text="Disconnected")
             self.messagebox.showinfo("Disconnected", "Disconnected from serial port.")
 
     def start_measurement(self):
-        if not self.serial_port or not self.serial_port.is_open:
+        if not self.serial_manager.is_open:
             self.messagebox.showwarning("Warning", "Serial port not connected!")
             return
+        if self.running:
+            return
+        self.serial_port = self.serial_manager.try_acquire("CA")
+        if self.serial_port is None:
+            self.messagebox.showwarning("Warning", f"Serial port is busy ({self.serial_manager.owner})!")
+            return
 
         e_vol = self.e_voltage.get()
         t_run = self.time_run.get()
         t_int = self.time_interval.get()
 
         # Reset dữ liệu
-        self.time_data.clear()
-        self.current_data.clear()
-        self.line_plot.set_data([], [])
+        self.samples.clear()
+        self.reset_store()
+        self.session = session.open_session("ca", [
+            ["Time Run", t_run, "[s]"],
+            ["E Voltage", e_vol, "[mV]"],
+            ["Time Interval", t_int, "[ms]"],
+            [], [],
+        ], ["Time (s)", "Current (uA)"])
+        if self.long_run_var.get() or acquisition.ca_max_points(t_run, t_int) > acquisition.CA_LONG_RUN_POINTS:
+            spill = None
+            if self.session is None:
+                spill = self.os.path.join(tempfile.gettempdir(), f"ca_long_run_{self.os.getpid()}.bin")
+            self.long_run = buffers.LongRunBuffer(("time", "current"), path=spill)
+        self.trace_plot.set_data([], [])
+        self.trace_recent.set_data([], [])
 
         # Cập nhật lại nhãn
         self.ax.set_title("Chronoamperometry", fontsize=18, fontweight="bold", color="#F9A825")
@@ -1703,8 +2080,13 @@ class ChronoAmperometryApp:
         self.canvas.draw_idle()
 
         # Gửi lệnh xuống vi điều khiển
-        command = f"5#{t_run}?{e_vol}/{t_int}|{t_int}$0!"
-        self.serial_port.write(command.encode())
+        command = acquisition.ca_command(e_vol, t_run, t_int)
+        try:
+            self.serial_port.write(command.encode())
+        except Exception as e:
+            self.serial_port.release()
+            self.messagebox.showerror("Error", str(e))
+            return
         print("Gửi lệnh:", command)
 
         # Bắt đầu luồng đọc dữ liệu
@@ -1712,69 +2094,93 @@ class ChronoAmperometryApp:
         self.threading.Thread(target=self.read_serial_data, daemon=True).start()
 
     def read_serial_data(self):
-        max_points = int(self.time_run.get() * 1000 / self.time_interval.get())
-        while self.running and len(self.time_data) < max_points:
+        max_points = acquisition.ca_max_points(self.time_run.get(), self.time_interval.get())
+        reader = acquisition.ChunkedLineReader(self.serial_port)
+        store = self.long_run if self.long_run is not None else self.samples
+        while self.running and len(store) < max_points:
             try:
-                line = self.serial_port.readline().decode(errors='ignore').strip()
-                if ";" in line:
-                    try:
-                        t_str, i_str = line.split(";")
-                        t = float(t_str)
-                        i = 0 if i_str == "inf" else float(i_str)
-                        if i >= 5234:
-                            i = 5234
-                        self.time_data.append(t)
-                        self.current_data.append(i)
-                        if len(self.time_data) % 5 == 0:
-                            self.update_plot()
-                    except ValueError:
+                for line in reader.read_lines():
+                    if not acquisition.is_data_record(line):
+                        continue
+                    sample = acquisition.parse_ca_line(line)
+                    if sample is None:
                         continue
+                    store.append(*sample)
+                    if self.session is not None:
+                        self.session.append(*sample)
+                    if len(store) % 5 == 0:
+                        self.update_plot()
+                    if len(store) >= max_points:
+                        break
             except Exception as e:
                 print("❌ Lỗi khi đọc dữ liệu từ serial:", e)
+                if not self.serial_port.is_open:
+                    break
         self.running = False
-        self.status_label.config(text=f"Done: {len(self.time_data)} points")
-        self.messagebox.showinfo("Thông báo", f"Đã hoàn thành đo {len(self.time_data)} điểm.")
+        self.serial_port.release()
+        if self.session is not None:
+            self.session.close()
+        if self.long_run is not None:
+            self.long_run.close()
+            self.update_plot()
+        self.status_label.config(text=f"Done: {len(store)} points")
+        if not self.history_complete():
+            self.messagebox.showwarning("Thông báo", f"Đã đo {len(store)} điểm nhưng không ghi được file phiên đo:\n"
+                                        f"chỉ còn {len(self.long_run.recent)} điểm gần nhất để xuất.")
+        else:
+            self.messagebox.showinfo("Thông báo", f"Đã hoàn thành đo {len(store)} điểm.")
 
     def import_csv(self):
-        file_path = self.filedialog.askopenfilename(filetypes=[("CSV/Excel files", "*.csv;*.xls;*.xlsx")])
+        file_path = self.filedialog.askopenfilename(filetypes=[("CSV/Excel files", "*.csv;*.xls;*.xlsx"),
+                                                               ("Session files", "*" + session.SESSION_EXT)])
         if not file_path:
             return
         try:
-            df = self.pd.read_csv(file_path)
-            self.time_run.set(int(df.iloc[0, 1]))
-            self.e_voltage.set(int(df.iloc[1, 1]))
-            self.time_interval.set(int(df.iloc[2, 1]))
-            data = self.pd.read_csv(file_path, skiprows=5)
-            self.time_data = list(data.iloc[:, 0])
-            self.current_data = list(data.iloc[:, 1])
-            self.ax.clear()
-            self.ax.plot(self.time_data, self.current_data, color='red')
-            self.ax.set_title("Chronoamperometry", fontsize=18, fontweight="bold", color="#F9A825")
-            self.ax.set_xlabel("Time (s)", fontsize=15, color="#F9A825")
-            self.ax.set_ylabel("Current (uA)", fontsize=15, color="#F9A825")
-            self.ax.grid(True, linestyle='--', color='gray', alpha=0.5)
-            self.canvas.draw()
+            if file_path.endswith(session.SESSION_EXT):
+                self.load_session(session.SessionFile(file_path))
+            else:
+                self.load_session(importer.CsvExport(file_path))
+            self.trace_recent.set_data([], [])
+            self.update_plot()
             self.status_label.config(text="Imported")
             self.messagebox.showinfo("Import", "Dữ liệu đã được nhập thành công!")
         except Exception as e:
             self.messagebox.showerror("Import Error", str(e))
 
     def export_csv(self):
-        if not self.time_data or not self.current_data:
+        if len(self.samples) == 0 and not self.long_run:
             self.messagebox.showwarning("Export", "Không có dữ liệu để xuất.")
             return
         file_path = self.filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")])
         if not file_path:
             return
         try:
-            with open(file_path, 'w') as f:
-                f.write(f"Time Run,{self.time_run.get()},[s]\n")
-                f.write(f"E Voltage,{self.e_voltage.get()},[mV]\n")
-                f.write(f"Time Interval,{self.time_interval.get()},[ms]\n")
-                f.write("\n\n")
-                f.write("Time (s),Current (uA)\n")
-                for t, i in zip(self.time_data, self.current_data):
-                    f.write(f"{t},{i}\n")
+            if self.session is not None and self.session.complete:
+                # Chuyển file phiên đo (đã có đủ tham số và dữ liệu) sang CSV
+                self.session.export_csv(file_path)
+            else:
+                # Dữ liệu nhập từ file, hoặc không ghi được phiên: đo dài đọc lại từ file tràn của LongRunBuffer
+                if not self.history_complete() and not self.messagebox.askyesno(
+                        "Export", f"Không còn đủ dữ liệu của lần đo ({len(self.long_run)} điểm): file phiên đo bị lỗi "
+                                  f"và chỉ còn {len(self.long_run.recent)} điểm gần nhất trong bộ nhớ.\n"
+                                  "Vẫn xuất phần còn lại?"):
+                    return
+                with open(file_path, 'w') as f:
+                    f.write(f"Time Run,{self.time_run.get()},[s]\n")
+                    f.write(f"E Voltage,{self.e_voltage.get()},[mV]\n")
+                    f.write(f"Time Interval,{self.time_interval.get()},[ms]\n")
+                    f.write("\n\n")
+                    f.write("Time (s),Current (uA)\n")
+                    if self.long_run is None:
+                        for t, i in self.samples.rows():
+                            f.write(f"{t},{i}\n")
+                    elif self.long_run.complete:
+                        for start in range(0, len(self.long_run), session.EXPORT_CHUNK):
+                            for t, i in self.long_run.read(start, start + session.EXPORT_CHUNK).tolist():
+                                f.write(f"{t},{i}\n")
+                    else:
+                        for t, i in self.long_run.recent.rows():
+                            f.write(f"{t},{i}\n")
             image_path = self.os.path.splitext(file_path)[0] + "_plot.png"
             self.fig.savefig(image_path)
             self.status_label.config(text="Exported")
@@ -1784,9 +2190,10 @@ class ChronoAmperometryApp:
 
     def clear_data(self):
         self.running = False
-        self.time_data.clear()
-        self.current_data.clear()
-        self.line_plot.set_data([], [])
+        self.samples.clear()
+        self.reset_store()
+        self.trace_plot.set_data([], [])
+        self.trace_recent.set_data([], [])
         self.ax.set_title("Chronoamperometry", fontsize=18, fontweight="bold", color="#F9A825")
         self.ax.set_xlabel("Time (s)", fontsize=15, color="#F9A825")
         self.ax.set_ylabel("Current (uA)", fontsize=15, color="#F9A825")
@@ -1796,15 +2203,74 @@ class ChronoAmperometryApp:
         self.canvas.draw_idle()
         self.status_label.config(text="Ready")
 
+    @property
+    def time_data(self):
+        return self.samples["time"]
+
+    @property
+    def current_data(self):
+        return self.samples["current"]
+
+    def load_session(self, source):
+        # Nhập file phiên đo (SessionFile, đọc qua np.memmap) hoặc CSV (importer.CsvExport, đọc theo khối).
+        # Dài hơn CA_LONG_RUN_POINTS thì chuyển sang LongRunBuffer như khi đo; Export đọc lại từ file nguồn
+        if isinstance(source, session.SessionFile):
+            if source.technique != "ca":
+                raise ValueError(f"File phiên đo {source.technique}, không phải CA")
+            time_column, current_column = source.columns[:2]
+            blocks = ((source[time_column][start:start + session.EXPORT_CHUNK],
+                       source[current_column][start:start + session.EXPORT_CHUNK])
+                      for start in range(0, len(source), session.EXPORT_CHUNK))
+        else:
+            blocks = (block.T for block in source.chunks(range(2)))
+        for var, name in ((self.time_run, "Time Run"), (self.e_voltage, "E Voltage"), (self.time_interval, "Time Interval")):
+            var.set(int(float(source.parameter(name, var.get()))))
+        self.reset_store()
+        self.samples.clear()
+        for time_values, current_values in blocks:
+            if self.long_run is None and len(self.samples) + len(time_values) > acquisition.CA_LONG_RUN_POINTS:
+                self.long_run = buffers.LongRunBuffer(("time", "current"))
+                self.long_run.extend(self.samples["time"], self.samples["current"])
+                self.samples.clear()
+            store = self.long_run if self.long_run is not None else self.samples
+            store.extend(time_values, current_values)
+        if self.long_run is not None or isinstance(source, session.SessionFile):
+            self.session = source
+
+    def reset_store(self):
+        # Bỏ bộ đệm đo dài và phiên đo hiện tại (file phiên vẫn giữ trên đĩa, file tràn tạm thì xoá)
+        if self.session is not None:
+            self.session.close()
+        self.session = None
+        if self.long_run is not None and self.long_run.path is not None:
+            self.long_run.close()
+            try:
+                self.os.remove(self.long_run.path)
+            except OSError as e:
+                print("Không xoá được file đo dài:", e)
+        self.long_run = None
+
+    def history_complete(self):
+        # Còn đủ mọi mẫu để xuất: file phiên đo không lỗi, hoặc LongRunBuffer còn đủ (RAM / file tràn)
+        if self.session is not None and self.session.complete:
+            return True
+        return self.long_run is None or self.long_run.complete
+
     def update_plot(self):
-        self.line_plot.set_data(self.time_data, self.current_data)
+        if self.long_run is not None:
+            self.trace_plot.set_data(*self.long_run.overview_points())
+            self.trace_recent.set_data(self.long_run.recent["time"], self.long_run.recent["current"])
+        else:
+            self.trace_plot.set_data(self.time_data, self.current_data)
         self.ax.relim()
         self.ax.autoscale_view()
         self.canvas.draw_idle()
 
 # eis_2e
-class EIS2EApp:
-    def __init__(self, parent):
+class EIS2EApp(EISSweepAnalysis):
+    inf_magnitude = acquisition.EIS_2E_INF_MAGNITUDE
+
+    def __init__(self, parent, serial_manager=None):
         import tkinter as tk
         from tkinter import ttk, messagebox, filedialog
         import serial
@@ -1816,7 +2282,6 @@ class EIS2EApp:
         import numpy as np
         import math
         from PIL import Image, ImageTk
-        from scipy.ndimage import uniform_filter1d
 
         self.tk = tk
         self.ttk = ttk
@@ -1828,20 +2293,29 @@ class EIS2EApp:
         self.Image = Image
         self.ImageTk = ImageTk
         self.threading = threading
-        self.uniform_filter1d = uniform_filter1d
         self.math = math
         self.np = np
 
         self.root = parent
+        self.serial_manager = serial_manager or connection.SerialManager()
         self.serial_port = None
         self.running = False
-
-        self.freqs = []
-        self.magnitudes = []
-        self.phases = []
-        self.reals = []
-        self.imags = []
-        self.receiver_count = 0
+        self.render_scheduler = None
+        # File phiên đo (session.py): mẫu được ghi ra đĩa ngay khi nhận, Export đọc lại từ file này
+        self.session = None
+        self.real_smoother = filters.technique_filter("eis_2e_nyquist").stream()
+        self.imag_smoother = filters.technique_filter("eis_2e_nyquist").stream()
+        self.bode_filter = filters.technique_filter("eis_2e_bode")
+
+        # Bộ đệm cột NumPy; freqs / magnitudes / phases / reals / imags là view của nó
+        self.samples = buffers.SampleBuffer(("freq", "magnitude", "phase", "real", "imag"))
+        # Khớp mạch tương đương sau mỗi lần quét (circuits.py)
+        self.fitter = circuits.SweepFitter(circuits.make_circuit("randles"))
+        self.fit_result = None
+        # Kiểm tra Kramers–Kronig (kk.py) mỗi khi một lần quét xong
+        self.kk_result = None
+        self.fitted_sweeps = 0
+        self.sweep_points = 0
         self.build_gui()
         self.setup_plot()
 
@@ -1882,7 +2356,8 @@ class EIS2EApp:
             ("\u274C Disconnect", self.disconnect_serial),
             ("🧹 Clear Data", self.clear_data),
             ("\U0001F4BE Export CSV", self.export_excel),
-            ("\U0001F4C2 Import CSV", self.import_excel)
+            ("\U0001F4C2 Import CSV", self.import_excel),
+            ("\U0001F4C1 Batch Fit", self.batch_fit)
         ], 1):
             ttk.Button(button_frame, text=label, command=cmd, style="EIS2E.TButton", width=14).grid(row=0, column=i, padx=2)
 
@@ -1912,6 +2387,17 @@ class EIS2EApp:
         self.repeats.insert(0, "1")
         self.repeats.grid(row=0, column=7, padx=5)
 
+        tk.Label(param, text="Circuit Fit", **label_opts).grid(row=1, column=0, padx=5, pady=5)
+        self.circuit_combo = ttk.Combobox(param, values=["none"] + list(circuits.CIRCUITS), state="readonly",
+                                          width=16, font=font_conf)
+        self.circuit_combo.set("randles")
+        self.circuit_combo.grid(row=1, column=1, padx=5)
+        self.circuit_combo.bind("<<ComboboxSelected>>", self.select_circuit)
+        self.fit_label = tk.Label(param, text="", font=("Segoe UI", 11, "bold"), bg=bg_color, anchor="w", justify="left")
+        self.fit_label.grid(row=1, column=2, columnspan=6, padx=5, sticky="w")
+        self.kk_label = tk.Label(param, text="", font=("Segoe UI", 11, "bold"), bg=bg_color, anchor="w")
+        self.kk_label.grid(row=2, column=0, columnspan=8, padx=5, sticky="w")
+
     def setup_plot(self):
         from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
@@ -1957,80 +2443,91 @@ class EIS2EApp:
             label.set_fontsize(16)
             label.set_fontweight('bold')
             label.set_color("#388E3C")
+        self.create_plot_lines()
 
-    def clear_all(self):
-        self.freqs.clear()
-        self.magnitudes.clear()
-        self.phases.clear()
-        self.reals.clear()
-        self.imags.clear()
-        self.receiver_count = 0
+    @property
+    def freqs(self):
+        return self.samples["freq"]
 
-    def handle_serial_data(self, line):
-        try:
-            parts = line.strip().split(";")
-            if len(parts) < 2:
-                return False
-
-            freq = float(parts[0])
-            if parts[1].lower() == "inf":
-                mag = 60000000.0
-                phase = 0.0
-            else:
-                mag = float(parts[1])
-                phase = float(parts[2]) if len(parts) > 2 else 0.0
+    @property
+    def magnitudes(self):
+        return self.samples["magnitude"]
 
-            phase_rad = math.radians(phase)
-            real = mag * math.cos(phase_rad)
-            imag = -mag * math.sin(phase_rad)
+    @property
+    def phases(self):
+        return self.samples["phase"]
 
-            self.freqs.append(round(freq, 3))
-            self.magnitudes.append(round(mag, 3))
-            self.phases.append(round(phase, 3))
-            self.reals.append(round(real, 3))
-            self.imags.append(round(imag, 3))
+    @property
+    def reals(self):
+        return self.samples["real"]
 
-            self.receiver_count += 1
-            return True
-        except Exception as e:
-            print("Parse error:", e)
+    @property
+    def imags(self):
+        return self.samples["imag"]
+
+    @property
+    def receiver_count(self):
+        return len(self.samples)
+
+    def clear_all(self):
+        self.samples.clear()
+        if self.session is not None:
+            self.session.close()
+        self.session = None
+        self.real_smoother.reset()
+        self.imag_smoother.reset()
+        self.fitted_sweeps = 0
+        if self.fitter is not None:
+            self.fitter.reset()
+        self.fit_circuit()
+        self.check_kk(0, 0)
+
+    def parse_serial_data(self, line):
+        sample = acquisition.handle_serial_data(line)
+        if sample is None and line:
+            print("Parse error:", line)
+        return sample
+
+    def add_samples(self, samples):
+        # Chạy trên luồng Tk: chỉ ở đây bộ đệm dữ liệu mới bị thay đổi
+        self.samples.extend_rows(samples)
+        if self.session is not None:
+            self.session.extend_rows(samples)
+        self.fit_sweeps()
+
+    def finish_measurement(self):
+        if self.session is not None:
+            self.session.close()
+        self.update_plots()
+
+    def handle_serial_data(self, line):
+        sample = self.parse_serial_data(line)
+        if sample is None:
             return False
+        self.add_samples([sample])
+        return True
 
-    def smooth_nyquist(self):
-        if self.receiver_count < 1:
-            return self.reals, self.imags
-
-        real_smooth = []
-        imag_smooth = []
-        for i in range(self.receiver_count):
-            if i == 0:
-                r, im = self.reals[0], self.imags[0]
-            elif i == 1:
-                r = round((self.reals[0] + self.reals[1]) / 2, 3)
-                im = round((self.imags[0] + self.imags[1]) / 2, 3)
-            else:
-                r = round((self.reals[i] + self.reals[i-1] + self.reals[i-2]) / 3, 3)
-                im = round((self.imags[i] + self.imags[i-1] + self.imags[i-2]) / 3, 3)
-            real_smooth.append(r)
-            imag_smooth.append(im)
-        return real_smooth, imag_smooth
+    def smooth_nyquist(self, live=True):
+        # Bộ lọc luồng chỉ làm mượt các điểm mới kể từ lần vẽ trước
+        return self.real_smoother.filtered(self.reals, live), self.imag_smoother.filtered(self.imags, live)
 
     def smooth_bode(self):
-        if self.receiver_count < 3:
-            return self.magnitudes, self.phases
-        mag = self.np.array(self.magnitudes)
-        pha = self.np.array(self.phases)
-        return self.uniform_filter1d(mag, size=3), self.uniform_filter1d(pha, size=3)
+        # Lọc cả khối (mặc định trung bình 3 điểm đối xứng)
+        return self.bode_filter.apply(self.magnitudes), self.bode_filter.apply(self.phases)
 
     def export_to_csv(self, filepath, sweep=True, log=False):
-        df = pd.DataFrame({
-            'Freq (Hz)': self.freqs,
-            '|Z| (Ohm)': self.magnitudes,
-            'Phase (°)': self.phases,
-            'Re(Z) (Ohm)': self.reals,
-            'Im(Z) (Ohm)': self.imags
-        })
-        df.to_csv(filepath, index=False)
+        if self.session is not None and self.session.complete:
+            # Chuyển file phiên đo (đã có đủ dữ liệu) sang CSV
+            self.session.export_csv(filepath)
+        else:
+            df = pd.DataFrame({
+                'Freq (Hz)': self.freqs,
+                '|Z| (Ohm)': self.magnitudes,
+                'Phase (°)': self.phases,
+                'Re(Z) (Ohm)': self.reals,
+                'Im(Z) (Ohm)': self.imags
+            })
+            df.to_csv(filepath, index=False)
         meta_path = filepath.replace(".csv", "_meta.csv")
         meta = pd.DataFrame({
             'Thông tin': [
@@ -2038,8 +2535,8 @@ class EIS2EApp:
                 'Stop Frequency', 'Sweep Points', 'Repeat Times'
             ],
             'Giá trị': [
-                str(sweep), str(log), self.freqs[0] if self.freqs else '',
-                self.freqs[-1] if self.freqs else '', len(self.freqs), 1
+                str(sweep), str(log), self.freqs[0] if len(self.freqs) else '',
+                self.freqs[-1] if len(self.freqs) else '', len(self.freqs), 1
             ]
         })
         meta.to_csv(meta_path, index=False, header=False)
@@ -2054,15 +2551,17 @@ class EIS2EApp:
         port = self.port_combo.get()
         if port:
             try:
-                self.serial_port = serial.Serial(port, 115200, timeout=1)
+                self.serial_manager.connect(port)
                 messagebox.showinfo("Connected", f"Connected to {port}")
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
     def start_reading(self):
-        if not self.serial_port or not self.serial_port.is_open:
+        if not self.serial_manager.is_open:
             messagebox.showwarning("Warning", "Please connect to the port.")
             return
+        if self.running:
+            return
         try:
             start = int(self.start_freq.get())
             stop = int(self.stop_freq.get())
@@ -2071,91 +2570,152 @@ class EIS2EApp:
             if start >= stop or points < 2:
                 messagebox.showerror("Input Error", "Invalid frequency range or sweep points.")
                 return
+            self.serial_port = self.serial_manager.try_acquire("EIS_2E")
+            if self.serial_port is None:
+                messagebox.showwarning("Warning", f"Serial port is busy ({self.serial_manager.owner}).")
+                return
             self.clear_data()
+            self.session = session.open_session("eis_2e", [], [
+                "Freq (Hz)", "|Z| (Ohm)", "Phase (°)", "Re(Z) (Ohm)", "Im(Z) (Ohm)"])
+            self.expected_points = points * repeats
+            self.sweep_points = points
             sweep_enabled, log_enabled = True, False
             if sweep_enabled:
-                log_flag = '1' if log_enabled else '0'
-                command = f"2#{start}?{stop}/{points}|{repeats}${log_flag}!"
+                command = acquisition.eis_command(start, stop, points, repeats, electrodes=2, log=log_enabled)
             else:
-                command = f"2#{start}?{start}/{points}|{repeats}$0!"
-            self.serial_port.write(command.encode())
+                command = acquisition.eis_command(start, start, points, repeats, electrodes=2)
+            try:
+                self.serial_port.write(command.encode())
+            except Exception:
+                self.serial_port.release()
+                raise
             print("Command sent:", command)
             for child in self.root.winfo_children():
                 for btn in child.winfo_children():
-                    if isinstance(btn, ttk.Button) and btn['text'] not in ['Stop']:
+                    if isinstance(btn, ttk.Button) and not btn['text'].endswith('Stop'):
                         btn.config(state='disabled')
+            self.start_render()
             self.running = True
             threading.Thread(target=self.read_serial, daemon=True).start()
         except Exception as e:
             messagebox.showerror("Error", f"Measurement error: {e}")
 
     def stop_reading(self):
-        if self.serial_port and self.serial_port.is_open:
+        if self.running and self.serial_port is not None and self.serial_port.is_open:
             try:
                 self.serial_port.write(b's')
                 print("Sent stop command")
             except:
                 pass
         self.running = False
+        self.enable_buttons()
+
+    def enable_buttons(self):
         for child in self.root.winfo_children():
             for btn in child.winfo_children():
                 if isinstance(btn, ttk.Button):
                     btn.config(state='normal')
 
     def disconnect_serial(self):
-        if self.serial_port and self.serial_port.is_open:
+        if self.serial_manager.is_open:
             self.running = False
-            self.serial_port.close()
+            self.serial_manager.disconnect()
             messagebox.showinfo("Disconnected", "Serial port disconnected")
 
     def clear_data(self):
         self.clear_all()
-        self.ax_bode.cla()
-        self.ax_phase.cla()
-        self.canvas_bode.draw()
-        self.ax_nyquist.cla()
-        self.canvas_nyquist.draw()
+        for trace in self.traces:
+            trace.set_data([], [])
+        self.blit_bode.redraw()
+        self.blit_nyquist.redraw()
+
+    def start_render(self):
+        if self.render_scheduler is not None:
+            self.render_scheduler.cancel()
+        self.render_scheduler = render.RenderScheduler(self.root, lambda: self.update_plots(live=True),
+                                                       consume=self.add_samples, on_finish=self.finish_measurement)
+        self.render_scheduler.start()
 
     def read_serial(self):
+        reader = acquisition.ChunkedLineReader(self.serial_port)
+        scheduler = self.render_scheduler
+        received = 0
         while self.running:
+            batch = []
             try:
-                line = self.serial_port.readline().decode().strip()
-                if self.handle_serial_data(line):
-                    self.update_plots()
+                for line in reader.read_lines():
+                    sample = self.parse_serial_data(line)
+                    if sample is not None:
+                        batch.append(sample)
+                        received += 1
+                    # Đủ số điểm của tất cả các lần lặp thì tự dừng và trả cổng
+                    if received >= self.expected_points:
+                        self.running = False
+                        break
             except Exception as e:
                 print("Serial error:", e)
-
-    def update_plots(self):
+                if not self.serial_port.is_open:
+                    break
+            finally:
+                if batch:
+                    scheduler.push(batch)
+        self.running = False
+        self.serial_port.release()
+        scheduler.finish()
+        self.root.after(0, self.enable_buttons)
+
+    def create_plot_lines(self):
+        # Đường vẽ cố định: mỗi lần cập nhật chỉ set_data rồi blit
+        self.line_mag, = self.ax_bode.plot([], [], 'b-', label='Magnitude')
+        self.line_phase, = self.ax_phase.plot([], [], 'r-', label='Phase')
+        self.ax_bode.legend([self.line_mag, self.line_phase], ['Magnitude', 'Phase'], loc='upper right')
+        self.line_nyquist, = self.ax_nyquist.plot([], [], 'k-s', linewidth=1, markersize=4)
+        self.line_nyquist_fit, = self.ax_nyquist.plot([], [], 'b--', linewidth=1.5)
+        self.blit_bode = render.BlitManager(self.canvas_bode, [self.line_mag, self.line_phase])
+        self.blit_nyquist = render.BlitManager(self.canvas_nyquist, [self.line_nyquist])
+        # Chỉ đưa cho matplotlib số điểm cỡ độ phân giải màn hình
+        self.traces = [render.DecimatedLine(line) for line in self.blit_bode.artists + self.blit_nyquist.artists]
+        self.trace_mag, self.trace_phase, self.trace_nyquist = self.traces
+        # Đường mô hình đã ít điểm (circuits.CURVE_POINTS), không cần thu gọn
+        self.line_nyquist_fit.set_animated(True)
+        self.blit_nyquist.artists.append(self.line_nyquist_fit)
+
+    def update_plots(self, live=False):
+        # live=True: đang đo, chỉ vẽ lại toàn bộ khi dữ liệu vượt ra ngoài trục
         if self.receiver_count < 5:
             return
         mag_smooth, pha_smooth = self.smooth_bode()
-        re_smooth, im_smooth = self.smooth_nyquist()
+        re_smooth, im_smooth = self.smooth_nyquist(live)
         freqs = self.freqs
 
-        self.ax_bode.clear()
-        self.ax_phase.clear()
-        self.ax_bode.plot(freqs, mag_smooth, 'b-', label='Magnitude')
-        self.ax_phase.plot(freqs, pha_smooth, 'r-', label='Phase')
-        self.ax_bode.set_xlabel("Frequency (Hz)", fontsize=11)
-        self.ax_bode.set_ylabel("Magnitude (Ω)", fontsize=11, color='b')
-        self.ax_phase.set_ylabel("Phase (°)", fontsize=11, color='r')
-        self.ax_bode.tick_params(axis='y', labelcolor='b')
-        self.ax_phase.tick_params(axis='y', labelcolor='r')
-        self.ax_bode.grid(True, linestyle='--', alpha=0.6)
-        lines1, labels1 = self.ax_bode.get_legend_handles_labels()
-        lines2, labels2 = self.ax_phase.get_legend_handles_labels()
-        self.ax_bode.legend(lines1 + lines2, labels1 + labels2, loc='upper right')
-        self.fig_bode.tight_layout()
-        self.canvas_bode.draw()
-
-        self.ax_nyquist.clear()
-        self.ax_nyquist.plot(re_smooth, im_smooth, 'k-', linewidth=1)
-        self.ax_nyquist.plot(re_smooth, im_smooth, 'ks', markersize=4)
-        self.ax_nyquist.set_xlabel("Z' (Ω)", fontsize=11)
-        self.ax_nyquist.set_ylabel("Z'' (Ω)", fontsize=11)
-        self.ax_nyquist.grid(True, linestyle='--', alpha=0.6)
-        self.fig_nyquist.tight_layout()
-        self.canvas_nyquist.draw()
+        self.trace_mag.set_data(freqs, mag_smooth)
+        self.trace_phase.set_data(freqs, pha_smooth)
+        x_lim = render.padded(freqs.min(), freqs.max())
+        changed = render.apply_limits(self.ax_bode, x_lim, render.padded(mag_smooth.min(), mag_smooth.max()), live)
+        changed = render.apply_limits(self.ax_phase, None, render.padded(pha_smooth.min(), pha_smooth.max()), live) or changed
+        if changed or not live:
+            self.ax_bode.set_xlabel("Frequency (Hz)", fontsize=11)
+            self.ax_bode.set_ylabel("Magnitude (Ω)", fontsize=11, color='b')
+            self.ax_phase.set_ylabel("Phase (°)", fontsize=11, color='r')
+            self.ax_bode.tick_params(axis='y', labelcolor='b')
+            self.ax_phase.tick_params(axis='y', labelcolor='r')
+            self.ax_bode.grid(True, linestyle='--', alpha=0.6)
+            self.fig_bode.tight_layout()
+            self.blit_bode.redraw()
+        else:
+            self.blit_bode.update()
+
+        self.trace_nyquist.set_data(re_smooth, im_smooth)
+        changed = render.apply_limits(self.ax_nyquist, render.padded(re_smooth.min(), re_smooth.max()),
+                                      render.padded(im_smooth.min(), im_smooth.max()), live)
+        if changed or not live:
+            self.ax_nyquist.set_xlabel("Z' (Ω)", fontsize=11)
+            self.ax_nyquist.set_ylabel("Z'' (Ω)", fontsize=11)
+            self.ax_nyquist.grid(True, linestyle='--', alpha=0.6)
+            self.fig_nyquist.tight_layout()
+            self.blit_nyquist.redraw()
+        else:
+            self.blit_nyquist.update()
 
     def export_excel(self):
         file = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
@@ -2175,12 +2735,9 @@ class EIS2EApp:
             try:
                 df_meta = pd.read_excel(file, sheet_name='EIS Data', nrows=6, header=None)
                 df_data = pd.read_excel(file, sheet_name='EIS Data', skiprows=7)
-                self.freqs = df_data['Freq'].tolist()
-                self.magnitudes = df_data['|Z|'].tolist()
-                self.phases = df_data['Phase'].tolist()
-                self.reals = df_data['Re(Z)'].tolist()
-                self.imags = df_data['Im(Z)'].tolist()
-                self.receiver_count = len(self.freqs)
+                self.clear_all()
+                self.samples.extend(df_data['Freq'], df_data['|Z|'], df_data['Phase'],
+                                    df_data['Re(Z)'], df_data['Im(Z)'])
                 self.start_freq.delete(0, tk.END)
                 self.stop_freq.delete(0, tk.END)
                 self.points.delete(0, tk.END)
@@ -2189,82 +2746,108 @@ class EIS2EApp:
                 self.stop_freq.insert(0, str(df_meta.iloc[3, 1]))
                 self.points.insert(0, str(df_meta.iloc[4, 1]))
                 self.repeats.insert(0, str(df_meta.iloc[5, 1]))
+                self.analyze_imported()
                 self.update_plots()
             except Exception as e:
                 messagebox.showerror("Import Error", f"Failed to import Excel file:\\n{e}")
       
-root = tk.Tk()
-root.title("Hệ thống đo điện hóa")
-root.geometry("1500x1400")
-
-# ======= Tạo thanh menu chọn SWV hoặc EIS =======
-nav_frame = ttk.Frame(root)
-nav_frame.pack(fill="x", pady=5)
-
-# Style chung cho tất cả các nút menu
-button_style = ttk.Style()
-button_style.configure(
-    "Nav.TButton",
-    font=("Segoe UI", 14, "bold"),
-    padding=(10, 5),
-    anchor="center"
-)
-button_style.map("Nav.TButton", background=[('active', '#B1F0C8')])
-
-main_frame = ttk.Frame(root)
-main_frame.pack(fill="both", expand=True)
-
-frame_swv = ttk.Frame(main_frame)
-frame_cv = ttk.Frame(main_frame)
-frame_eis_3e = ttk.Frame(main_frame)
-frame_ca = ttk.Frame(main_frame)
-frame_eis_2e = ttk.Frame(main_frame)
-frame_dpv = ttk.Frame(main_frame)
-for frame in (frame_swv, frame_cv, frame_eis_3e, frame_ca, frame_eis_2e, frame_dpv):
-    frame.place(in_=main_frame, x=0, y=0, relwidth=1, relheight=1)
-
-nav_buttons = [
-    ("SWV", frame_swv),
-    ("CV", frame_cv),
-    ("EIS_3E", frame_eis_3e),
-    ("CA", frame_ca),
-    ("EIS_2E", frame_eis_2e),
-    ("DPV", frame_dpv)
-]
-
 def show_frame(f):
     f.tkraise()
 
-for i, (label, frame) in enumerate(nav_buttons):
-    btn = ttk.Button(
-        nav_frame,
-        text=label,
-        command=lambda f=frame: show_frame(f),
-        style="Nav.TButton"
+
+def main():
+    root = tk.Tk()
+    root.title("Hệ thống đo điện hóa")
+    root.geometry("1500x1400")
+
+    # ======= Tạo thanh menu chọn SWV hoặc EIS =======
+    nav_frame = ttk.Frame(root)
+    nav_frame.pack(fill="x", pady=5)
+
+    # Style chung cho tất cả các nút menu
+    button_style = ttk.Style()
+    button_style.configure(
+        "Nav.TButton",
+        font=("Segoe UI", 14, "bold"),
+        padding=(10, 5),
+        anchor="center"
     )
-    btn.grid(row=0, column=i, sticky="nsew", padx=8, pady=2, ipady=10)
+    button_style.map("Nav.TButton", background=[('active', '#B1F0C8')])
+
+    main_frame = ttk.Frame(root)
+    main_frame.pack(fill="both", expand=True)
+
+    frame_swv = ttk.Frame(main_frame)
+    frame_cv = ttk.Frame(main_frame)
+    frame_eis_3e = ttk.Frame(main_frame)
+    frame_ca = ttk.Frame(main_frame)
+    frame_eis_2e = ttk.Frame(main_frame)
+    frame_dpv = ttk.Frame(main_frame)
+    for frame in (frame_swv, frame_cv, frame_eis_3e, frame_ca, frame_eis_2e, frame_dpv):
+        frame.place(in_=main_frame, x=0, y=0, relwidth=1, relheight=1)
+
+    nav_buttons = [
+        ("SWV", frame_swv),
+        ("CV", frame_cv),
+        ("EIS_3E", frame_eis_3e),
+        ("CA", frame_ca),
+        ("EIS_2E", frame_eis_2e),
+        ("DPV", frame_dpv)
+    ]
+
+    for i, (label, frame) in enumerate(nav_buttons):
+        btn = ttk.Button(
+            nav_frame,
+            text=label,
+            command=lambda f=frame: show_frame(f),
+            style="Nav.TButton"
+        )
+        btn.grid(row=0, column=i, sticky="nsew", padx=8, pady=2, ipady=10)
+
+    for i in range(len(nav_buttons)):
+        nav_frame.columnconfigure(i, weight=1)
+
+    # Một cổng serial dùng chung cho mọi tab, đổi tab không phải kết nối lại
+    # --simulate: mọi cổng (gõ tên bất kỳ, ví dụ SIM) đều nối tới thiết bị giả lập
+    if "--simulate" in sys.argv:
+        import simulator
+        serial_manager = connection.SerialManager(serial_factory=simulator.serial_factory())
+    else:
+        serial_manager = connection.SerialManager()
+
+    # --filter=KỸ_THUẬT=BỘ_LỌC[:tham_số=giá_trị,...] đổi bộ lọc của một kỹ thuật (xem filters.TECHNIQUE_FILTERS),
+    # ví dụ: --filter=dpv=savgol:window=9,polyorder=2  --filter=eis_3e_nyquist=median:window=5
+    # --sessions=THƯ_MỤC đổi nơi lưu file phiên đo (mặc định session.SESSION_DIR)
+    for arg in sys.argv[1:]:
+        if arg.startswith("--filter="):
+            key, _, spec = arg[len("--filter="):].partition("=")
+            name, params = filters.parse_spec(spec)
+            filters.set_technique_filter(key, name, **params)
+        elif arg.startswith("--sessions="):
+            session.SESSION_DIR = arg[len("--sessions="):]
+
+    # ==== TẠO GIAO DIỆN SWV  ====
+    swv_app = SWVApp(frame_swv, serial_manager)
 
-for i in range(len(nav_buttons)):
-    nav_frame.columnconfigure(i, weight=1)
+    # ==== TẠO GIAO DIỆN CV  ====
+    cv_app = CVApp(frame_cv, serial_manager)
 
-# ==== TẠO GIAO DIỆN SWV  ====
-swv_app = SWVApp(frame_swv)
+    # ==== TẠO GIAO DIỆN EIS_3E  ====
+    eis_3e_app = EISApp(frame_eis_3e, serial_manager)
 
-# ==== TẠO GIAO DIỆN CV  ====
-cv_app = CVApp(frame_cv)
+    # ==== TẠO GIAO DIỆN CA  ====
+    ca_app = ChronoAmperometryApp(frame_ca, serial_manager)
 
-# ==== TẠO GIAO DIỆN EIS_3E  ====
-eis_3e_app = EISApp(frame_eis_3e)
+    # ==== TẠO GIAO DIỆN EIS_2E  ====
+    eis_2e_app = EIS2EApp(frame_eis_2e, serial_manager)
 
-# ==== TẠO GIAO DIỆN CA  ====
-ca_app = ChronoAmperometryApp(frame_ca)
+    # ==== TẠO GIAO DIỆN DPV  ====
+    dpv_app = DPVApp(frame_dpv, serial_manager)
 
-# ==== TẠO GIAO DIỆN EIS_2E  ====
-eis_2e_app = EIS2EApp(frame_eis_2e)
+    # Khởi đầu với giao diện SWV
+    show_frame(frame_swv)
+    root.mainloop()
 
-# ==== TẠO GIAO DIỆN DPV  ====
-dpv_app = DPVApp(frame_dpv)
 
-# Khởi đầu với giao diện SWV
-show_frame(frame_swv)
-root.mainloop()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+# Tìm và định lượng đỉnh DPV/SWV: thay việc mở từng CSV để đọc dòng đỉnh bằng tay.
+# Mỗi quét (điện thế x, dòng y):
+#   1. đường nền: "linear" khớp đường thẳng trên EDGE phần đầu + cuối quét,
+#                 "asls" bình phương tối thiểu bất đối xứng (Eilers): z = argmin sum w(y-z)^2 + lam*sum(D2 z)^2,
+#                 w = p nơi y > z (đỉnh), 1 - p nơi còn lại, lặp vài lần
+#   2. tín hiệu trừ nền s = y - z; đỉnh là cực đại cục bộ của s cao >= min_height và >= rel_height * đỉnh cao nhất;
+#      hai đỉnh liền nhau mà đáy giữa chúng không sâu hơn prominence * đỉnh cao nhất (nhiễu trên đỉnh) chỉ giữ đỉnh cao hơn
+#   3. chiều cao s tại đỉnh, điện thế đỉnh, diện tích hình thang của s giữa hai chân đỉnh
+#      (nơi s cắt đường nền, hoặc điểm thấp nhất giữa hai đỉnh liền nhau)
+# Nhiều quét cùng số điểm xếp thành ma trận (quét x điểm) và mọi bước tính bằng mảng trên cả ma trận,
+# nên cả thư mục file xuất (analyze_directory) chỉ tốn vài lần gọi NumPy cho mỗi nhóm cùng độ dài.
+#
+# Dòng lệnh: python peaks.py THƯ_MỤC [--baseline asls] [--polarity auto] [--output peaks.csv]
+import argparse
+import csv
+import glob
+import os
+
+import numpy as np
+
+import buffers
+import importer
+
+BASELINES = ("linear", "asls")
+POLARITIES = ("positive", "negative", "auto")
+# Phần đầu/cuối quét dùng khớp đường nền tuyến tính
+EDGE = 0.1
+# Tham số AsLS: độ trơn (theo đơn vị chỉ số điểm), trọng số phần trên nền, số lần lặp
+ASLS_LAM = 1e5
+ASLS_P = 0.01
+ASLS_ITERATIONS = 10
+# Bỏ đỉnh thấp hơn tỉ lệ này của đỉnh cao nhất trong quét; số đỉnh tối đa mỗi quét
+REL_HEIGHT = 0.05
+MAX_PEAKS = 5
+# Độ sâu tối thiểu (tỉ lệ đỉnh cao nhất) của đáy giữa hai đỉnh để tính là hai đỉnh riêng
+PROMINENCE = 0.1
+# Cột (điện thế, dòng đã lọc, dòng thô) trong file xuất của từng kỹ thuật
+TECHNIQUE_COLUMNS = {"dpv": (0, 2, 1), "swv": (0, 4, 1)}
+PEAK_COLUMNS = ("scan", "index", "potential", "height", "area", "left", "right")
+
+
+def _as_matrix(values):
+    return np.atleast_2d(np.asarray(values, dtype=np.float64))
+
+
+def linear_baseline(x, y, edge=EDGE):
+    # Đường thẳng khớp bình phương tối thiểu trên edge phần đầu và cuối mỗi quét
+    x, y = _as_matrix(x), _as_matrix(y)
+    n = y.shape[1]
+    k = max(2, int(round(n * edge)))
+    pick = np.r_[0:min(k, n), max(n - k, 0):n]
+    xs, ys = x[:, pick], y[:, pick]
+    dx = xs - xs.mean(axis=1, keepdims=True)
+    var = (dx * dx).sum(axis=1, keepdims=True)
+    slope = np.divide((dx * (ys - ys.mean(axis=1, keepdims=True))).sum(axis=1, keepdims=True), var,
+                      out=np.zeros_like(var), where=var > 0)
+    return ys.mean(axis=1, keepdims=True) + slope * (x - xs.mean(axis=1, keepdims=True))
+
+
+def _penta_solve(diag, off1, off2, rhs):
+    # Giải (diag, off1, off2) z = rhs cho nhiều hệ đối xứng 5 đường chéo cùng lúc (LDL^T, vòng lặp theo điểm,
+    # mỗi bước tính trên mọi quét). diag, rhs: (quét x n); off1: (n - 1); off2: (n - 2)
+    m, n = diag.shape
+    d = np.empty((m, n))
+    l1 = np.zeros((m, n))
+    l2 = np.zeros((m, n))
+    z = np.empty((m, n))
+    for i in range(n):
+        di = diag[:, i].copy()
+        zi = rhs[:, i].copy()
+        if i >= 2:
+            l2[:, i] = off2[i - 2] / d[:, i - 2]
+            di -= l2[:, i] ** 2 * d[:, i - 2]
+            zi -= l2[:, i] * z[:, i - 2]
+        if i >= 1:
+            l1[:, i] = (off1[i - 1] - l2[:, i] * l1[:, i - 1] * d[:, i - 2 if i >= 2 else 0]) / d[:, i - 1]
+            di -= l1[:, i] ** 2 * d[:, i - 1]
+            zi -= l1[:, i] * z[:, i - 1]
+        d[:, i] = di
+        z[:, i] = zi
+    z /= d
+    for i in range(n - 2, -1, -1):
+        z[:, i] -= l1[:, i + 1] * z[:, i + 1]
+        if i + 2 < n:
+            z[:, i] -= l2[:, i + 2] * z[:, i + 2]
+    return z
+
+
+def asls_baseline(y, lam=ASLS_LAM, p=ASLS_P, iterations=ASLS_ITERATIONS):
+    # Đường nền AsLS (Eilers & Boelens 2005) cho mỗi hàng của y; hệ W + lam D2^T D2 là ma trận 5 đường chéo
+    y = _as_matrix(y)
+    n = y.shape[1]
+    if n < 5:
+        return linear_baseline(np.arange(n) + np.zeros_like(y), y)
+    # D2^T D2 (D2: sai phân bậc 2)
+    base = np.full(n, 6.0)
+    base[[0, -1]] = 1.0
+    base[[1, -2]] = 5.0
+    off1 = np.full(n - 1, -4.0 * lam)
+    off1[[0, -1]] = -2.0 * lam
+    off2 = np.full(n - 2, lam)
+    w = np.ones_like(y)
+    z = y
+    for _ in range(iterations):
+        z = _penta_solve(w + lam * base, off1, off2, w * y)
+        w = np.where(y > z, p, 1.0 - p)
+    return z
+
+
+def baseline(x, y, method="linear", **params):
+    if method == "linear":
+        return linear_baseline(x, y, **params)
+    if method == "asls":
+        return asls_baseline(y, **params)
+    raise ValueError(f"Không có đường nền {method} (chọn: {', '.join(BASELINES)})")
+
+
+def _drop_shallow(signal, scans, index, prominence):
+    # Đỉnh theo thứ tự (quét, điểm). Hai đỉnh liền nhau cùng quét có đáy (min của s giữa chúng) không thấp hơn
+    # đỉnh thấp hơn ít nhất prominence[quét]: bỏ đỉnh thấp hơn; lặp tới khi mọi cặp đạt
+    n = signal.shape[1]
+    flat = signal.ravel()
+    while len(scans) > 1:
+        start = scans * n + index
+        heights = flat[start]
+        valley = np.minimum.reduceat(flat, start)[:-1]
+        shallow = ((scans[1:] == scans[:-1])
+                   & (np.minimum(heights[:-1], heights[1:]) - valley < prominence[scans[1:]]))
+        if not shallow.any():
+            break
+        left_lower = heights[:-1] < heights[1:]
+        drop = np.zeros(len(scans), dtype=bool)
+        drop[:-1] |= shallow & left_lower
+        drop[1:] |= shallow & ~left_lower
+        scans, index = scans[~drop], index[~drop]
+    return scans, index
+
+
+def _split_shared(table, signal):
+    # Hai đỉnh liền nhau không có điểm cắt đường nền giữa chúng: chia tại điểm thấp nhất giữa hai đỉnh
+    for k in range(len(table) - 1):
+        if table[k, 0] == table[k + 1, 0] and table[k, 6] > table[k + 1, 5]:
+            scan, a, b = int(table[k, 0]), int(table[k, 1]), int(table[k + 1, 1])
+            split = a + int(np.argmin(signal[scan, a:b + 1]))
+            table[k, 6] = table[k + 1, 5] = split
+
+
+def find_peaks(x, y, method="linear", polarity="positive", min_height=0.0, rel_height=REL_HEIGHT,
+               prominence=PROMINENCE, max_peaks=MAX_PEAKS, **params):
+    # x, y: một quét (n) hoặc nhiều quét cùng số điểm (quét x n).
+    # Trả về SampleBuffer PEAK_COLUMNS, mỗi đỉnh một hàng theo thứ tự (quét, điện thế):
+    # index là chỉ số điểm của đỉnh, left / right là điện thế hai chân đỉnh.
+    x, y = _as_matrix(x), _as_matrix(y)
+    x = np.broadcast_to(x, y.shape)
+    peaks = buffers.SampleBuffer(PEAK_COLUMNS)
+    m, n = y.shape
+    if n < 3:
+        return peaks
+    if polarity == "auto":
+        # Chiều đỉnh theo độ lệch lớn nhất khỏi đường nền tuyến tính
+        r = y - linear_baseline(x, y)
+        sign = np.where(r.max(axis=1) >= -r.min(axis=1), 1.0, -1.0)[:, None]
+    elif polarity in ("positive", "negative"):
+        sign = np.full((m, 1), 1.0 if polarity == "positive" else -1.0)
+    else:
+        raise ValueError(f"polarity phải là một trong {', '.join(POLARITIES)}")
+    signal = sign * y
+    signal = signal - baseline(x, signal, method, **params)
+
+    inner = signal[:, 1:-1]
+    top = np.where(np.isfinite(signal), signal, -np.inf).max(axis=1, keepdims=True)
+    is_peak = ((inner > signal[:, :-2]) & (inner >= signal[:, 2:]) & (inner > 0)
+               & (inner >= min_height) & (inner >= rel_height * top))
+    scans, index = np.nonzero(is_peak)
+    scans, index = _drop_shallow(signal, scans, index + 1, prominence * top[:, 0])
+    heights = signal[scans, index]
+    # max_peaks đỉnh cao nhất mỗi quét
+    order = np.lexsort((-heights, scans))
+    scans, index, heights = scans[order], index[order], heights[order]
+    first = np.searchsorted(scans, scans)
+    keep = np.arange(len(scans)) - first < max_peaks
+    scans, index, heights = scans[keep], index[keep], heights[keep]
+    order = np.lexsort((index, scans))
+    scans, index, heights = scans[order], index[order], heights[order]
+
+    # Chân đỉnh: điểm gần nhất mỗi bên có s <= 0
+    positions = np.arange(n)
+    below = ~(signal > 0)
+    left = np.maximum.accumulate(np.where(below, positions, 0), axis=1)
+    right = np.minimum.accumulate(np.where(below, positions, n - 1)[:, ::-1], axis=1)[:, ::-1]
+    table = np.column_stack((scans, index, np.zeros(len(scans)), heights, np.zeros(len(scans)),
+                             left[scans, index], right[scans, index])).astype(np.float64)
+    _split_shared(table, signal)
+
+    # Diện tích: tích phân hình thang luỹ kế của s theo |dx|
+    cumulative = np.zeros((m, n))
+    np.cumsum(0.5 * (signal[:, 1:] + signal[:, :-1]) * np.abs(np.diff(x, axis=1)), axis=1, out=cumulative[:, 1:])
+    lo, hi = table[:, 5].astype(np.intp), table[:, 6].astype(np.intp)
+    table[:, 2] = x[scans, index]
+    table[:, 3] = sign[scans, 0] * heights
+    table[:, 4] = cumulative[scans, hi] - cumulative[scans, lo]
+    table[:, 5] = x[scans, lo]
+    table[:, 6] = x[scans, hi]
+    peaks.extend_rows(table)
+    return peaks
+
+
+def describe(peaks, limit=3):
+    # limit đỉnh lớn nhất (theo thứ tự điện thế) dạng chữ để hiện trên giao diện
+    order = sorted(np.argsort(-np.abs(peaks["height"]))[:limit])
+    lines = [f"Ep {peaks['potential'][k]:.1f} mV  Ip {peaks['height'][k]:.4g} μA\n    A {peaks['area'][k]:.4g} μA·mV"
+             for k in order]
+    return "\n".join(lines) or "Không tìm thấy đỉnh"
+
+
+def read_scan(path, technique=None):
+    # (điện thế, dòng) của một file CSV xuất từ DPV/SWV; dùng cột đã lọc nếu đầy đủ, không thì cột thô
+    export = importer.CsvExport(path)
+    if technique is None:
+        technique = "swv" if export.parameter("Frequency") is not None else "dpv"
+    voltage, filtered, raw = TECHNIQUE_COLUMNS[technique]
+    data = export.read((voltage, filtered, raw), required=1)
+    if len(data) == 0:
+        raise ValueError("File không có dữ liệu")
+    x, y_filtered, y_raw = (data[c] for c in data.columns)
+    return x, y_filtered if not np.isnan(y_filtered).any() else y_raw
+
+
+def analyze_scans(scans, **options):
+    # scans: list (x, y) có thể khác số điểm; các quét cùng số điểm được tính chung một ma trận.
+    # Trả về bảng đỉnh với cột scan là vị trí trong scans
+    peaks = buffers.SampleBuffer(PEAK_COLUMNS)
+    groups = {}
+    for i, (x, y) in enumerate(scans):
+        groups.setdefault(len(y), []).append(i)
+    parts = []
+    for n, members in groups.items():
+        x = np.array([scans[i][0] for i in members], dtype=np.float64)
+        y = np.array([scans[i][1] for i in members], dtype=np.float64)
+        table = find_peaks(x, y, **options)
+        rows = np.column_stack([table[c] for c in PEAK_COLUMNS])
+        rows[:, 0] = np.asarray(members)[rows[:, 0].astype(np.intp)]
+        parts.append(rows)
+    if parts:
+        rows = np.concatenate(parts)
+        peaks.extend_rows(rows[np.lexsort((rows[:, 2], rows[:, 0]))])
+    return peaks
+
+
+def analyze_directory(directory, pattern="*.csv", technique=None, **options):
+    # Mọi file xuất DPV/SWV trong thư mục -> (danh sách file, bảng đỉnh); file đọc lỗi được bỏ qua
+    files, scans = [], []
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        try:
+            scans.append(read_scan(path, technique))
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            print("Bỏ qua", path, ":", e)
+            continue
+        files.append(path)
+    return files, analyze_scans(scans, **options)
+
+
+def write_table(path, files, peaks):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["File", "Peak", "Potential (mV)", "Height (μA)", "Area (μA·mV)", "Left (mV)", "Right (mV)"])
+        number = 0
+        for k, (scan, index, potential, height, area, left, right) in enumerate(peaks.rows()):
+            number = number + 1 if k and peaks["scan"][k - 1] == scan else 1
+            writer.writerow([os.path.basename(files[int(scan)]), number, potential, height, area, left, right])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tìm và định lượng đỉnh trong các file xuất DPV/SWV")
+    parser.add_argument("directory")
+    parser.add_argument("--pattern", default="*.csv")
+    parser.add_argument("--technique", choices=sorted(TECHNIQUE_COLUMNS), help="mặc định: nhận theo tham số trong file")
+    parser.add_argument("--baseline", default="linear", choices=BASELINES)
+    parser.add_argument("--polarity", default="auto", choices=POLARITIES)
+    parser.add_argument("--max-peaks", type=int, default=MAX_PEAKS)
+    parser.add_argument("--output", default="peaks.csv")
+    args = parser.parse_args()
+
+    files, peaks = analyze_directory(args.directory, args.pattern, args.technique, method=args.baseline,
+                                     polarity=args.polarity, max_peaks=args.max_peaks)
+    write_table(args.output, files, peaks)
+    print(f"{len(files)} file, {len(peaks)} đỉnh -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# Vẽ đồ thị trên luồng Tk với tốc độ khung hình giới hạn.
+# Luồng đọc serial chỉ đẩy mẫu vào hàng đợi (push) rồi đọc tiếp, không bao giờ chờ matplotlib.
+# Trên luồng Tk, mỗi khung hình (tick) gom toàn bộ mẫu mới, gọi consume() một lần và vẽ lại một lần.
+#
+# Các đường vẽ được tạo một lần, cập nhật bằng set_data và vẽ lại bằng blit lên nền đã lưu
+# (BlitManager); chỉ khi giới hạn trục thay đổi mới vẽ lại toàn bộ figure.
+#
+# DecimatedLine: matplotlib chỉ nhận số điểm cỡ số pixel chiều ngang của trục (LTTB hoặc min/max
+# mỗi pixel), dữ liệu đầy đủ vẫn nằm trong bộ đệm của app để xuất file. Khi giới hạn trục x đổi
+# (zoom/pan bằng NavigationToolbar2Tk, apply_limits) thì thu gọn lại theo vùng đang nhìn.
+import queue
+import time
+
+import numpy as np
+
+import acquisition
+
+RENDER_FPS = 20
+# Thu gọn khi số điểm vượt quá DECIMATE_FACTOR lần số pixel chiều ngang của trục
+DECIMATE_FACTOR = 2
+# lttb_indices chuyển sang duyệt tuần tự khi tổng số nhóm đã tính lại vượt LTTB_SWEEPS lần số nhóm
+LTTB_SWEEPS = 32
+# Dữ liệu dài hơn LTTB_PRESELECT lần số điểm cần vẽ: lọc trước bằng min/max rồi mới chạy LTTB (MinMaxLTTB)
+LTTB_PRESELECT = 4
+
+
+# Khi đang đo, trục được nới thêm 25% về phía dữ liệu tăng để không phải vẽ lại toàn bộ mỗi khung
+LIVE_HEADROOM = 0.25
+
+
+class RenderScheduler:
+    def __init__(self, widget, render, consume=None, fps=RENDER_FPS, on_finish=None):
+        self.widget = widget
+        self.render = render
+        self.consume = consume
+        self.on_finish = on_finish
+        self.interval_ms = max(1, int(1000 / fps))
+        self.queue = queue.Queue()
+        self.dirty = False
+        self.running = False
+        self.frames = 0
+        self.render_time = 0.0
+
+    # ==== GỌI TỪ LUỒNG BẤT KỲ ====
+    def push(self, samples):
+        # samples: list các mẫu nhận được trong một lần đọc
+        self.queue.put(samples)
+
+    def request(self):
+        # Yêu cầu vẽ lại dù không có mẫu mới
+        self.dirty = True
+
+    def finish(self):
+        # Vẽ nốt các mẫu còn lại rồi dừng
+        self.queue.put(None)
+
+    # ==== GỌI TỪ LUỒNG TK ====
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.widget.after(self.interval_ms, self._tick)
+
+    def cancel(self):
+        # Bỏ các mẫu chưa vẽ (ví dụ khi bắt đầu phép đo mới)
+        self.running = False
+
+    def _tick(self):
+        if not self.running:
+            return
+        samples, finished = acquisition.drain_queue(self.queue)
+        if samples and self.consume is not None:
+            self.consume(samples)
+        if samples or self.dirty:
+            self.dirty = False
+            t0 = time.perf_counter()
+            try:
+                self.render()
+            except Exception as e:
+                print("Lỗi vẽ đồ thị:", e)
+            self.render_time += time.perf_counter() - t0
+            self.frames += 1
+        if finished:
+            self.running = False
+            if self.on_finish is not None:
+                self.on_finish()
+            return
+        self.widget.after(self.interval_ms, self._tick)
+
+
+class BlitManager:
+    # Các artist animated chỉ được vẽ lên nền (background) đã lưu sau lần vẽ toàn bộ gần nhất
+    def __init__(self, canvas, artists):
+        self.canvas = canvas
+        self.artists = list(artists)
+        self.background = None
+        for artist in self.artists:
+            artist.set_animated(True)
+        canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        # Sau mỗi lần vẽ toàn bộ (kể cả khi đổi kích thước cửa sổ): lưu nền rồi vẽ các đường lên trên
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        figure = self.canvas.figure
+        for artist in self.artists:
+            figure.draw_artist(artist)
+
+    def redraw(self):
+        # Vẽ toàn bộ: trục, nhãn, lưới... (dùng khi giới hạn trục hoặc nhãn thay đổi)
+        self.canvas.draw()
+
+    def update(self):
+        if self.background is None:
+            self.redraw()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+
+def padded(lo, hi, margin=0.05):
+    # Mở rộng mỗi đầu một khoảng margin; nếu lo == hi thì mở rộng ±10%
+    if lo == hi:
+        delta = abs(lo) * 0.1 if lo != 0 else 1
+        return lo - delta, hi + delta
+    pad = (hi - lo) * margin
+    return lo - pad, hi + pad
+
+
+def live_limits(lo, hi, current, headroom=LIVE_HEADROOM):
+    # None nếu [lo, hi] vẫn nằm trong giới hạn hiện tại, ngược lại giới hạn mới có chừa khoảng trống
+    cur_lo, cur_hi = current
+    if cur_lo <= lo and hi <= cur_hi:
+        return None
+    extra = (hi - lo) * headroom
+    return (lo - extra if lo < cur_lo else lo), (hi + extra if hi > cur_hi else hi)
+
+
+def apply_limits(ax, xlim=None, ylim=None, live=False):
+    # Đặt giới hạn trục; trả về True nếu giới hạn thay đổi (phải vẽ lại toàn bộ)
+    changed = False
+    for lim, get_lim, set_lim in ((xlim, ax.get_xlim, ax.set_xlim), (ylim, ax.get_ylim, ax.set_ylim)):
+        if lim is None:
+            continue
+        if live:
+            lim = live_limits(lim[0], lim[1], get_lim())
+            if lim is None:
+                continue
+        elif tuple(lim) == tuple(get_lim()):
+            continue
+        set_lim(*lim)
+        changed = True
+    return changed
+
+
+# ==== THU GỌN DỮ LIỆU ĐỂ VẼ ====
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: chỉ số của threshold điểm (giữ điểm đầu, cuối; mỗi nhóm giữa chọn
+    # điểm tạo tam giác lớn nhất với điểm đã chọn ở nhóm trước và trung bình nhóm sau).
+    # Lựa chọn ở nhóm k phụ thuộc nhóm k-1: thay vì duyệt tuần tự, tính mọi nhóm cùng lúc (vector hoá)
+    # rồi chỉ tính lại các nhóm có nhóm trước vừa đổi lựa chọn, tới khi không còn nhóm nào đổi.
+    # Kết quả trùng với LTTB tuần tự.
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.intp) + 1
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts, x[n - 1])[1:]
+    mean_y = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts, y[n - 1])[1:]
+    # Ma trận (nhóm, điểm): nhóm ngắn hơn được lặp lại điểm cuối (không ảnh hưởng argmax)
+    index = np.minimum(edges[:-1, None] + np.arange(counts.max()), edges[1:, None] - 1)
+    bx, by = x[index], y[index]
+
+    def select(buckets, anchors):
+        ax, ay = x[anchors][:, None], y[anchors][:, None]
+        cx, cy = mean_x[buckets][:, None], mean_y[buckets][:, None]
+        area = np.abs((ax - cx) * (by[buckets] - ay) - (ax - bx[buckets]) * (cy - ay))
+        return index[buckets, area.argmax(axis=1)]
+
+    buckets = np.arange(len(index))
+    chosen = select(buckets, np.zeros(len(index), dtype=np.intp))
+    pending = buckets[1:]
+    budget = LTTB_SWEEPS * len(index)
+    while len(pending) and budget > 0:
+        budget -= len(pending)
+        updated = select(pending, chosen[pending - 1])
+        changed = pending[updated != chosen[pending]]
+        chosen[pending] = updated
+        pending = changed[changed < len(index) - 1] + 1
+    if len(pending) == 0:
+        return np.concatenate(([0], chosen, [n - 1]))
+    # Thay đổi lan truyền chậm (dữ liệu nhiễu, nhóm lớn): các nhóm trước pending[0] đã đúng, phần còn lại
+    # duyệt tuần tự
+    chosen = chosen.tolist()
+    a = chosen[pending[0] - 1]
+    for k in range(pending[0], len(index)):
+        ax, ay = float(x[a]), float(y[a])
+        alpha, beta = ax - mean_x[k], mean_y[k] - ay
+        area = np.abs(alpha * by[k] + beta * bx[k] - (alpha * ay + beta * ax))
+        a = chosen[k] = int(index[k, area.argmax()])
+    return np.concatenate(([0], chosen, [n - 1]))
+
+
+def minmax_indices(y, buckets):
+    # Chia theo chỉ số thành buckets nhóm liên tiếp, giữ điểm min và max của mỗi nhóm (theo thứ tự)
+    n = len(y)
+    size = -(-n // max(int(buckets), 1))
+    if size <= 2:
+        return np.arange(n)
+    full = n // size * size
+    groups = y[:full].reshape(-1, size)
+    offsets = np.arange(0, full, size)
+    lo = offsets + groups.argmin(axis=1)
+    hi = offsets + groups.argmax(axis=1)
+    pairs = np.column_stack((np.minimum(lo, hi), np.maximum(lo, hi))).ravel()
+    if full == n:
+        return pairs
+    tail = y[full:]
+    last = full + np.sort([tail.argmin(), tail.argmax()])
+    return np.concatenate((pairs, last))
+
+
+def decimate_indices(x, y, points, method="lttb"):
+    # Chỉ số các điểm cần vẽ (tăng dần), khoảng points điểm
+    if len(x) <= points:
+        return np.arange(len(x))
+    if method == "minmax":
+        return minmax_indices(y, points // 2)
+    if len(x) > LTTB_PRESELECT * points:
+        candidates = minmax_indices(y, LTTB_PRESELECT * points // 2)
+        return candidates[lttb_indices(x[candidates], y[candidates], points)]
+    return lttb_indices(x, y, points)
+
+
+def axes_width(ax):
+    # Số pixel chiều ngang của vùng vẽ
+    return max(int(ax.bbox.width), 1)
+
+
+class DecimatedLine:
+    # Thay cho line.set_data: lưu dữ liệu đầy đủ, chỉ đưa cho matplotlib các điểm cần cho độ phân giải màn hình.
+    #   method="lttb"    dữ liệu bất kỳ (CV, DPV, SWV, EIS)
+    #   method="minmax"  chuỗi thời gian nhiễu (CA), giữ nguyên đỉnh nhọn
+    #   monotonic=True   x tăng dần: chỉ thu gọn phần nằm trong giới hạn trục khi trục không tự co giãn
+    def __init__(self, line, method="lttb", monotonic=False, factor=DECIMATE_FACTOR):
+        self.line = line
+        self.method = method
+        self.monotonic = monotonic
+        self.factor = factor
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.xlim = None
+        line.axes.callbacks.connect("xlim_changed", self.on_xlim_changed)
+
+    def set_data(self, x, y):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.refresh()
+
+    def on_xlim_changed(self, ax):
+        if tuple(ax.get_xlim()) != self.xlim:
+            self.refresh()
+
+    def refresh(self):
+        ax = self.line.axes
+        self.xlim = tuple(ax.get_xlim())
+        x, y = self.x, self.y
+        points = axes_width(ax) * self.factor
+        zoomed = not ax.get_autoscalex_on() and len(x) > 1
+        if zoomed and self.monotonic:
+            # Vùng đang nhìn (thêm 1 điểm mỗi bên để đường vẽ chạm mép trục)
+            lo, hi = sorted(self.xlim)
+            start = max(int(np.searchsorted(x, lo)) - 1, 0)
+            stop = int(np.searchsorted(x, hi, side="right")) + 1
+            x, y = x[start:stop], y[start:stop]
+        elif zoomed:
+            # x không đơn điệu: tăng số điểm theo tỉ lệ phóng to để vùng đang nhìn vẫn đủ chi tiết
+            span = float(np.nanmax(x) - np.nanmin(x))
+            view = abs(self.xlim[1] - self.xlim[0])
+            if view > 0 and span > view:
+                points = int(points * span / view)
+        if len(x) > points:
+            index = decimate_indices(x, y, points, self.method)
+            x, y = x[index], y[index]
+        self.line.set_data(x, y)
@@ -0,0 +1,209 @@
+# Ghi phiên đo ra đĩa ngay trong lúc đo (không mất dữ liệu khi chương trình treo, rút USB, mất điện).
+# Mỗi phiên là một file nhị phân chỉ ghi nối tiếp trong SESSION_DIR: phần đầu JSON (kỹ thuật, tham số,
+# tên cột) ghi ngay khi bắt đầu đo, mỗi khối mẫu ghi ngay khi nhận được, đẩy xuống đĩa (flush + fsync)
+# theo chu kỳ. File phiên được giữ lại sau khi đo; xoá dữ liệu trên giao diện không xoá file.
+#
+# Định dạng (.session):
+#   MAGIC (8 byte) | độ dài phần đầu (uint32 little-endian) | JSON UTF-8, đệm dấu cách tới bội số của ALIGN
+#   | các mẫu: mỗi mẫu một bản ghi cố định gồm các cột theo "columns" (mặc định float64 little-endian)
+# Số mẫu suy ra từ kích thước file (bản ghi cuối ghi dở khi mất điện bị bỏ qua), nên phần dữ liệu đọc
+# được bằng np.memmap mà không cần nạp vào RAM: SessionFile(path)["Time (s)"][1000:2000].
+# CSV vẫn là định dạng xuất: SessionFile.to_csv ghi "csv_header" (các dòng tham số như file xuất cũ
+# của từng kỹ thuật), hàng tên cột rồi dữ liệu theo từng khối.
+import csv
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+SESSION_DIR = os.path.join(os.path.expanduser("~"), "eis_sessions")
+SESSION_EXT = ".session"
+MAGIC = b"EISSESS\x01"
+ALIGN = 64
+FORMAT_VERSION = 1
+# Chu kỳ (s) flush + fsync file phiên
+FLUSH_INTERVAL = 1.0
+# Số mẫu mỗi khối khi xuất CSV
+EXPORT_CHUNK = 100_000
+
+
+def session_path(technique, directory=None):
+    # <thư mục>/<kỹ thuật>_<ngày>_<giờ>.session, thêm hậu tố nếu trùng tên
+    directory = directory or SESSION_DIR
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, time.strftime(f"{technique}_%Y%m%d_%H%M%S"))
+    path = base + SESSION_EXT
+    suffix = 1
+    while os.path.exists(path):
+        path = f"{base}_{suffix}{SESSION_EXT}"
+        suffix += 1
+    return path
+
+
+def encode_header(meta):
+    body = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    padded = -(-(len(MAGIC) + 4 + len(body)) // ALIGN) * ALIGN - len(MAGIC) - 4
+    return MAGIC + struct.pack("<I", padded) + body.ljust(padded, b" ")
+
+
+def read_header(f):
+    # Trả về (meta, vị trí bắt đầu phần dữ liệu)
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Không phải file phiên đo")
+    (length,) = struct.unpack("<I", f.read(4))
+    meta = json.loads(f.read(length).decode("utf-8"))
+    return meta, len(MAGIC) + 4 + length
+
+
+def record_dtype(columns):
+    return np.dtype([(c["name"], c["dtype"]) for c in columns])
+
+
+class SessionWriter:
+    def __init__(self, path, technique, header_rows, columns, dtype="<f8", flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.columns = tuple(columns)
+        self.flush_interval = flush_interval
+        self.size = 0
+        self.error = None
+        self.meta = {
+            "format": "eis-session",
+            "version": FORMAT_VERSION,
+            "technique": technique,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "csv_header": [[str(v) for v in row] for row in header_rows],
+            "columns": [{"name": name, "dtype": np.dtype(dtype).str} for name in self.columns],
+        }
+        self.dtype = record_dtype(self.meta["columns"])
+        self.file = open(path, "wb")
+        self.file.write(encode_header(self.meta))
+        self.sync()
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def append(self, *values):
+        self.extend(*([v] for v in values))
+
+    def extend(self, *columns):
+        # Nhiều mẫu theo cột, cùng thứ tự với columns
+        count = len(columns[0]) if columns else 0
+        if count == 0 or self.file.closed:
+            return
+        records = np.empty(count, dtype=self.dtype)
+        for name, values in zip(self.columns, columns):
+            records[name] = values
+        try:
+            self.file.write(records.tobytes())
+            self.size += count
+            if time.monotonic() - self._last_sync > self.flush_interval:
+                self.sync()
+        except OSError as e:
+            # Đĩa đầy / mất ổ: ngừng ghi phiên, phép đo vẫn tiếp tục trong bộ nhớ
+            print("Lỗi ghi file phiên đo:", e)
+            self.error = e
+            try:
+                self.file.close()
+            except OSError:
+                pass
+
+    def extend_rows(self, rows):
+        # Nhiều mẫu theo hàng: [(v1, v2, ...), ...]
+        if len(rows):
+            self.extend(*np.asarray(rows, dtype=np.float64).T)
+
+    def sync(self):
+        if not self.file.closed:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    @property
+    def complete(self):
+        # File phiên chứa đủ mọi mẫu đã nhận (không có lỗi ghi)
+        return self.error is None
+
+    def export_csv(self, path):
+        # Xuất: đẩy nốt dữ liệu xuống đĩa rồi chuyển file phiên sang CSV
+        self.sync()
+        SessionFile(self.path).to_csv(path)
+
+
+class SessionFile:
+    # Đọc file phiên đo: meta từ JSON, dữ liệu là np.memmap (chỉ đọc, không nạp cả file)
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.meta, self.offset = read_header(f)
+        self.dtype = record_dtype(self.meta["columns"])
+        self.size = max(os.path.getsize(path) - self.offset, 0) // self.dtype.itemsize
+        if self.size:
+            self.data = np.memmap(path, dtype=self.dtype, mode="r", offset=self.offset, shape=(self.size,))
+        else:
+            self.data = np.empty(0, dtype=self.dtype)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    @property
+    def technique(self):
+        return self.meta["technique"]
+
+    @property
+    def columns(self):
+        return self.dtype.names
+
+    @property
+    def header_rows(self):
+        return self.meta["csv_header"]
+
+    def parameter(self, name, default=None):
+        # Giá trị trong các dòng tham số ["Tên", giá trị, "[đơn vị]"]
+        for row in self.header_rows:
+            if len(row) >= 2 and row[0] == name:
+                return row[1]
+        return default
+
+    @property
+    def complete(self):
+        return True
+
+    def close(self):
+        self.data = np.empty(0, dtype=self.dtype)
+
+    def to_csv(self, path, chunk=EXPORT_CHUNK):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerows(self.header_rows)
+            writer.writerow(self.columns)
+            for start in range(0, self.size, chunk):
+                block = self.data[start:start + chunk]
+                writer.writerows(zip(*(block[name].tolist() for name in self.columns)))
+
+    def export_csv(self, path):
+        self.to_csv(path)
+
+
+def open_session(technique, header_rows, columns, directory=None):
+    # Mở phiên mới; lỗi ghi đĩa chỉ được báo ra console, phép đo vẫn tiếp tục (trả về None)
+    try:
+        writer = SessionWriter(session_path(technique, directory), technique, header_rows, columns)
+    except OSError as e:
+        print("Không tạo được file phiên đo:", e)
+        return None
+    print("Ghi phiên đo vào:", writer.path)
+    return writer
@@ -0,0 +1,324 @@
+# Thiết bị đo giả lập: nhận đúng các lệnh N#start?end/step|x$y! của firmware và
+# trả về dữ liệu giống thật (có "inf" ngẫu nhiên và dòng END) với tốc độ mẫu tùy chọn.
+#
+# Dùng như một cổng serial trong Python (loopback):
+#   manager = connection.SerialManager(serial_factory=simulator.serial_factory(sample_rate=50000))
+# hoặc mở pty để chương trình khác kết nối vào:
+#   python simulator.py --rate 2000 [--binary]
+import argparse
+import math
+import os
+import random
+import re
+import threading
+import time
+
+import acquisition
+
+COMMAND_RE = re.compile(r"(\d+)#(-?\d+)\?(-?\d+)/(-?\d+)\|(-?\d+)\$(-?\d+)!")
+STOP_BYTE = b"s"
+
+# Mạch Randles dùng cho EIS giả lập
+RANDLES_RS = 100.0
+RANDLES_RCT = 1000.0
+RANDLES_CDL = 1e-6
+
+
+class SimulatedPotentiostat:
+    # Giao diện giống serial.Serial: write / read / readline / in_waiting / is_open / close
+    def __init__(self, port="SIM", baudrate=115200, timeout=1, sample_rate=1000.0,
+                 binary=False, inf_rate=0.005, noise=0.01, seed=None, frame_samples=64):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.sample_rate = sample_rate
+        self.binary = binary
+        self.inf_rate = inf_rate
+        self.noise = noise
+        self.frame_samples = frame_samples
+        self.random = random.Random(seed)
+        self.is_open = True
+        self._out = bytearray()
+        self._cmd = bytearray()
+        self._cond = threading.Condition()
+        self._stream = None
+        self._stop_event = threading.Event()
+        self._seq = 0
+
+    # ==== PHÍA HOST ====
+    @property
+    def in_waiting(self):
+        return len(self._out)
+
+    def write(self, data):
+        self._check_open()
+        self._cmd += data
+        while True:
+            if self._cmd[:1] == STOP_BYTE:
+                del self._cmd[:1]
+                self._stop_stream()
+                continue
+            match = COMMAND_RE.search(self._cmd.decode(errors='ignore'))
+            if match is None:
+                break
+            del self._cmd[:match.end()]
+            self._handle_command(*[int(g) for g in match.groups()])
+        return len(data)
+
+    def read(self, size=1):
+        self._check_open()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            while len(self._out) < size and self.is_open:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            data = bytes(self._out[:size])
+            del self._out[:size]
+        return data
+
+    def readline(self):
+        self._check_open()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            while b"\n" not in self._out and self.is_open:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            cut = self._out.find(b"\n") + 1 or len(self._out)
+            data = bytes(self._out[:cut])
+            del self._out[:cut]
+        return data
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._out.clear()
+
+    def close(self):
+        self._stop_stream()
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+
+    def _check_open(self):
+        if not self.is_open:
+            raise OSError(f"{self.port} đã đóng")
+
+    # ==== PHÍA THIẾT BỊ ====
+    def _emit(self, data):
+        with self._cond:
+            self._out += data
+            self._cond.notify_all()
+
+    def generate(self, command):
+        # Toàn bộ mẫu (tuple, None = inf) mà thiết bị sẽ gửi cho một lệnh; [] nếu không nhận ra lệnh
+        match = COMMAND_RE.search(command)
+        if match is None:
+            return []
+        code, a, b, c, d, e = [int(g) for g in match.groups()]
+        generators = {
+            1: self._cv_samples,
+            2: self._eis_2e_samples,
+            3: self._eis_3e_samples,
+            4: self._swv_samples,
+            5: self._ca_samples,
+            7: self._dpv_samples,
+        }
+        if code not in generators:
+            return []
+        return generators[code](a, b, c, d, e)
+
+    def _handle_command(self, code, a, b, c, d, e):
+        samples = self.generate(acquisition.format_command(code, a, b, c, d, e))
+        if not samples:
+            return
+        self._stop_stream()
+        self._stop_event = threading.Event()
+        self._stream = threading.Thread(target=self._run_stream, args=(code, samples, self._stop_event), daemon=True)
+        self._stream.start()
+
+    def _stop_stream(self):
+        self._stop_event.set()
+        if self._stream is not None and self._stream is not threading.current_thread():
+            self._stream.join()
+        self._stream = None
+
+    def _run_stream(self, code, samples, stop_event):
+        batch = max(1, self.frame_samples)
+        start = time.monotonic()
+        sent = 0
+        while sent < len(samples) and not stop_event.is_set() and self.is_open:
+            if self.sample_rate:
+                due = min(len(samples), int((time.monotonic() - start) * self.sample_rate) + 1)
+                if due <= sent:
+                    time.sleep(min(0.01, (sent + 1) / self.sample_rate - (time.monotonic() - start)))
+                    continue
+            else:
+                due = len(samples)
+            end = min(due, sent + batch)
+            self._emit(self._encode(code, samples[sent:end]))
+            sent = end
+        if not stop_event.is_set():
+            self._emit(f"{acquisition.END_MARKER}\r\n".encode())
+
+    def _encode(self, code, samples):
+        if self.binary:
+            values = [tuple(math.inf if v is None else v for v in s) for s in samples]
+            frame = acquisition.encode_frame(code, values, seq=self._seq)
+            self._seq = (self._seq + 1) & 0xFFFF
+            return frame
+        return ("\r\n".join(format_lines(samples)) + "\r\n").encode()
+
+    # ==== TẠO DỮ LIỆU THEO KỸ THUẬT ====
+    # Trường None được gửi thành "inf"
+    def _noisy(self, value, scale):
+        return value + self.random.gauss(0, self.noise * scale)
+
+    def _maybe_inf(self):
+        return self.random.random() < self.inf_rate
+
+    def _dpv_samples(self, s_vol, e_vol, step, amp, width):
+        samples = []
+        center = (s_vol + e_vol) / 2
+        for k in range(acquisition.dpv_num_samples(s_vol, e_vol, step)):
+            v = s_vol + k * step
+            i = 0.002 * v + 5.0 * math.exp(-((v - center) / 60.0) ** 2) * amp / 50
+            samples.append((v, None if self._maybe_inf() else round(self._noisy(i, 5.0), 5)))
+        return samples
+
+    def _swv_samples(self, dev_s_vol, dev_e_vol, step, amp, freq):
+        samples = []
+        center = (dev_s_vol + dev_e_vol) / 2
+        for k in range(((dev_e_vol - dev_s_vol) // step)):
+            v = dev_s_vol + k * step
+            peak = 4.0 * math.exp(-((v - center) / 50.0) ** 2)
+            base = 0.001 * v
+            i_f = self._noisy(base + peak, 4.0)
+            i_b = self._noisy(base - 0.3 * peak, 4.0)
+            samples.append((2 * k, None if self._maybe_inf() else round(i_f, 5)))
+            samples.append((2 * k + 1, None if self._maybe_inf() else round(i_b, 5)))
+        return samples
+
+    def _cv_samples(self, neg_e_vol, neg_s_vol, num_step, repeat_times, _):
+        # Sinh theo thứ tự thời gian rồi đảo từng nửa chu kỳ giống firmware
+        s_vol, e_vol = -neg_s_vol, -neg_e_vol
+        half = num_step // 2
+        e0 = (s_vol + e_vol) / 2
+        ordered = []
+        for i in range(num_step * repeat_times):
+            k = i % num_step
+            v = s_vol + (e_vol - s_vol) * min(k, num_step - 1 - k) / max(half - 1, 1)
+            sign = 1 if k < half else -1
+            i_ua = sign * (300.0 + 1500.0 * math.exp(-((v - e0 - sign * 30) / 80.0) ** 2)) + 0.5 * v
+            ordered.append(self._noisy(i_ua, 1500.0) / acquisition.CV_CURRENT_SCALE)
+        samples = []
+        for i in range(len(ordered)):
+            seg, pos = divmod(i, half)
+            value = ordered[seg * half + (half - 1 - pos)]
+            samples.append((i + 1, None if self._maybe_inf() else round(value, 8)))
+        return samples
+
+    def _ca_samples(self, t_run, e_vol, t_int, _, __):
+        samples = []
+        for k in range(1, acquisition.ca_max_points(t_run, t_int) + 1):
+            t = k * t_int / 1000
+            i = 50.0 / math.sqrt(t) + 2.0 + 0.001 * e_vol
+            samples.append((round(t, 3), None if self._maybe_inf() else round(self._noisy(i, 2.0), 4)))
+        return samples
+
+    def _eis_frequencies(self, start, stop, points, log):
+        if points < 2:
+            return [float(start)] * max(points, 1)
+        if log:
+            ratio = (stop / start) ** (1 / (points - 1))
+            return [start * ratio ** k for k in range(points)]
+        return [start + (stop - start) * k / (points - 1) for k in range(points)]
+
+    def _randles(self, freq):
+        omega = 2 * math.pi * freq
+        z = RANDLES_RS + RANDLES_RCT / (1 + 1j * omega * RANDLES_RCT * RANDLES_CDL)
+        return complex(self._noisy(z.real, abs(z)), self._noisy(z.imag, abs(z)))
+
+    def _eis_3e_samples(self, start, stop, points, repeats, _):
+        samples = []
+        for _ in range(repeats):
+            for f in self._eis_frequencies(start, stop, points, False):
+                z = self._randles(f)
+                if self._maybe_inf():
+                    samples.append((round(f, 3), None, None))
+                else:
+                    samples.append((round(f, 3), round(z.real, 3), round(z.imag, 3)))
+        return samples
+
+    def _eis_2e_samples(self, start, stop, points, repeats, log):
+        samples = []
+        for _ in range(repeats):
+            for f in self._eis_frequencies(start, stop, points, log == 1):
+                z = self._randles(f)
+                if self._maybe_inf():
+                    samples.append((round(f, 3), None, 0.0))
+                else:
+                    samples.append((round(f, 3), round(abs(z), 3), round(-math.degrees(math.atan2(z.imag, z.real)), 3)))
+        return samples
+
+
+def format_lines(samples):
+    # Mẫu -> dòng văn bản "a;b;c" đúng như firmware gửi
+    return [";".join("inf" if v is None else _format(v) for v in s) for s in samples]
+
+
+def _format(value):
+    if isinstance(value, int):
+        return str(value)
+    return repr(round(value, 8))
+
+
+def serial_factory(**options):
+    # Dùng làm serial_factory cho connection.SerialManager
+    def factory(port, baudrate=115200, timeout=1):
+        return SimulatedPotentiostat(port, baudrate, timeout, **options)
+    return factory
+
+
+# ==== PTY: cho chương trình khác (hoặc main1.py trên Linux/macOS) mở như cổng thật ====
+def serve_pty(device, poll=0.005):
+    import select
+    import tty
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    print("Cổng giả lập:", os.ttyname(slave), flush=True)
+    device.timeout = 0
+    try:
+        while True:
+            readable, _, _ = select.select([master], [], [], poll)
+            if readable:
+                device.write(os.read(master, 4096))
+            waiting = device.in_waiting
+            if waiting:
+                os.write(master, device.read(waiting))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        device.close()
+        os.close(master)
+        os.close(slave)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thiết bị đo điện hóa giả lập qua pty")
+    parser.add_argument("--rate", type=float, default=1000.0, help="số mẫu/giây, 0 = không giới hạn")
+    parser.add_argument("--binary", action="store_true", help="gửi mẫu dạng khung nhị phân")
+    parser.add_argument("--inf-rate", type=float, default=0.005, help="xác suất một mẫu là inf")
+    parser.add_argument("--noise", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    device = SimulatedPotentiostat(sample_rate=args.rate, binary=args.binary,
+                                   inf_rate=args.inf_rate, noise=args.noise, seed=args.seed)
+    serve_pty(device)
+
+
+if __name__ == "__main__":
+    main()
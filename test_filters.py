@@ -0,0 +1,45 @@
+# Lọc theo luồng (từng chunk) phải cho đúng kết quả như lọc causal cả khối,
+# kể cả khi chunk đầu ngắn hơn cửa sổ (lịch sử chưa đủ window - 1 mẫu).
+import numpy as np
+import pytest
+
+import filters
+
+CHUNKINGS = [(3, 7), (1, 1, 2, 20), (2, 30), (4, 4, 4)]
+CASES = [
+    ("median", {"window": 5}),
+    ("hampel", {"window": 7}),
+    ("savgol", {"window": 11, "polyorder": 3}),
+    ("moving_average", {"window": 3}),
+    ("moving_average", {"window": 5}),
+    ("moving_average", {"window": 8, "ndigits": 3}),
+]
+
+
+def signal(n=40):
+    rng = np.random.default_rng(7)
+    return np.round(np.sin(np.arange(n) / 3) * 10 + rng.normal(size=n), 3)
+
+
+def streamed(filt, data, sizes):
+    stream = filt.stream()
+    start = 0
+    for size in sizes:
+        stream.extend(data[start:start + size])
+        start += size
+    stream.extend(data[start:])
+    return np.asarray(stream.output)
+
+
+@pytest.mark.parametrize("name,params", CASES)
+@pytest.mark.parametrize("sizes", CHUNKINGS)
+def test_stream_matches_causal(name, params, sizes):
+    filt = filters.make_filter(name, **params)
+    data = signal()
+    np.testing.assert_allclose(streamed(filt, data, sizes), filt.causal(data), rtol=1e-12, atol=1e-12)
+
+
+def test_median_short_first_chunk():
+    filt = filters.make_filter("median", window=5)
+    data = np.array([5, 1, 9, 2, 8, 7, 3, 6, 4, 10], dtype=np.float64)
+    np.testing.assert_array_equal(streamed(filt, data, (3,)), filt.causal(data))